@@ -0,0 +1,68 @@
+import os
+import time
+
+# Durata massima di una voce in cache: limita quanto può restare obsoleta una cache di un altro processo
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", 60))
+
+# Tutte le cache del processo, per nome (usato dal monitoraggio)
+caches = {}
+
+
+class VersionedCache:
+    """
+    Cache in memoria invalidata da un contatore di versione.
+
+    Le scritture sulla collection chiamano bump(); una voce è valida solo se è stata calcolata
+    con la versione corrente. Chi popola la cache legge la versione prima di interrogare il
+    database e la passa a set(): se nel frattempo c'è stato un bump, il valore non viene salvato.
+    """
+
+    def __init__(self, name: str, ttl: float = CACHE_TTL_SECONDS):
+        self.name = name
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        # Funzione chiamata prima di ogni lettura, può invalidare la cache (vedi app.snapshot)
+        self.refresh = None
+        caches[name] = self
+
+    def bump(self):
+        """
+        Invalida tutte le voci della cache.
+        """
+        self.version += 1
+        self._entries.clear()
+
+    def get(self, key: str = ""):
+        if self.refresh is not None:
+            self.refresh()
+        entry = self._entries.get(key)
+        if entry is not None:
+            version, expires_at, value = entry
+            if version == self.version and expires_at > time.monotonic():
+                self.hits += 1
+                return value
+            self._entries.pop(key, None)
+        self.misses += 1
+        return None
+
+    def set(self, value, version: int, key: str = ""):
+        """
+        Salva il valore calcolato a partire dalla versione version, se è ancora quella corrente.
+        """
+        if version == self.version:
+            self._entries[key] = (version, time.monotonic() + self.ttl, value)
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+faq_cache = VersionedCache("faq")
+settings_cache = VersionedCache("settings")
@@ -1,3 +1,5 @@
+import asyncio
+import importlib.util
 import os
 import regex
 
@@ -18,6 +20,55 @@ else:
 
 
 
+# Parametri del pool di connessioni di Motor
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 10))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 300000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000))
+# Compressori del protocollo in ordine di preferenza; quelli senza libreria installata vengono ignorati
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zstd,snappy,zlib")
+
+# Modulo Python richiesto da ciascun compressore (zlib fa parte della libreria standard)
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+
+def get_available_compressors(compressors: str = MONGO_COMPRESSORS):
+    """
+    Restituisce i compressori richiesti per cui è installata la libreria necessaria.
+    """
+    available = []
+    for name in (c.strip() for c in compressors.split(",")):
+        module = COMPRESSOR_MODULES.get(name)
+        if module and importlib.util.find_spec(module) is not None:
+            available.append(name)
+    return available
+
+
+def get_client_options(event_listeners=()):
+    """
+    Restituisce le opzioni di AsyncIOMotorClient: pool di connessioni e compressione.
+    """
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "event_listeners": list(event_listeners),
+    }
+    compressors = get_available_compressors()
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return options
+
+
+async def prewarm_pool(client, connections: int = MONGO_MIN_POOL_SIZE):
+    """
+    Apre in anticipo connections connessioni con ping concorrenti, così le prime richieste non aspettano l'handshake.
+    """
+    if connections > 0:
+        await asyncio.gather(*(client.admin.command("ping") for _ in range(connections)))
+
+
 # Variabile globale per memorizzare la connessione al database
 _db = None
 
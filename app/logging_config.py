@@ -0,0 +1,160 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+# Livello di log predefinito
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Livelli dei singoli logger, es. "app.routes=DEBUG,pymongo=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+
+# Header con cui il client (o il proxy) può indicare l'id della richiesta
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID_REGEX = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+
+# Id della richiesta in corso, aggiunto a ogni riga di log
+request_id_var = ContextVar("request_id", default=None)
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Aggiunge al record l'id della richiesta in corso; va eseguito nel thread che produce il log.
+    """
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """
+    Accoda i record senza formattarli: il messaggio viene risolto subito (gli argomenti potrebbero cambiare),
+    il traceback viene salvato a parte per il formatter JSON.
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formatta ogni record come una riga JSON.
+    """
+
+    def format(self, record):
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def parse_log_levels(levels: str = LOG_LEVELS):
+    """
+    Legge i livelli dei logger nel formato "nome=LIVELLO,nome=LIVELLO".
+    """
+    result = {}
+    for item in levels.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            result[name.strip()] = level.strip().upper()
+    return result
+
+
+def setup_logging(stream=None):
+    """
+    Configura il logging: i log vengono accodati e scritti in JSON da un thread separato,
+    così le scritture su stdout non bloccano l'event loop.
+
+    Returns:
+        QueueListener: Il listener già avviato, da fermare con shutdown_logging allo spegnimento.
+    """
+    log_queue = queue.SimpleQueue()
+    queue_handler = LogQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    output_handler = logging.StreamHandler(stream or sys.stdout)
+    output_handler.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, LogQueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+    for name, level in parse_log_levels().items():
+        logging.getLogger(name).setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, output_handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def shutdown_logging(listener):
+    """
+    Rimuove l'handler della coda dal logger root e ferma il listener dopo aver scritto i log rimasti.
+    Può essere chiamata più volte.
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, LogQueueHandler):
+            root.removeHandler(handler)
+    # stop() su un listener già fermo solleva un'eccezione
+    if listener._thread is not None:
+        listener.stop()
+
+
+class RequestIdMiddleware:
+    """
+    Middleware ASGI che assegna un id a ogni richiesta (o usa quello ricevuto) e lo restituisce nell'header X-Request-ID.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")
+                break
+        if not request_id or not REQUEST_ID_REGEX.match(request_id):
+            request_id = uuid.uuid4().hex
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (REQUEST_ID_HEADER.lower().encode("latin-1"), request_id.encode("latin-1")),
+                ]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
@@ -1,53 +1,114 @@
+import asyncio
+import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
-from logging import info
 
 import os
 from dotenv import load_dotenv
 
-from app.database import init_db, get_db, MONGODB_URL
+from app.database import init_db, get_db, get_client_options, prewarm_pool, MONGODB_URL
 
-from app.routes import auth, chat, document, user, faq, setting
+from app.routes import auth, chat, document, user, faq, setting, monitoring
 from app.repositories.user_repository import UserRepository
+from app.repositories.password_reset_repository import PasswordResetRepository
+from app.repositories.document_repository import DocumentRepository
+from app.repositories.document_file_repository import DocumentFileRepository
+from app.repositories.faq_repository import FaqRepository
+from app.repositories.sync_repository import SyncRepository
+from app.repositories.setting_repository import SettingRepository
+from app.snapshot import publish_snapshot, refresh_snapshot
+from app.metrics import MetricsMiddleware, command_metrics
+from app.responses import FastJSONResponse
+from app.logging_config import REQUEST_ID_HEADER, RequestIdMiddleware, setup_logging, shutdown_logging
+from app.service.announcement_service import resume_announcements
+from app.service.activity_tracker import activity_tracker
+from app.service.document_file_cleanup import run_document_file_cleanup
+from app.service.invalidation_bus import invalidation_bus
+from app.service.pool_monitor import pool_monitor
+from app.service.slow_query_monitor import slow_query_monitor
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 async def lifespan(app: FastAPI):
     # Startup
-    app.mongodb_client = AsyncIOMotorClient(MONGODB_URL + "/supplai?authSource=admin")
+    # I log vengono scritti in JSON da un thread separato (vedi app.logging_config)
+    log_listener = setup_logging()
+    app.mongodb_client = AsyncIOMotorClient(
+        MONGODB_URL + "/supplai?authSource=admin",
+        **get_client_options(event_listeners=[pool_monitor, command_metrics, slow_query_monitor]),
+    )
     app.database = app.mongodb_client.get_default_database()
+    # Apre le connessioni minime del pool prima di accettare richieste
+    await prewarm_pool(app.mongodb_client)
     
-    info("Connected to the MongoDB database!")
+    logger.info("Connected to the MongoDB database!")
     init_db(app.database)
 
     user_repo = UserRepository(app.database)
+    await user_repo.ensure_indexes()
+    await PasswordResetRepository(app.database).ensure_indexes()
+    await DocumentRepository(app.database).ensure_indexes()
+    await DocumentFileRepository(app.database).ensure_indexes()
+    await SyncRepository(app.database).ensure_indexes()
+    await FaqRepository(app.database).ensure_indexes()
+    await SettingRepository(app.database).seed_defaults()
+    # Pubblica impostazioni e FAQ per tutti i worker
+    await publish_snapshot(app.database)
     if os.getenv("ENVIRONMENT") == "development":
         # AGGIUNGI UTENTE TEST (Solo in sviluppo)
         test_user = await user_repo.get_test_user()
         if not test_user:
             await user_repo.add_test_user()
-            print("Utente test aggiunto con successo")
+            logger.info("Utente test aggiunto con successo")
         else:
-            print("Utente test già presente nel database")
+            logger.info("Utente test già presente nel database")
     
     if (not os.getenv("ADMIN_EMAIL")) or (not os.getenv("ADMIN_PASSWORD")):
-        print("ADMIN_EMAIL e ADMIN_PASSWORD non sono stati definiti in .env")
-        print("Defalt admin user:", os.getenv("ADMIN_EMAIL") or "admin@test.it")
-        print("Defalt admin password:", os.getenv("ADMIN_PASSWORD") or "adminadmin")
+        logger.warning(
+            "ADMIN_EMAIL e ADMIN_PASSWORD non sono stati definiti in .env: vengono usate le credenziali admin predefinite"
+        )
 
     admin_user = await user_repo.get_by_email(os.getenv("ADMIN_EMAIL") or "admin@test.it")
     if not admin_user:
         await user_repo.add_test_admin()
-        print("Utente admin aggiunto con successo")
+        logger.info("Utente admin aggiunto con successo")
     else:
-        print("Utente admin già presente nel database")
-        
+        logger.info("Utente admin già presente nel database")
+
+    # Riprende gli invii di annunci interrotti da un riavvio
+    await resume_announcements(app.database)
+
+    # Scrittura periodica di last_login / last_active degli utenti
+    activity_task = asyncio.create_task(activity_tracker.run(user_repo.collection))
+
+    # Invalidazione delle cache locali quando un altro processo modifica i dati
+    invalidation_task = asyncio.create_task(invalidation_bus.run(app.database))
+
+    # Registro delle operazioni lente (explain e scrittura fuori dal percorso delle richieste)
+    slow_query_task = asyncio.create_task(slow_query_monitor.run(app.database))
+
+    # Eliminazione dei file GridFS non più usati da nessun documento
+    file_cleanup_task = asyncio.create_task(run_document_file_cleanup(app.database))
+
+    # Ripubblicazione periodica della snapshot condivisa (raccoglie le modifiche degli altri nodi)
+    snapshot_task = asyncio.create_task(refresh_snapshot(app.database))
+
     yield
 
     # Shutdown
+    for task in (activity_task, invalidation_task, slow_query_task, file_cleanup_task, snapshot_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
     app.mongodb_client.close()
-    info("Disconnected from the MongoDB database")
+    logger.info("Disconnected from the MongoDB database")
+    # Scrive i log ancora in coda
+    shutdown_logging(log_listener)
 
 
 app = FastAPI(
@@ -55,6 +116,7 @@ app = FastAPI(
     title="Database-AI API",
     description="API for the Suppl-AI project",
     version="0.2",
+    default_response_class=FastJSONResponse,
 )
 
 origins = [
@@ -71,7 +133,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Content-Range", "Accept-Ranges", "ETag", REQUEST_ID_HEADER],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)
 
 app.include_router(auth.router)
 app.include_router(chat.router)
@@ -79,3 +144,5 @@ app.include_router(document.router)
 app.include_router(user.router)
 app.include_router(faq.router)
 app.include_router(setting.router)
+app.include_router(monitoring.router)
+app.include_router(monitoring.metrics_router)
@@ -0,0 +1,148 @@
+import time
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.metrics_core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+from pymongo import monitoring
+
+from app.cache import caches
+from app.service.pool_monitor import pool_monitor
+
+# Etichetta delle richieste che non corrispondono a nessuna rotta (evita una serie per ogni URL sconosciuto)
+UNMATCHED_ROUTE = "unmatched"
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Durata delle richieste HTTP per rotta",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "Richieste HTTP in corso per metodo",
+    ["method"],
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongo_command_duration_seconds",
+    "Durata dei comandi MongoDB per collection e comando",
+    ["collection", "command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongo_command_failures",
+    "Comandi MongoDB falliti per collection e comando",
+    ["collection", "command"],
+)
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI che misura durata e richieste in corso per ciascuna rotta.
+
+    Le metriche usano il modello della rotta (es. /documents/{id}) e non il percorso effettivo,
+    così il numero di serie resta limitato. La rotta è quella trovata dal router, che la salva
+    nello scope: il middleware non ripete la ricerca. Le richieste in corso sono contate per metodo,
+    perché all'arrivo della richiesta la rotta non è ancora nota.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            REQUEST_LATENCY.labels(method, route, str(status)).observe(time.perf_counter() - start)
+            in_progress.dec()
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Registra la durata di ogni comando inviato a MongoDB, per collection e comando.
+    """
+
+    def __init__(self):
+        # Collection dei comandi in corso, per (connessione, request_id): gli eventi di fine non la riportano
+        self._collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            # getMore indica la collection in un campo a parte; i comandi di amministrazione non ne hanno
+            collection = event.command.get("collection", "")
+        self._collections[(event.connection_id, event.request_id)] = collection
+
+    def succeeded(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        MONGO_COMMAND_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        MONGO_COMMAND_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILURES.labels(collection, event.command_name).inc()
+
+
+class StatsCollector:
+    """
+    Espone le statistiche del pool di connessioni e delle cache, lette solo al momento dello scrape.
+    """
+
+    def collect(self):
+        pool = pool_monitor.stats()
+        yield GaugeMetricFamily("mongo_pool_checked_out", "Connessioni MongoDB in uso", value=pool["checked_out"])
+        yield GaugeMetricFamily(
+            "mongo_pool_open_connections", "Connessioni MongoDB aperte", value=pool["open_connections"]
+        )
+        yield CounterMetricFamily("mongo_pool_checkouts", "Connessioni ottenute dal pool", value=pool["checkouts"])
+        failures = CounterMetricFamily(
+            "mongo_pool_checkout_failures", "Richieste di connessione fallite", labels=["reason"]
+        )
+        for reason, count in pool["checkout_failures"].items():
+            failures.add_metric([str(reason)], count)
+        yield failures
+
+        buckets, cumulative = [], 0
+        for bucket, count in pool["wait_histogram_ms"].items():
+            cumulative += count
+            buckets.append((bucket if bucket == "+Inf" else str(float(bucket) / 1000), cumulative))
+        yield HistogramMetricFamily(
+            "mongo_pool_wait_seconds",
+            "Attesa per ottenere una connessione dal pool",
+            buckets=buckets,
+            sum_value=pool["total_wait_ms"] / 1000,
+        )
+
+        hits = CounterMetricFamily("cache_hits", "Letture servite dalla cache", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Letture non servite dalla cache", labels=["cache"])
+        ratio = GaugeMetricFamily("cache_hit_ratio", "Frazione di letture servite dalla cache", labels=["cache"])
+        entries = GaugeMetricFamily("cache_entries", "Voci presenti in cache", labels=["cache"])
+        for name, cache in caches.items():
+            stats = cache.stats()
+            lookups = stats["hits"] + stats["misses"]
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            ratio.add_metric([name], stats["hits"] / lookups if lookups else 0.0)
+            entries.add_metric([name], stats["entries"])
+        yield hits
+        yield misses
+        yield ratio
+        yield entries
+
+
+command_metrics = CommandMetrics()
+REGISTRY.register(StatsCollector())
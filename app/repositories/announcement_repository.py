@@ -0,0 +1,142 @@
+from bson import ObjectId
+from datetime import datetime, timedelta
+from fastapi import Depends
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+from app.database import get_db
+from app.utils import get_timezone
+import app.schemas as schemas
+
+
+class AnnouncementRepository:
+    """
+    Repository degli invii massivi di email (annunci) a tutti gli utenti.
+
+    Ogni annuncio tiene traccia dell'ultimo destinatario servito, così che un invio
+    interrotto possa riprendere dal punto in cui si era fermato.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.collection = database.get_collection("announcements")
+
+    async def create_announcement(
+        self, announcement: schemas.Announcement, author_email: str
+    ):
+        """
+        Registra un nuovo annuncio in stato "pending" e ne restituisce l'ID.
+        """
+        now = datetime.now(get_timezone()).isoformat()
+        result = await self.collection.insert_one(
+            {
+                "subject": announcement.subject,
+                "body": announcement.body,
+                "bcc": announcement.bcc,
+                "status": "pending",
+                "sent_count": 0,
+                "last_recipient": None,
+                "lease_expires_at": None,
+                "created_by": author_email,
+                "created_at": now,
+                "updated_at": now,
+                "error": None,
+            }
+        )
+        return result.inserted_id
+
+    async def get_announcement(self, announcement_id: ObjectId):
+        return await self.collection.find_one({"_id": announcement_id})
+
+    async def get_unfinished_announcements(self):
+        """
+        Restituisce gli ID degli annunci non ancora completati.
+        """
+        cursor = self.collection.find(
+            {"status": {"$in": ["pending", "running"]}}, {"_id": 1}
+        )
+        return [announcement["_id"] async for announcement in cursor]
+
+    async def claim_announcement(self, announcement_id: ObjectId, lease_seconds: int):
+        """
+        Acquisisce in modo atomico l'invio di un annuncio.
+
+        L'annuncio viene preso in carico solo se è in attesa o se il lease di chi lo
+        stava inviando è scaduto (ad esempio dopo un crash del processo).
+        Restituisce il documento aggiornato, oppure None se un altro processo lo sta già inviando.
+        """
+        now = datetime.now(get_timezone())
+        return await self.collection.find_one_and_update(
+            {
+                "_id": announcement_id,
+                "$or": [
+                    {"status": "pending"},
+                    {"status": "running", "lease_expires_at": {"$lt": now}},
+                ],
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                    "updated_at": now.isoformat(),
+                }
+            },
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def record_progress(
+        self, announcement_id: ObjectId, last_recipient: str, sent: int, lease_seconds: int
+    ):
+        """
+        Salva l'ultimo destinatario servito e rinnova il lease dell'invio.
+        """
+        now = datetime.now(get_timezone())
+        return await self.collection.update_one(
+            {"_id": announcement_id},
+            {
+                "$set": {
+                    "last_recipient": last_recipient,
+                    "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                    "updated_at": now.isoformat(),
+                },
+                "$inc": {"sent_count": sent},
+            },
+        )
+
+    async def finish_announcement(self, announcement_id: ObjectId, error: str = None):
+        """
+        Chiude l'invio dell'annuncio come completato o, se è presente un errore, come fallito.
+        """
+        return await self.collection.update_one(
+            {"_id": announcement_id},
+            {
+                "$set": {
+                    "status": "failed" if error else "completed",
+                    "lease_expires_at": None,
+                    "updated_at": datetime.now(get_timezone()).isoformat(),
+                    "error": error,
+                }
+            },
+        )
+
+    async def reset_announcement(self, announcement_id: ObjectId):
+        """
+        Rimette in coda un annuncio fallito, mantenendo il punto di ripresa.
+        """
+        return await self.collection.update_one(
+            {"_id": announcement_id, "status": "failed"},
+            {
+                "$set": {
+                    "status": "pending",
+                    "updated_at": datetime.now(get_timezone()).isoformat(),
+                    "error": None,
+                }
+            },
+        )
+
+
+def get_announcement_repository(db: AsyncIOMotorDatabase = Depends(get_db)):
+    """
+    Restituisce il repository della collection announcements.
+    """
+    return AnnouncementRepository(db)
@@ -1,3 +1,4 @@
+import logging
 from bson import ObjectId
 from datetime import datetime, time
 from typing import Optional
@@ -8,6 +9,8 @@ import app.schemas as schemas
 from app.database import get_db
 from fastapi import Depends
 
+logger = logging.getLogger(__name__)
+
 
 class ChatRepository:
     def __init__(self, database):
@@ -118,7 +121,7 @@ class ChatRepository:
                 dt_end_str = dt_end.replace(hour=23, minute=59, second=59, microsecond=999999).isoformat() + "+02:00"
                 query["created_at"]["$lte"] = dt_end_str
 
-        print("Query finale:", query)
+        logger.debug("Query finale: %s", query)
 
         chats = await self.collection.find(query).to_list(length=10000)
 
@@ -0,0 +1,148 @@
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from fastapi import Depends
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorGridFSBucket
+
+from app.database import get_db
+
+# Bucket GridFS che contiene il contenuto dei documenti
+DOCUMENT_FILES_BUCKET = "document_files"
+# Un file non più collegato a nessun documento viene eliminato solo dopo questo tempo dall'ultimo caricamento:
+# un caricamento in corso potrebbe averlo appena deduplicato senza averlo ancora collegato al documento
+DOCUMENT_FILES_ORPHAN_GRACE_SECONDS = int(os.getenv("DOCUMENT_FILES_ORPHAN_GRACE_SECONDS", 3600))
+# Numero di file controllati con una sola query sulla collection documents
+DOCUMENT_FILES_CLEANUP_BATCH_SIZE = 500
+
+
+class DocumentFileRepository:
+    """
+    Repository del contenuto dei documenti, salvato su GridFS a blocchi.
+
+    Il contenuto viene deduplicato tramite l'hash SHA-256, calcolato durante il caricamento:
+    file identici vengono salvati una volta sola. Più documenti possono quindi condividere un file,
+    che viene eliminato da delete_orphans solo quando nessun documento lo usa più.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.files = database.get_collection(f"{DOCUMENT_FILES_BUCKET}.files")
+        self._bucket = None
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            self._bucket = AsyncIOMotorGridFSBucket(
+                self.database, bucket_name=DOCUMENT_FILES_BUCKET
+            )
+        return self._bucket
+
+    async def ensure_indexes(self):
+        await self.files.create_index("sha256")
+
+    async def upload(self, filename: str, chunks, content_type: str):
+        """
+        Salva su GridFS il contenuto letto dall'iteratore asincrono chunks, un blocco alla volta.
+
+        Se esiste già un file con lo stesso SHA-256, i blocchi appena scritti vengono scartati
+        e viene restituito il file esistente.
+
+        Returns:
+            dict: file_id, sha256, length e deduplicated (True se il contenuto era già presente).
+        """
+        grid_in = self.bucket.open_upload_stream(
+            filename, metadata={"content_type": content_type}
+        )
+        digest = hashlib.sha256()
+        length = 0
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                digest.update(chunk)
+                length += len(chunk)
+                await grid_in.write(chunk)
+
+            sha256 = digest.hexdigest()
+            now = datetime.now(timezone.utc)
+            # last_used_at protegge il file dalla pulizia degli orfani finché non viene collegato al documento
+            existing = await self.files.find_one_and_update(
+                {"sha256": sha256},
+                {"$set": {"last_used_at": now}},
+                projection={"_id": 1, "length": 1},
+            )
+            if existing:
+                await grid_in.abort()
+                return {
+                    "file_id": existing["_id"],
+                    "sha256": sha256,
+                    "length": existing.get("length", length),
+                    "deduplicated": True,
+                }
+
+            await grid_in.set("sha256", sha256)
+            await grid_in.set("last_used_at", now)
+            await grid_in.close()
+        except BaseException:
+            if not grid_in.closed:
+                await grid_in.abort()
+            raise
+
+        return {
+            "file_id": grid_in._id,
+            "sha256": sha256,
+            "length": length,
+            "deduplicated": False,
+        }
+
+    async def open_download(self, file_id: ObjectId):
+        """
+        Apre il file in lettura senza caricarlo in memoria.
+        Raises:
+            NoFile: Se il file non esiste.
+        """
+        return await self.bucket.open_download_stream(file_id)
+
+    async def delete_orphans(self):
+        """
+        Elimina i file non collegati a nessun documento (contenuto sostituito o documento eliminato)
+        e non caricati negli ultimi DOCUMENT_FILES_ORPHAN_GRACE_SECONDS secondi.
+        Returns:
+            int: Il numero di file eliminati.
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=DOCUMENT_FILES_ORPHAN_GRACE_SECONDS)
+        candidates = await self.files.find(
+            {
+                "$or": [
+                    {"last_used_at": {"$lt": cutoff}},
+                    # File caricati prima dell'introduzione di last_used_at
+                    {"last_used_at": {"$exists": False}, "uploadDate": {"$lt": cutoff}},
+                ]
+            },
+            {"_id": 1},
+        ).to_list(length=None)
+
+        documents = self.database.get_collection("documents")
+        deleted = 0
+        for i in range(0, len(candidates), DOCUMENT_FILES_CLEANUP_BATCH_SIZE):
+            file_ids = [file["_id"] for file in candidates[i : i + DOCUMENT_FILES_CLEANUP_BATCH_SIZE]]
+            referenced = set(await documents.distinct("file_id", {"file_id": {"$in": file_ids}}))
+            for file_id in file_ids:
+                if file_id in referenced:
+                    continue
+                try:
+                    await self.bucket.delete(file_id)
+                    deleted += 1
+                except NoFile:
+                    # Già eliminato da un altro processo
+                    pass
+        return deleted
+
+
+def get_document_file_repository(db: AsyncIOMotorDatabase = Depends(get_db)):
+    """
+    Restituisce il repository del contenuto dei documenti.
+    """
+    return DocumentFileRepository(db)
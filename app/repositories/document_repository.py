@@ -1,54 +1,460 @@
-from pymongo.errors import DuplicateKeyError
-from datetime import datetime
+import logging
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from datetime import datetime, time, timedelta, timezone
 from pydantic import EmailStr
 from bson import ObjectId
+from bson.errors import InvalidId
+from typing import List
+from pymongo import ReturnDocument, UpdateOne
+import base64
+import os
+import re
 
 from app.utils import get_timezone, get_object_id
 import app.schemas as schemas
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from fastapi import Depends
 from app.database import get_db
+from app.repositories.sync_repository import SyncRepository, SYNC_CHANGES_MAX_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# Numero massimo di documenti restituiti da una pagina
+DOCUMENTS_MAX_LIMIT = 500
+
+# Durata predefinita del lease di ingestione: scaduto il lease, il documento torna disponibile
+INGESTION_LEASE_SECONDS = int(os.getenv("INGESTION_LEASE_SECONDS", 600))
+# Dopo questo numero di tentativi falliti il documento passa nello stato failed
+INGESTION_MAX_ATTEMPTS = int(os.getenv("INGESTION_MAX_ATTEMPTS", 5))
+
+# Numero di documenti aggiornati per bulk_write durante la conversione di uploaded_at in UTC
+UPLOADED_AT_MIGRATION_BATCH_SIZE = 1000
+# Forma di uploaded_at salvata: ISO in UTC con microsecondi, così l'ordine delle stringhe è quello temporale
+UPLOADED_AT_UTC_PATTERN = r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{6}\+00:00$"
+
+
+def to_utc_isoformat(value) -> str:
+    """
+    Converte una data (datetime o stringa ISO con fuso orario) nella forma salvata in uploaded_at.
+
+    Con fusi orari diversi (es. +01:00 e +02:00 prima e dopo il cambio dell'ora legale) l'ordine
+    delle stringhe non coincide con quello temporale: in UTC e a lunghezza fissa sì.
+    Raises:
+        ValueError: Se la stringa non è una data ISO con fuso orario.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        raise ValueError(f"Date without timezone: {value}")
+    return value.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
 
 class DocumentRepository:
     def __init__(self, database):
         self.database = database
         self.collection = database.get_collection("documents")
+        self.sync = SyncRepository(database)
+
+    async def ensure_indexes(self):
+        """
+        Crea gli indici usati dalla lista paginata dei documenti.
+        """
+        await self.collection.create_index([("uploaded_at", -1), ("_id", -1)])
+        await self.collection.create_index(
+            [("owner_email", 1), ("uploaded_at", -1), ("_id", -1)]
+        )
+        await self.collection.create_index([("title", 1)])
+        await self.collection.create_index([("ingestion_state", 1), ("lease_expires_at", 1)])
+        # Usato dalla pulizia dei file GridFS per sapere quali file sono ancora collegati a un documento
+        await self.collection.create_index("file_id", sparse=True)
+        await self.normalize_uploaded_at()
+        await self.sync.backfill(self.collection, "documents")
+
+    async def normalize_uploaded_at(self):
+        """
+        Converte in UTC gli uploaded_at salvati con il fuso orario locale (documenti caricati prima della conversione).
+        """
+        operations = []
+        async for document in self.collection.find(
+            {"uploaded_at": {"$type": "string", "$not": re.compile(UPLOADED_AT_UTC_PATTERN)}}, {"uploaded_at": 1}
+        ):
+            try:
+                uploaded_at = to_utc_isoformat(document["uploaded_at"])
+            except ValueError:
+                logger.warning("Invalid uploaded_at for document %s: %s", document["_id"], document["uploaded_at"])
+                continue
+            # Il filtro sul valore letto evita di sovrascrivere una modifica concorrente
+            operations.append(
+                UpdateOne(
+                    {"_id": document["_id"], "uploaded_at": document["uploaded_at"]},
+                    {"$set": {"uploaded_at": uploaded_at}},
+                )
+            )
+            if len(operations) >= UPLOADED_AT_MIGRATION_BATCH_SIZE:
+                await self.collection.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+    async def get_changes(self, since: str = None, limit: int = SYNC_CHANGES_MAX_LIMIT):
+        """
+        Restituisce gli id dei documenti inseriti, modificati ed eliminati dopo il token since.
+        """
+        return await self.sync.get_changes(self.collection, "documents", since, limit)
+
+    async def get_version(self):
+        """
+        Restituisce un numero che cambia a ogni modifica dei documenti, senza leggerli.
+        Ogni scrittura salva un nuovo sync_seq, quindi basta il contatore del feed (fermo prima delle scritture in corso).
+        """
+        return await self.sync.current_seq("documents")
+
+    @staticmethod
+    def encode_cursor(document):
+        """
+        Restituisce il cursore opaco che punta subito dopo il documento passato.
+        """
+        raw = f"{to_utc_isoformat(document['uploaded_at'])}|{document['_id']}"
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def decode_cursor(cursor: str):
+        """
+        Decodifica un cursore creato da encode_cursor.
+        Raises:
+            ValueError: Se il cursore non è valido.
+        """
+        try:
+            uploaded_at, document_id = (
+                base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit("|", 1)
+            )
+            return to_utc_isoformat(uploaded_at), ObjectId(document_id)
+        except (ValueError, InvalidId, UnicodeError) as e:
+            raise ValueError(f"Invalid cursor: {e}")
+
+    async def get_documents(
+        self,
+        limit: int = None,
+        cursor: str = None,
+        owner_email: str = None,
+        uploaded_from: str = None,
+        uploaded_to: str = None,
+        title_prefix: str = None,
+    ):
+        """
+        Restituisce i documenti dal più recente, opzionalmente filtrati e paginati.
+
+        Args:
+            limit (int): Numero massimo di documenti (al più DOCUMENTS_MAX_LIMIT); se None li restituisce tutti.
+            cursor (str): Il cursore restituito da encode_cursor per l'ultimo documento della pagina precedente.
+            owner_email (str): Restituisce solo i documenti caricati da questo utente.
+            uploaded_from (str): Data (YYYY-MM-DD, fuso orario del server) minima di caricamento, inclusa.
+            uploaded_to (str): Data (YYYY-MM-DD, fuso orario del server) massima di caricamento, inclusa.
+            title_prefix (str): Restituisce solo i documenti il cui titolo inizia con questo prefisso.
+        Raises:
+            ValueError: Se le date o il cursore non sono validi.
+        """
+        conditions = []
+        if owner_email:
+            conditions.append({"owner_email": owner_email})
+        if uploaded_from or uploaded_to:
+            # uploaded_at è una stringa ISO in UTC: i limiti del giorno locale vengono convertiti in UTC
+            uploaded_range = {}
+            if uploaded_from:
+                uploaded_range["$gte"] = self._day_start(datetime.strptime(uploaded_from, "%Y-%m-%d").date())
+            if uploaded_to:
+                day_after = datetime.strptime(uploaded_to, "%Y-%m-%d").date() + timedelta(days=1)
+                uploaded_range["$lt"] = self._day_start(day_after)
+            conditions.append({"uploaded_at": uploaded_range})
+        if title_prefix:
+            conditions.append({"title": {"$regex": "^" + re.escape(title_prefix)}})
+        if cursor:
+            uploaded_at, document_id = self.decode_cursor(cursor)
+            conditions.append(
+                {
+                    "$or": [
+                        {"uploaded_at": {"$lt": uploaded_at}},
+                        {"uploaded_at": uploaded_at, "_id": {"$lt": document_id}},
+                    ]
+                }
+            )
+
+        query = {"$and": conditions} if conditions else {}
+        documents = self.collection.find(query).sort([("uploaded_at", -1), ("_id", -1)])
+        if limit is not None:
+            limit = max(1, min(limit, DOCUMENTS_MAX_LIMIT))
+            documents = documents.limit(limit)
+        return await documents.to_list(length=limit)
+
+    @staticmethod
+    def _day_start(day):
+        return to_utc_isoformat(get_timezone().localize(datetime.combine(day, time.min)))
 
-    async def get_documents(self):
-        return await self.collection.find().to_list(length=None)
+    async def get_document_by_id(self, document_id: ObjectId):
+        return await self.collection.find_one({"_id": document_id})
+
+    async def set_document_file(self, document_id: ObjectId, file_info: dict, content_type: str):
+        """
+        Collega al documento il contenuto salvato su GridFS.
+        """
+        async with self.sync.reserve("documents") as seq:
+            return await self.collection.update_one(
+                {"_id": document_id},
+                {
+                    "$set": {
+                        "file_id": file_info["file_id"],
+                        "sha256": file_info["sha256"],
+                        "size": file_info["length"],
+                        "content_type": content_type,
+                        "sync_seq": seq,
+                        # Il nuovo contenuto va ingerito di nuovo
+                        "ingestion_state": "pending",
+                        "ingestion_attempts": 0,
+                    },
+                    "$unset": {"lease_owner": "", "lease_expires_at": ""},
+                },
+            )
+
+    async def claim_document(self, worker_id: str, lease_seconds: int = INGESTION_LEASE_SECONDS):
+        """
+        Assegna al worker il prossimo documento da ingerire con un unico find_one_and_update.
+
+        Un documento è disponibile se è in attesa oppure se il lease del worker precedente è scaduto
+        (ad esempio perché il worker è terminato); due worker non possono ottenere lo stesso documento.
+        Returns:
+            dict: Il documento assegnato, o None se non ci sono documenti da ingerire.
+        """
+        await self.fail_expired_leases()
+        now = datetime.now(get_timezone())
+        async with self.sync.reserve("documents") as seq:
+            return await self.collection.find_one_and_update(
+                {
+                    "$or": [
+                        {"ingestion_state": "pending"},
+                        {"ingestion_state": "processing", "lease_expires_at": {"$lt": now}},
+                    ],
+                    "ingestion_attempts": {"$lt": INGESTION_MAX_ATTEMPTS},
+                },
+                {
+                    "$set": {
+                        "ingestion_state": "processing",
+                        "lease_owner": worker_id,
+                        "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                        "sync_seq": seq,
+                    },
+                    "$inc": {"ingestion_attempts": 1},
+                },
+                return_document=ReturnDocument.AFTER,
+            )
+
+    async def fail_expired_leases(self):
+        """
+        Porta a failed i documenti rimasti in processing con il lease scaduto e i tentativi esauriti
+        (il worker è terminato durante l'ultimo tentativo): non possono più essere assegnati.
+        Returns:
+            int: Il numero di documenti passati a failed.
+        """
+        expired = {
+            "ingestion_state": "processing",
+            "lease_expires_at": {"$lt": datetime.now(get_timezone())},
+            "ingestion_attempts": {"$gte": INGESTION_MAX_ATTEMPTS},
+        }
+        documents = await self.collection.find(expired, {"_id": 1}).to_list(length=None)
+        if not documents:
+            return 0
+        async with self.sync.reserve("documents", len(documents)) as seq:
+            result = await self.collection.bulk_write(
+                [
+                    UpdateOne(
+                        # Il filtro viene ripetuto: nel frattempo il lease potrebbe essere stato rinnovato
+                        {"_id": document["_id"], **expired},
+                        {
+                            "$set": {
+                                "ingestion_state": "failed",
+                                "ingestion_error": "Ingestion lease expired",
+                                "sync_seq": seq + i,
+                            },
+                            "$unset": {"lease_owner": "", "lease_expires_at": ""},
+                        },
+                    )
+                    for i, document in enumerate(documents)
+                ],
+                ordered=False,
+            )
+        return result.modified_count
+
+    async def renew_lease(self, document_id: ObjectId, worker_id: str, lease_seconds: int = INGESTION_LEASE_SECONDS):
+        """
+        Prolunga il lease del worker sul documento.
+        Returns:
+            bool: False se il worker non possiede più il lease.
+        """
+        async with self.sync.reserve("documents") as seq:
+            result = await self.collection.update_one(
+                {"_id": document_id, "ingestion_state": "processing", "lease_owner": worker_id},
+                {
+                    "$set": {
+                        "lease_expires_at": datetime.now(get_timezone()) + timedelta(seconds=lease_seconds),
+                        "sync_seq": seq,
+                    }
+                },
+            )
+        return result.matched_count > 0
+
+    async def complete_ingestion(self, document_id: ObjectId, worker_id: str):
+        """
+        Segna il documento come ingerito.
+        Returns:
+            bool: False se il worker non possiede più il lease.
+        """
+        async with self.sync.reserve("documents") as seq:
+            result = await self.collection.update_one(
+                {"_id": document_id, "ingestion_state": "processing", "lease_owner": worker_id},
+                {
+                    "$set": {
+                        "ingestion_state": "done",
+                        "ingested_at": datetime.now(get_timezone()).isoformat(),
+                        "sync_seq": seq,
+                    },
+                    "$unset": {"lease_owner": "", "lease_expires_at": "", "ingestion_error": ""},
+                },
+            )
+        return result.matched_count > 0
+
+    async def fail_ingestion(self, document_id: ObjectId, worker_id: str, error: str):
+        """
+        Rilascia il documento dopo un errore: torna in attesa, o passa a failed se ha esaurito i tentativi.
+        Returns:
+            bool: False se il worker non possiede più il lease.
+        """
+        exhausted = {"$gte": ["$ingestion_attempts", INGESTION_MAX_ATTEMPTS]}
+        async with self.sync.reserve("documents") as seq:
+            result = await self.collection.update_one(
+                {"_id": document_id, "ingestion_state": "processing", "lease_owner": worker_id},
+                [
+                    {
+                        "$set": {
+                            "ingestion_state": {"$cond": [exhausted, "failed", "pending"]},
+                            "ingestion_error": {"$literal": error},
+                            "sync_seq": seq,
+                        }
+                    },
+                    {"$unset": ["lease_owner", "lease_expires_at"]},
+                ],
+            )
+        return result.matched_count > 0
 
     async def insert_document(self, owner_email: EmailStr, document: schemas.Document):
         """
         Inserisce un nuovo documento nel database.
         Il documento viene memorizzato con un ObjectId generato dal suo percorso file come chiave primaria.
         """
-        document_data = {
-            "_id": get_object_id(document.file_path),
-            "title": document.title,
-            "file_path": document.file_path,
-            "owner_email": owner_email,
-            "uploaded_at": datetime.now(get_timezone()).isoformat(),
-        }
+        async with self.sync.reserve("documents") as seq:
+            document_data = {
+                "_id": get_object_id(document.file_path),
+                "title": document.title,
+                "file_path": document.file_path,
+                "owner_email": owner_email,
+                "uploaded_at": to_utc_isoformat(datetime.now(timezone.utc)),
+                "created_seq": seq,
+                "sync_seq": seq,
+                "ingestion_state": "pending",
+                "ingestion_attempts": 0,
+            }
+            try:
+                return await self.collection.insert_one(document_data)
+            except DuplicateKeyError as e:
+                logger.error("Error inserting document: %s.", e)
+                raise DuplicateKeyError(f"Error inserting document: {e}.")
+            except Exception as e:
+                logger.error("Error inserting document: %s", e)
+                raise Exception(f"Error inserting document: {e}")
+
+    async def insert_documents(self, owner_email: EmailStr, documents: List[schemas.Document]):
+        """
+        Inserisce più documenti con un unico insert_many non ordinato.
+        I documenti con lo stesso percorso file (e quindi lo stesso ObjectId) vengono inseriti una volta sola.
+
+        Returns:
+            tuple: Gli ObjectId dei documenti creati e quelli dei documenti già esistenti.
+        """
+        uploaded_at = to_utc_isoformat(datetime.now(timezone.utc))
+        documents_data = {}
+        for document in documents:
+            document_id = get_object_id(document.file_path)
+            documents_data.setdefault(
+                document_id,
+                {
+                    "_id": document_id,
+                    "title": document.title,
+                    "file_path": document.file_path,
+                    "owner_email": owner_email,
+                    "uploaded_at": uploaded_at,
+                    "ingestion_state": "pending",
+                    "ingestion_attempts": 0,
+                },
+            )
+        if not documents_data:
+            return [], []
+
+        existing = set()
         try:
-            return await self.collection.insert_one(document_data)
-        except DuplicateKeyError as e:
-            print(f"Error inserting document: {e}.")
-            raise DuplicateKeyError(f"Error inserting document: {e}.")
-        except Exception as e:
-            print(f"Error inserting document: {e}")
-            raise Exception(f"Error inserting document: {e}")
+            async with self.sync.reserve("documents", len(documents_data)) as seq:
+                for i, document_data in enumerate(documents_data.values()):
+                    document_data["created_seq"] = document_data["sync_seq"] = seq + i
+                await self.collection.insert_many(list(documents_data.values()), ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            # Le chiavi duplicate sono documenti già registrati, gli altri errori sono reali
+            if any(error.get("code") != 11000 for error in errors):
+                logger.error("Error inserting documents: %s", e.details)
+                raise Exception(f"Error inserting documents: {e.details}")
+            existing = {error["op"]["_id"] for error in errors}
+
+        created = [document_id for document_id in documents_data if document_id not in existing]
+        return created, [document_id for document_id in documents_data if document_id in existing]
 
     async def delete_document(self, file_id: ObjectId):
         """
         Elimina un documento dal database in base all'ObjectId passato come file_id.
         """
         try:
-            print(f"Sto cancellando il documento da MongoDB {file_id}")
-            return await self.collection.delete_one({"_id": file_id})
+            logger.debug("Sto cancellando il documento da MongoDB %s", file_id)
+            async with self.sync.record_deletions("documents", [file_id]):
+                return await self.collection.delete_one({"_id": file_id})
         except Exception as e:
-            print(f"Error deleting document: {e}")
+            logger.error("Error deleting document: %s", e)
             raise Exception(f"Error deleting document: {e}")
 
+    async def delete_documents(self, document_ids: List[ObjectId]):
+        """
+        Elimina più documenti con un unico delete_many.
+
+        Returns:
+            tuple: Gli ObjectId dei documenti eliminati e quelli dei documenti non trovati.
+        """
+        document_ids = list(dict.fromkeys(document_ids))
+        if not document_ids:
+            return [], []
+        try:
+            found = {
+                document["_id"]
+                async for document in self.collection.find(
+                    {"_id": {"$in": document_ids}}, {"_id": 1}
+                )
+            }
+            if found:
+                async with self.sync.record_deletions(
+                    "documents", [document_id for document_id in document_ids if document_id in found]
+                ):
+                    await self.collection.delete_many({"_id": {"$in": list(found)}})
+        except Exception as e:
+            logger.error("Error deleting documents: %s", e)
+            raise Exception(f"Error deleting documents: {e}")
+
+        deleted = [document_id for document_id in document_ids if document_id in found]
+        return deleted, [document_id for document_id in document_ids if document_id not in found]
+
 def get_document_repository(db: AsyncIOMotorDatabase = Depends(get_db)):
     """
     Restituisce un'istanza del repository dei documenti.
@@ -1,5 +1,8 @@
+import logging
 from bson import ObjectId
-from pymongo.errors import DuplicateKeyError
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from typing import List
 from datetime import datetime
 from fastapi import HTTPException, status, Depends
 from app.database import get_db
@@ -7,19 +10,180 @@ from motor.motor_asyncio import AsyncIOMotorDatabase
 
 import app.schemas as schemas
 from app.utils import get_timezone
+from app.cache import faq_cache
+from app.snapshot import config_snapshot, publish_snapshot
+from app.repositories.sync_repository import SyncRepository, SYNC_CHANGES_MAX_LIMIT
+from app.service.faq_search import FAQ_SEARCH_BACKEND, FAQ_SEARCH_WEIGHTS, FaqSearchIndex
+from app.service.faq_matcher import FAQ_MATCH_THRESHOLD, FaqMatcher
+
+logger = logging.getLogger(__name__)
+
+# Numero massimo di risultati restituiti da una pagina della ricerca
+FAQ_SEARCH_MAX_LIMIT = 50
 
 
 class FaqRepository:
     def __init__(self, database):
         self.database = database
         self.collection = database.get_collection("faq")
+        self.sync = SyncRepository(database)
+
+    async def ensure_indexes(self):
+        """
+        Crea gli indici della collection faq e numera le FAQ create prima del feed delle modifiche.
+        """
+        if FAQ_SEARCH_BACKEND == "mongo":
+            await self.collection.create_index(
+                [(field, "text") for field in FAQ_SEARCH_WEIGHTS],
+                weights=FAQ_SEARCH_WEIGHTS,
+                default_language="italian",
+                name="faq_text",
+            )
+        try:
+            # Il titolo è la chiave dell'importazione: i duplicati esistenti vanno risolti a mano
+            await self.collection.create_index("title", unique=True)
+        except OperationFailure as e:
+            logger.warning("Error creating unique index on FAQ title: %s", e)
+        await self.sync.backfill(self.collection, "faq")
 
     async def get_faqs(self):
         """
-        Restituisce una lista di tutte le FAQ.
+        Restituisce una lista di tutte le FAQ, dalla snapshot condivisa se è attiva.
         """
+        snapshot = config_snapshot.read()
+        if snapshot is not None:
+            return snapshot["faqs"]
         return await self.collection.find().to_list(length=None)
 
+    async def search_faqs(self, query: str, limit: int = 10, offset: int = 0):
+        """
+        Cerca le FAQ che contengono i termini della query, dalla più rilevante.
+
+        Con FAQ_SEARCH_BACKEND=mongo usa l'indice di testo (con stemming italiano), altrimenti un
+        indice invertito in memoria ricostruito solo quando le FAQ cambiano.
+        Args:
+            query (str): I termini da cercare.
+            limit (int): Numero massimo di risultati (al più FAQ_SEARCH_MAX_LIMIT).
+            offset (int): Numero di risultati da saltare.
+        Returns:
+            tuple: Le FAQ trovate, ciascuna con il campo score, e l'offset della pagina successiva o None.
+        """
+        limit = max(1, min(limit, FAQ_SEARCH_MAX_LIMIT))
+        offset = max(0, offset)
+
+        # Un risultato in più indica se esiste una pagina successiva
+        if FAQ_SEARCH_BACKEND == "mongo":
+            score = {"$meta": "textScore"}
+            results = (
+                await self.collection.find(
+                    {"$text": {"$search": query, "$language": "italian"}}, {"score": score}
+                )
+                .sort([("score", score), ("_id", 1)])
+                .skip(offset)
+                .limit(limit + 1)
+                .to_list(length=limit + 1)
+            )
+        else:
+            index = await self._get_faq_index("search_index", FaqSearchIndex)
+            results = [dict(faq, score=score) for faq, score in index.search(query, limit + 1, offset)]
+
+        next_offset = offset + limit if len(results) > limit else None
+        return results[:limit], next_offset
+
+    async def match_faq(self, question: str, threshold: float = FAQ_MATCH_THRESHOLD):
+        """
+        Restituisce la FAQ la cui domanda è più simile a question, se la similarità supera la soglia.
+        Returns:
+            tuple: La FAQ (o None) e la similarità.
+        """
+        matcher = await self._get_faq_index("matcher", FaqMatcher)
+        return matcher.best_match(question, threshold)
+
+    async def _get_faq_index(self, key: str, index_class):
+        """
+        Restituisce l'indice costruito su tutte le FAQ, ricostruendolo solo quando le FAQ cambiano.
+        """
+        index = faq_cache.get(key)
+        if index is None:
+            version = faq_cache.version
+            index = index_class(await self.get_faqs())
+            faq_cache.set(index, version, key)
+        return index
+
+    async def get_changes(self, since: str = None, limit: int = SYNC_CHANGES_MAX_LIMIT):
+        """
+        Restituisce gli id delle FAQ inserite, modificate ed eliminate dopo il token since.
+        """
+        return await self.sync.get_changes(self.collection, "faq", since, limit)
+
+    async def iter_faqs(self):
+        """
+        Scorre tutte le FAQ ordinate per titolo, senza caricarle tutte in memoria.
+        """
+        async for faq in self.collection.find().sort("title", 1):
+            yield faq
+
+    async def import_faqs(self, faqs: List[schemas.FAQ], author_email: str):
+        """
+        Inserisce o aggiorna le FAQ, identificate dal titolo, con un unico bulk_write.
+
+        Le FAQ già presenti con la stessa domanda e risposta non vengono modificate
+        (né cambiano updated_at o il numero di sequenza del feed delle modifiche).
+        Returns:
+            dict: Il numero di FAQ create, aggiornate e invariate.
+        """
+        # A parità di titolo vale l'ultima riga
+        faqs = list({faq.title: faq for faq in faqs}.values())
+        if not faqs:
+            return {"created": 0, "updated": 0, "unchanged": 0}
+
+        now = datetime.now(get_timezone()).isoformat()
+        try:
+            async with self.sync.reserve("faq", len(faqs)) as seq:
+                operations = []
+                for i, faq in enumerate(faqs):
+                    # $literal: nella pipeline un testo che inizia con "$" verrebbe letto come un campo
+                    question, answer = {"$literal": faq.question}, {"$literal": faq.answer}
+                    unchanged = {"$and": [{"$eq": ["$question", question]}, {"$eq": ["$answer", answer]}]}
+
+                    def keep_if_unchanged(field, value):
+                        return {"$cond": [unchanged, f"${field}", value]}
+
+                    operations.append(
+                        UpdateOne(
+                            {"title": faq.title},
+                            [
+                                {
+                                    "$set": {
+                                        "title": {"$literal": faq.title},
+                                        "question": question,
+                                        "answer": answer,
+                                        "author_email": keep_if_unchanged("author_email", {"$literal": author_email}),
+                                        "updated_at": keep_if_unchanged("updated_at", now),
+                                        "sync_seq": keep_if_unchanged("sync_seq", seq + i),
+                                        "created_at": {"$ifNull": ["$created_at", now]},
+                                        "created_seq": {"$ifNull": ["$created_seq", seq + i]},
+                                    }
+                                }
+                            ],
+                            upsert=True,
+                        )
+                    )
+
+                result = await self.collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error("Error importing FAQs: %s", e)
+            raise Exception(f"Error importing FAQs: {e}")
+
+        if result.upserted_count or result.modified_count:
+            faq_cache.bump()
+            await publish_snapshot(self.database)
+        return {
+            "created": result.upserted_count,
+            "updated": result.modified_count,
+            "unchanged": len(faqs) - result.upserted_count - result.modified_count,
+        }
+
     async def get_faq_by_id(self, faq_id: ObjectId):
         """
         Restituisce una FAQ specifica in base all'ID fornito.
@@ -27,7 +191,7 @@ class FaqRepository:
         try:
             return await self.collection.find_one({"_id": faq_id})
         except Exception as e:
-            print(f"Error retrieving FAQ: {e}")
+            logger.error("Error retrieving FAQ: %s", e)
             raise Exception(f"Error retrieving FAQ: {e}")
 
     async def insert_faq(self, faq: schemas.FAQ, author_email: str):
@@ -36,21 +200,26 @@ class FaqRepository:
         L'ID viene generato automaticamente da MongoDB.
         """
         try:
-            insert_payload = {
-                "title": faq.title,
-                "question": faq.question,
-                "answer": faq.answer,
-                "author_email": author_email,
-                "created_at": datetime.now(get_timezone()).isoformat(),
-                "updated_at": datetime.now(get_timezone()).isoformat(),
-            }
-            result = await self.collection.insert_one(insert_payload)
+            async with self.sync.reserve("faq") as seq:
+                insert_payload = {
+                    "title": faq.title,
+                    "question": faq.question,
+                    "answer": faq.answer,
+                    "author_email": author_email,
+                    "created_at": datetime.now(get_timezone()).isoformat(),
+                    "updated_at": datetime.now(get_timezone()).isoformat(),
+                    "created_seq": seq,
+                    "sync_seq": seq,
+                }
+                result = await self.collection.insert_one(insert_payload)
+            faq_cache.bump()
+            await publish_snapshot(self.database)
             return result.inserted_id
         except DuplicateKeyError as e:
-            print(f"Error inserting FAQ: {e}.")
+            logger.error("Error inserting FAQ: %s.", e)
             raise DuplicateKeyError(f"Error inserting FAQ: {e}.")
         except Exception as e:
-            print(f"Error inserting FAQ: {e}")
+            logger.error("Error inserting FAQ: %s", e)
             raise Exception(f"Error inserting FAQ: {e}")
 
     async def update_faq(
@@ -60,7 +229,7 @@ class FaqRepository:
         Aggiorna una FAQ esistente nel database.
         """
         try:
-            # print(f"Updating FAQ: {faq}")
+            # logger.debug("Updating FAQ: %s", faq)
 
             # Ottiene i dati della FAQ esistente
             faq_current_data = await self.get_faq_by_id(faq_id)
@@ -78,7 +247,7 @@ class FaqRepository:
                 and faq_current_data.get("question") == faq_data.question
                 and faq_current_data.get("answer") == faq_data.answer
             ):
-                print("FAQ data is already up to date.")
+                logger.debug("FAQ data is already up to date.")
                 raise HTTPException(
                     status_code=status.HTTP_304_NOT_MODIFIED,
                     detail="FAQ data is already up to date.",
@@ -104,18 +273,22 @@ class FaqRepository:
             }
 
             # Esegue l'aggiornamento
-            result = await self.collection.update_one(
-                {"_id": faq_id},
-                {"$set": update_payload},
-            )
+            async with self.sync.reserve("faq") as seq:
+                update_payload["sync_seq"] = seq
+                result = await self.collection.update_one(
+                    {"_id": faq_id},
+                    {"$set": update_payload},
+                )
 
             # Controlla se l'aggiornamento ha avuto effetto
             if result.matched_count == 0:
-                print("FAQ not found during update attempt")
+                logger.info("FAQ not found during update attempt")
                 raise Exception("FAQ not found during update attempt")
+            faq_cache.bump()
+            await publish_snapshot(self.database)
 
         except Exception as e:
-            print(f"Error updating FAQ: {e}")
+            logger.error("Error updating FAQ: %s", e)
             raise Exception(f"Error updating FAQ: {e}")
 
     async def delete_faq(self, faq_id: ObjectId):
@@ -129,10 +302,15 @@ class FaqRepository:
             Il risultato dell'operazione di eliminazione.
         """
         try:
-            # print(f"Deleting FAQ with ID: {faq_id}")
-            return await self.collection.delete_one({"_id": faq_id})
+            # logger.debug("Deleting FAQ with ID: %s", faq_id)
+            async with self.sync.record_deletions("faq", [faq_id]):
+                result = await self.collection.delete_one({"_id": faq_id})
+            if result.deleted_count:
+                faq_cache.bump()
+                await publish_snapshot(self.database)
+            return result
         except Exception as e:
-            print(f"Error deleting FAQ: {e}")
+            logger.error("Error deleting FAQ: %s", e)
             raise Exception(f"Error deleting FAQ: {e}")
 
 
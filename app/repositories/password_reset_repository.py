@@ -0,0 +1,73 @@
+import os
+from datetime import datetime, timedelta
+from fastapi import Depends
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from app.database import get_db
+from app.utils import get_timezone
+
+# Finestra in secondi entro cui le richieste di reset ripetute per la stessa email vengono ignorate
+PASSWORD_RESET_WINDOW_SECONDS = int(os.getenv("PASSWORD_RESET_WINDOW_SECONDS", 300))
+
+
+class PasswordResetRepository:
+    """
+    Tiene traccia delle richieste di reset password recenti, una per email.
+    I documenti scadono da soli grazie ad un indice TTL su requested_at.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.collection = database.get_collection("password_resets")
+
+    async def ensure_indexes(self):
+        """
+        Crea l'indice TTL, aggiornandone la scadenza se la finestra configurata è cambiata.
+        """
+        try:
+            await self.collection.create_index(
+                "requested_at", expireAfterSeconds=PASSWORD_RESET_WINDOW_SECONDS
+            )
+        except OperationFailure:
+            await self.database.command(
+                "collMod",
+                "password_resets",
+                index={
+                    "keyPattern": {"requested_at": 1},
+                    "expireAfterSeconds": PASSWORD_RESET_WINDOW_SECONDS,
+                },
+            )
+
+    async def try_acquire(self, email: str, window_seconds: int = PASSWORD_RESET_WINDOW_SECONDS):
+        """
+        Registra una richiesta di reset per l'email, in modo atomico.
+
+        Restituisce True se non c'erano richieste nella finestra (il reset va eseguito),
+        False se la richiesta è un duplicato e va assorbita.
+        """
+        now = datetime.now(get_timezone())
+        try:
+            # Se esiste una richiesta recente il filtro non la seleziona e l'upsert
+            # fallisce con una chiave duplicata sull'_id
+            await self.collection.find_one_and_update(
+                {"_id": email, "requested_at": {"$lt": now - timedelta(seconds=window_seconds)}},
+                {"$set": {"requested_at": now}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def release(self, email: str):
+        """
+        Annulla la richiesta registrata, ad esempio se il reset non è andato a buon fine.
+        """
+        return await self.collection.delete_one({"_id": email})
+
+
+def get_password_reset_repository(db: AsyncIOMotorDatabase = Depends(get_db)):
+    """
+    Restituisce il repository della collection password_resets.
+    """
+    return PasswordResetRepository(db)
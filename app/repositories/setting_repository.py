@@ -1,9 +1,24 @@
+import logging
 from fastapi import Depends, HTTPException, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
+from pymongo import ReturnDocument
+
+from app.cache import settings_cache
+from app.snapshot import config_snapshot, publish_snapshot
 from app.database import get_db
 from app.schemas import Settings
 
+logger = logging.getLogger(__name__)
+
+# Impostazioni iniziali, salvate all'avvio se il documento non esiste
+DEFAULT_SETTINGS = {
+    "color_primary": "#5e5c64",
+    "color_primary_hover": "#44424a",
+    "color_primary_text": "white",
+    "message_history": 100,
+}
+
 
 def get_setting_repository(db: AsyncIOMotorDatabase = Depends(get_db)):
     """
@@ -17,34 +32,41 @@ class SettingRepository:
         self.database = database
         self.collection = database.get_collection("settings")
 
-        print("SettingRepository initialization")
-
-        insert_payload = {
-                "color_primary": "#5e5c64",
-                "color_primary_hover": "#44424a",
-                "color_primary_text": "white",
-                "message_history": 100,
-        }
-        self.collection.update_one(
+    async def seed_defaults(self):
+        """
+        Crea il documento delle impostazioni con i valori predefiniti, se non esiste.
+        """
+        await self.collection.update_one(
             {"_id": "main"},
-            { 
-                "$setOnInsert": insert_payload,
-            },
+            {"$setOnInsert": DEFAULT_SETTINGS},
             upsert=True,
         )
 
     async def get_settings(self):
         """
         Restituisce le impostazioni dell'applicazione.
+        Se la snapshot condivisa è attiva le impostazioni vengono lette da lì, altrimenti il documento resta
+        in cache nel processo e viene riletto solo dopo un aggiornamento o alla scadenza della cache.
         """
-        return await self.collection.find_one({"_id": "main"})
+        snapshot = config_snapshot.read()
+        if snapshot and snapshot.get("settings"):
+            return snapshot["settings"]
+
+        settings = settings_cache.get()
+        if settings is None:
+            version = settings_cache.version
+            settings = await self.collection.find_one({"_id": "main"})
+            if settings:
+                settings_cache.set(settings, version)
+        return settings
 
     async def update_settings(self, settings: Settings):
         """
         Aggiorna le impostazioni dell'applicazione.
         """
         try:
-            current_settings = await self.get_settings()
+            # Il confronto va fatto con il database, non con la cache che potrebbe essere di un'altra versione
+            current_settings = await self.collection.find_one({"_id": "main"})
 
             if not current_settings:
                 raise HTTPException(
@@ -61,7 +83,7 @@ class SettingRepository:
                 == settings.color_primary_text
                 and current_settings.get("message_history") == settings.message_history
             ):
-                print("Settings data is already up to date.")
+                logger.debug("Settings data is already up to date.")
                 raise HTTPException(
                     status_code=status.HTTP_304_NOT_MODIFIED,
                     detail="Settings data is already up to date.",
@@ -91,19 +113,25 @@ class SettingRepository:
                 ),
             }
 
-            result = await self.collection.update_one(
+            result = await self.collection.find_one_and_update(
                 {"_id": "main"},
                 {
                     "$set": update_payload,
                 },
+                return_document=ReturnDocument.AFTER,
             )
 
             # Controlla se l'aggiornamento ha avuto effetto
-            if result.matched_count == 0:
+            if result is None:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="Settings not found during update attempt",
                 )
+
+            # Le letture successive usano subito le nuove impostazioni
+            settings_cache.bump()
+            settings_cache.set(result, settings_cache.version)
+            await publish_snapshot(self.database)
         except Exception as e:
-            print(f"Error updating settings: {e}")
+            logger.error("Error updating settings: %s", e)
             raise Exception(f"Error updating settings: {e}")
@@ -0,0 +1,53 @@
+import os
+
+from fastapi import Depends
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import CollectionInvalid
+
+from app.database import get_db
+
+# Dimensione massima in byte della collection capped slow_queries (i record più vecchi vengono sovrascritti)
+SLOW_QUERY_COLLECTION_SIZE = int(os.getenv("SLOW_QUERY_COLLECTION_SIZE", 16 * 1024 * 1024))
+
+# Numero massimo di record restituiti in una pagina
+SLOW_QUERY_MAX_LIMIT = 200
+
+
+class SlowQueryRepository:
+    """
+    Registro delle operazioni lente su MongoDB, salvato in una collection capped.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.collection = database.get_collection("slow_queries")
+
+    async def ensure_collection(self):
+        """
+        Crea la collection capped, se non esiste già.
+        """
+        try:
+            await self.database.create_collection(
+                "slow_queries", capped=True, size=SLOW_QUERY_COLLECTION_SIZE
+            )
+        except CollectionInvalid:
+            pass
+
+    async def add(self, record: dict):
+        return await self.collection.insert_one(record)
+
+    async def get_slow_queries(self, collection: str = None, limit: int = 50):
+        """
+        Restituisce le operazioni lente più recenti, eventualmente solo quelle su una collection.
+        """
+        query = {"collection": collection} if collection else {}
+        # In una collection capped l'ordine naturale è l'ordine di inserimento
+        cursor = self.collection.find(query).sort("$natural", -1).limit(min(limit, SLOW_QUERY_MAX_LIMIT))
+        return await cursor.to_list(length=None)
+
+
+def get_slow_query_repository(db: AsyncIOMotorDatabase = Depends(get_db)):
+    """
+    Restituisce il repository della collection slow_queries.
+    """
+    return SlowQueryRepository(db)
@@ -0,0 +1,260 @@
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pymongo import ReturnDocument, UpdateOne
+from app.utils import get_timezone
+import os
+import time
+
+# Per quanto tempo vengono conservate le cancellazioni: un token più vecchio richiede una sincronizzazione completa
+SYNC_TOMBSTONE_TTL_SECONDS = int(os.getenv("SYNC_TOMBSTONE_TTL_SECONDS", 30 * 24 * 3600))
+
+# Numero massimo di modifiche restituite da una singola richiesta del feed
+SYNC_CHANGES_MAX_LIMIT = 1000
+
+# Dopo questo tempo una scrittura riservata e non rilasciata (es. processo terminato) non blocca più il feed
+SYNC_PENDING_TIMEOUT_SECONDS = int(os.getenv("SYNC_PENDING_TIMEOUT_SECONDS", 60))
+
+
+class SyncTokenExpired(Exception):
+    """
+    Il token è più vecchio delle cancellazioni conservate: il client deve risincronizzarsi da zero.
+    """
+
+
+class SyncRepository:
+    """
+    Numera le modifiche di una collection per il feed di sincronizzazione incrementale.
+
+    Ogni inserimento o modifica salva nel documento il numero di sequenza (sync_seq) preso da un
+    contatore per collection; le cancellazioni lasciano una tombstone con il proprio numero.
+    Un client che conosce l'ultimo numero visto legge solo ciò che è cambiato dopo.
+
+    Il numero viene riservato prima della scrittura che lo salva, quindi le scritture possono
+    diventare visibili in un ordine diverso da quello dei numeri: il contatore tiene l'elenco dei
+    numeri riservati e non ancora scritti (pending) e il feed non va mai oltre il più basso di questi.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.counters = database.get_collection("sync_counters")
+        self.tombstones = database.get_collection("sync_tombstones")
+
+    async def ensure_indexes(self):
+        await self.tombstones.create_index([("collection", 1), ("seq", 1)])
+        await self.tombstones.create_index(
+            "deleted_at", expireAfterSeconds=SYNC_TOMBSTONE_TTL_SECONDS
+        )
+
+    async def next_seq(self, name: str, count: int = 1):
+        """
+        Riserva count numeri di sequenza per la collection name e restituisce il primo.
+        I numeri restano in attesa finché non vengono rilasciati con release (vedi reserve).
+        """
+        now = time.time()
+        counter = await self.counters.find_one_and_update(
+            {"_id": name},
+            [
+                {"$set": {"seq": {"$add": [{"$ifNull": ["$seq", 0]}, count]}}},
+                {
+                    "$set": {
+                        "pending": {
+                            "$concatArrays": [
+                                # Le prenotazioni scadute vengono rimosse qui
+                                {
+                                    "$filter": {
+                                        "input": {"$ifNull": ["$pending", []]},
+                                        "cond": {
+                                            "$gte": ["$$this.reserved_at", now - SYNC_PENDING_TIMEOUT_SECONDS]
+                                        },
+                                    }
+                                },
+                                [{"seq": {"$subtract": ["$seq", count - 1]}, "reserved_at": now}],
+                            ]
+                        }
+                    }
+                },
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return counter["seq"] - count + 1
+
+    async def release(self, name: str, seq: int):
+        """
+        Segnala che la scrittura dei numeri riservati a partire da seq è conclusa (o fallita).
+        """
+        await self.counters.update_one({"_id": name}, {"$pull": {"pending": {"seq": seq}}})
+
+    @asynccontextmanager
+    async def reserve(self, name: str, count: int = 1):
+        """
+        Riserva count numeri di sequenza e li rilascia al termine del blocco, anche in caso di errore.
+        """
+        seq = await self.next_seq(name, count)
+        try:
+            yield seq
+        finally:
+            await self.release(name, seq)
+
+    async def current_seq(self, name: str):
+        """
+        Restituisce il numero più alto sotto al quale tutte le scritture sono concluse.
+        """
+        counter = await self.counters.find_one({"_id": name})
+        if not counter:
+            return 0
+        expired = time.time() - SYNC_PENDING_TIMEOUT_SECONDS
+        in_flight = [
+            pending["seq"] for pending in counter.get("pending", []) if pending["reserved_at"] >= expired
+        ]
+        return min(in_flight) - 1 if in_flight else counter["seq"]
+
+    @asynccontextmanager
+    async def record_deletions(self, name: str, ids: list):
+        """
+        Registra la cancellazione dei documenti con gli id passati; la cancellazione va eseguita nel blocco.
+
+        Le tombstone vengono scritte prima della cancellazione e diventano visibili nel feed solo
+        al rilascio dei numeri, quando la cancellazione è conclusa: un errore (o un crash) non può
+        lasciare un documento eliminato senza tombstone. Se il blocco fallisce le tombstone vengono
+        rimosse; quelle rimaste dopo un crash vengono ignorate da get_changes perché il documento esiste.
+        """
+        if not ids:
+            yield
+            return
+        deleted_at = datetime.now(get_timezone())
+        async with self.reserve(name, len(ids)) as seq:
+            await self.tombstones.insert_many(
+                [
+                    {"collection": name, "doc_id": doc_id, "seq": seq + i, "deleted_at": deleted_at}
+                    for i, doc_id in enumerate(ids)
+                ]
+            )
+            try:
+                yield
+            except BaseException:
+                await self.tombstones.delete_many(
+                    {"collection": name, "seq": {"$gte": seq, "$lt": seq + len(ids)}}
+                )
+                raise
+
+    async def backfill(self, collection, name: str):
+        """
+        Assegna un numero di sequenza ai documenti creati prima dell'introduzione del feed.
+        """
+        await collection.create_index("sync_seq")
+        ids = [
+            document["_id"]
+            async for document in collection.find({"sync_seq": {"$exists": False}}, {"_id": 1})
+        ]
+        if not ids:
+            return
+        async with self.reserve(name, len(ids)) as seq:
+            await collection.bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": doc_id},
+                        {"$set": {"sync_seq": seq + i, "created_seq": seq + i}},
+                    )
+                    for i, doc_id in enumerate(ids)
+                ],
+                ordered=False,
+            )
+
+    @staticmethod
+    def encode_token(seq: int):
+        return f"{seq}.{int(time.time())}"
+
+    @staticmethod
+    def decode_token(token: str):
+        """
+        Restituisce il numero di sequenza contenuto nel token.
+        Raises:
+            ValueError: Se il token non è valido.
+            SyncTokenExpired: Se nel frattempo le tombstone potrebbero essere scadute.
+        """
+        try:
+            seq, issued_at = (int(part) for part in token.split("."))
+        except ValueError:
+            raise ValueError(f"Invalid sync token: {token}")
+        if seq < 0:
+            raise ValueError(f"Invalid sync token: {token}")
+        if time.time() - issued_at > SYNC_TOMBSTONE_TTL_SECONDS:
+            raise SyncTokenExpired()
+        return seq
+
+    async def get_changes(self, collection, name: str, since: str = None, limit: int = SYNC_CHANGES_MAX_LIMIT):
+        """
+        Restituisce gli id inseriti, modificati ed eliminati dopo il token since.
+
+        Senza since vengono restituiti tutti i documenti esistenti come inseriti.
+        Args:
+            collection: La collection sincronizzata.
+            name (str): Il nome del contatore della collection.
+            since (str): Il token restituito dalla richiesta precedente.
+            limit (int): Numero massimo di modifiche (al più SYNC_CHANGES_MAX_LIMIT).
+        Returns:
+            dict: inserted, updated, deleted, il token da usare alla richiesta successiva e has_more.
+        Raises:
+            ValueError: Se il token non è valido.
+            SyncTokenExpired: Se il token è troppo vecchio.
+        """
+        limit = max(1, min(limit, SYNC_CHANGES_MAX_LIMIT))
+        since_seq = self.decode_token(since) if since else 0
+        # Tutte le scritture fino a current sono concluse: il feed si ferma lì, quelle ancora
+        # in corso verranno restituite alla richiesta successiva
+        current = await self.current_seq(name)
+
+        changed = (
+            await collection.find(
+                {"sync_seq": {"$gt": since_seq, "$lte": current}}, {"created_seq": 1, "sync_seq": 1}
+            )
+            .sort("sync_seq", 1)
+            .limit(limit + 1)
+            .to_list(length=limit + 1)
+        )
+        deleted = []
+        if since:
+            deleted = (
+                await self.tombstones.find(
+                    {"collection": name, "seq": {"$gt": since_seq, "$lte": current}}, {"doc_id": 1, "seq": 1}
+                )
+                .sort("seq", 1)
+                .limit(limit + 1)
+                .to_list(length=limit + 1)
+            )
+        if deleted:
+            # Tombstone di una cancellazione non avvenuta (processo terminato prima del delete)
+            still_existing = {
+                document["_id"]
+                for document in await collection.find(
+                    {"_id": {"$in": [tombstone["doc_id"] for tombstone in deleted]}}, {"_id": 1}
+                ).to_list(length=None)
+            }
+            deleted = [tombstone for tombstone in deleted if tombstone["doc_id"] not in still_existing]
+
+        events = sorted(
+            [(document["sync_seq"], document) for document in changed]
+            + [(tombstone["seq"], tombstone) for tombstone in deleted],
+            key=lambda event: event[0],
+        )
+        has_more = len(events) > limit
+        events = events[:limit]
+
+        result = {"inserted": [], "updated": [], "deleted": []}
+        existing = {str(item["_id"]) for _, item in events if "doc_id" not in item}
+        for _, item in events:
+            if "doc_id" in item:
+                # Un documento eliminato e poi ricreato con lo stesso id risulta solo inserito o modificato
+                if str(item["doc_id"]) not in existing:
+                    result["deleted"].append(str(item["doc_id"]))
+            elif item.get("created_seq", 0) > since_seq:
+                result["inserted"].append(str(item["_id"]))
+            else:
+                result["updated"].append(str(item["_id"]))
+
+        last_seq = events[-1][0] if has_more else max(current, since_seq)
+        result["token"] = self.encode_token(last_seq)
+        result["has_more"] = has_more
+        return result
+
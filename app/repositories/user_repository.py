@@ -1,18 +1,114 @@
+import logging
 from fastapi import HTTPException, status, Depends
 from pydantic import EmailStr
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import DeleteMany, ReturnDocument, UpdateOne
 from app.database import get_db
 
 
-from app.utils import get_password_hash, verify_password
+from app.utils import get_password_hash, verify_password, normalize_name
 import app.schemas as schemas
+import base64
+import json
 import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Numero massimo di risultati restituiti da una ricerca
+USER_SEARCH_MAX_LIMIT = 50
+
+# Campi restituiti dalla ricerca utenti (mai l'hash della password)
+USER_SEARCH_PROJECTION = {
+    "name": 1,
+    "scopes": 1,
+    "is_initialized": 1,
+    "last_active": 1,
+}
+
+# Numero di operazioni per bulk_write durante la costruzione iniziale di user_name_terms
+USER_NAME_TERMS_BATCH_SIZE = 1000
 
 
 class UserRepository:
     def __init__(self, database):
         self.database = database
         self.collection = database.get_collection("users")
+        # Una voce (term, user_id) per ogni suffisso del nome: indice scalare per la ricerca per nome,
+        # ordinabile e paginabile (name_normalized è un array e l'indice multikey non fornisce l'ordinamento)
+        self.name_terms = database.get_collection("user_name_terms")
+
+    async def ensure_indexes(self):
+        """
+        Crea gli indici della ricerca utenti e popola name_normalized e user_name_terms per gli utenti che ne sono privi.
+        """
+        await self.name_terms.create_index([("term", 1), ("user_id", 1)], unique=True)
+        await self.name_terms.create_index("user_id")
+
+        operations = [
+            UpdateOne(
+                {"_id": user["_id"]},
+                {"$set": {"name_normalized": normalize_name(user.get("name"))}},
+            )
+            async for user in self.collection.find(
+                {"name_normalized": {"$exists": False}}, {"name": 1}
+            )
+        ]
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+        if not await self.name_terms.count_documents({}, limit=1):
+            # Prima introduzione di user_name_terms: viene costruita per tutti gli utenti, a blocchi
+            operations = []
+            async for user in self.collection.find({}, {"name_normalized": 1}):
+                operations += self._term_upserts(user["_id"], user.get("name_normalized") or [])
+                if len(operations) >= USER_NAME_TERMS_BATCH_SIZE:
+                    await self.name_terms.bulk_write(operations, ordered=False)
+                    operations = []
+            if operations:
+                await self.name_terms.bulk_write(operations, ordered=False)
+
+    @staticmethod
+    def _term_upserts(user_id: str, terms: list):
+        return [
+            UpdateOne({"term": term, "user_id": user_id}, {"$set": {"user_id": user_id}}, upsert=True)
+            for term in dict.fromkeys(terms)
+        ]
+
+    async def _index_name(self, user_id: str, terms: list):
+        """
+        Allinea le voci di user_name_terms dell'utente ai suffissi del suo nome.
+        """
+        operations = [DeleteMany({"user_id": user_id, "term": {"$nin": list(dict.fromkeys(terms))}})]
+        operations += self._term_upserts(user_id, terms)
+        await self.name_terms.bulk_write(operations, ordered=False)
+
+    @staticmethod
+    def encode_search_cursor(*position):
+        """
+        Restituisce il cursore opaco della ricerca: ("email", email) o ("name", term, email).
+        """
+        return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def decode_search_cursor(cursor: str):
+        """
+        Decodifica un cursore creato da encode_search_cursor.
+        Raises:
+            ValueError: Se il cursore non è valido.
+        """
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        except (ValueError, UnicodeError) as e:
+            raise ValueError(f"Invalid cursor: {e}")
+        if (
+            not isinstance(position, list)
+            or not all(isinstance(item, str) for item in position)
+            or position[:1] not in (["email"], ["name"])
+            or len(position) != (2 if position[0] == "email" else 3)
+        ):
+            raise ValueError("Invalid cursor")
+        return position
 
     async def get_users(self):
         return await self.collection.find().to_list(length=None)
@@ -20,16 +116,117 @@ class UserRepository:
     async def get_by_email(self, user_id: EmailStr):
         return await self.collection.find_one({"_id": user_id})
 
+    async def search_users(self, query: str, limit: int = 20, after: str = None):
+        """
+        Cerca gli utenti la cui email o una parola del nome inizia con query.
+
+        Prima vengono restituiti gli utenti trovati per email, ordinati per email (indice _id), poi quelli
+        trovati per nome, ordinati per parola del nome ed email (indice di user_name_terms): entrambe le
+        ricerche leggono l'indice nell'ordine richiesto e si fermano dopo limit voci, senza ordinamenti in memoria.
+        Args:
+            query (str): Il prefisso da cercare.
+            limit (int): Numero massimo di risultati (al più USER_SEARCH_MAX_LIMIT).
+            after (str): Il cursore restituito dalla pagina precedente.
+        Returns:
+            tuple: La lista degli utenti trovati e il cursore della pagina successiva, o None.
+        Raises:
+            ValueError: Se il cursore non è valido.
+        """
+        limit = max(1, min(limit, USER_SEARCH_MAX_LIMIT))
+        terms = normalize_name(query)
+        if not terms:
+            return [], None
+        email_prefix = query.strip().lower()
+        position = self.decode_search_cursor(after) if after else ["email", None]
+
+        users = []
+        if position[0] == "email":
+            email_query = {"_id": {"$regex": "^" + re.escape(email_prefix)}}
+            if position[1]:
+                email_query["_id"]["$gt"] = position[1]
+            users = (
+                await self.collection.find(email_query, USER_SEARCH_PROJECTION)
+                .sort("_id", 1)
+                .limit(limit)
+                .to_list(length=limit)
+            )
+            if len(users) == limit:
+                return users, self.encode_search_cursor("email", users[-1]["_id"])
+            position = ["name", None, None]
+
+        remaining = limit - len(users)
+        name_query = {"term": {"$regex": "^" + re.escape(terms[0])}}
+        if position[1] is not None:
+            name_query["$or"] = [
+                {"term": {"$gt": position[1]}},
+                {"term": position[1], "user_id": {"$gt": position[2]}},
+            ]
+        entries = (
+            await self.name_terms.find(name_query, {"_id": 0, "term": 1, "user_id": 1})
+            .sort([("term", 1), ("user_id", 1)])
+            .limit(remaining)
+            .to_list(length=remaining)
+        )
+        # Gli utenti la cui email inizia con query sono già stati restituiti dalla ricerca per email
+        user_ids = [
+            user_id
+            for user_id in dict.fromkeys(entry["user_id"] for entry in entries)
+            if not user_id.startswith(email_prefix)
+        ]
+        if user_ids:
+            found = {
+                user["_id"]: user
+                for user in await self.collection.find(
+                    {"_id": {"$in": user_ids}}, USER_SEARCH_PROJECTION
+                ).to_list(length=len(user_ids))
+            }
+            users += [found[user_id] for user_id in user_ids if user_id in found]
+
+        next_cursor = None
+        if len(entries) == remaining:
+            next_cursor = self.encode_search_cursor("name", entries[-1]["term"], entries[-1]["user_id"])
+        return users, next_cursor
+
+    async def iter_user_emails(self, after: str = None, batch_size: int = 100):
+        """
+        Scorre le email di tutti gli utenti in ordine crescente, a blocchi di batch_size.
+
+        Ogni blocco è una query a sé che riparte dall'ultima email del blocco precedente: tra due blocchi
+        chi chiama può impiegare molto tempo (es. invii a velocità limitata) e un cursore aperto sul
+        server scadrebbe dopo 10 minuti di inattività.
+        Args:
+            after (str): Se presente, restituisce solo le email successive a questa (punto di ripresa).
+            batch_size (int): Numero di email per blocco.
+        """
+        while True:
+            query = {"_id": {"$gt": after}} if after else {}
+            users = (
+                await self.collection.find(query, {"_id": 1})
+                .sort("_id", 1)
+                .limit(batch_size)
+                .to_list(length=batch_size)
+            )
+            if not users:
+                return
+            batch = [user["_id"] for user in users]
+            yield batch
+            if len(batch) < batch_size:
+                return
+            after = batch[-1]
+
     async def create_user(self, user_data: schemas.User):
-        return await self.collection.insert_one(user_data)
+        result = await self.collection.insert_one(user_data)
+        await self._index_name(user_data["_id"], user_data.get("name_normalized") or [])
+        return result
 
     async def add_test_user(self):
-        print("Adding test user")
+        logger.info("Adding test user")
         try:
-            return await self.collection.insert_one(
+            return await self.create_user(
                 {
                     "_id": "test@test.it",
                     "name": "Test User",
+                    "name_normalized": normalize_name("Test User"),
                     "hashed_password": get_password_hash("testtest"),
                     "is_initialized": False,
                     "remember_me": False,
@@ -37,16 +234,17 @@ class UserRepository:
                 }
             )
         except Exception as e:
-            print(f"Error adding test user: {e}")
+            logger.error("Error adding test user: %s", e)
             return None
 
     async def add_test_admin(self):
-        print("Adding test admin")
+        logger.info("Adding test admin")
         try:
-            return await self.collection.insert_one(
+            return await self.create_user(
                 {
                     "_id": os.getenv("ADMIN_EMAIL") or "admin@test.it",
                     "name": "Test Admin",
+                    "name_normalized": normalize_name("Test Admin"),
                     "hashed_password": get_password_hash(os.getenv("ADMIN_PASSWORD") or "admin"),
                     "is_initialized": True,
                     "remember_me": False,
@@ -54,7 +252,7 @@ class UserRepository:
                 }
             )
         except Exception as e:
-            print(f"Error adding test admin: {e}")
+            logger.error("Error adding test admin: %s", e)
             return None
 
     async def get_test_user(self):
@@ -85,64 +283,96 @@ class UserRepository:
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found",
             )
+        await self.name_terms.delete_many({"user_id": user_id})
 
-    async def update_user(self, user_id: EmailStr, user_data: schemas.UserUpdate):
+    async def update_user(
+        self,
+        user_id: EmailStr,
+        user_data: schemas.UserUpdate,
+        fresh_password: bool = False,
+    ):
         """
-        Aggiorna un utente esistente nel database.
+        Aggiorna un utente esistente nel database con un solo find_one_and_update condizionale.
+        Il filtro seleziona l'utente solo se almeno uno dei campi forniti è diverso da quello salvato.
         Args:
             user_id (EmailStr): L'email (_id) dell'utente da aggiornare.
             user_data (schemas.UserUpdate): I nuovi dati dell'utente.
+            fresh_password (bool): True se la password è appena stata generata (es. reset): il confronto
+                con l'hash attuale viene saltato perché la password è sicuramente diversa.
         Returns:
-            UpdateResult: The result of the update operation, or None if no changes were made.
+            dict: Il documento dell'utente dopo l'aggiornamento.
         Raises:
             HTTPException: If user not found (404) or if provided data matches existing (304).
         """
-        # Controlla se l'utente esiste
-        user_current_data = await self.get_by_email(user_id)
-        if not user_current_data:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-  
         provided_data = user_data.model_dump(exclude_unset=True, exclude_none=True)
         if not provided_data:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="No data provided for update.",
             )
+
+        # Campi confrontabili direttamente nel filtro della query
+        changes = {
+            field: getattr(user_data, field)
+            for field in ("name", "is_initialized", "remember_me", "scopes")
+            if getattr(user_data, field) is not None
+        }
+
         # Prepara il payload di aggiornamento
-        update_payload = {}
+        update_payload = dict(changes)
+        if "name" in changes:
+            update_payload["name_normalized"] = normalize_name(changes["name"])
         if user_data.password is not None:
-            if not verify_password(user_data.password, user_current_data.get("hashed_password")):
+            if fresh_password:
                 update_payload["hashed_password"] = get_password_hash(user_data.password)
-        
-        if (user_data.is_initialized is not None and user_data.is_initialized != user_current_data.get("is_initialized")):
-            update_payload["is_initialized"] = user_data.is_initialized
-        if (user_data.remember_me is not None and user_data.remember_me != user_current_data.get("remember_me")):
-            update_payload["remember_me"] = user_data.remember_me
-        if user_data.scopes is not None and user_data.scopes != user_current_data.get("scopes"):
-            update_payload["scopes"] = user_data.scopes
-        if user_data.name is not None and user_data.name != user_current_data.get("name"):
-            update_payload["name"] = user_data.name
-            
-        print(f"[USER REPO] Update payload: {update_payload}")
-        if not update_payload or len(update_payload) == 0:
-            print("empty update payload")
+            else:
+                # L'hash bcrypt non è confrontabile in una query: serve leggere quello attuale
+                user_current_data = await self.collection.find_one(
+                    {"_id": user_id}, {"hashed_password": 1}
+                )
+                if not user_current_data:
+                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+                if not verify_password(user_data.password, user_current_data.get("hashed_password")):
+                    update_payload["hashed_password"] = get_password_hash(user_data.password)
+
+        logger.debug("Update payload: %s", list(update_payload))
+        if not update_payload:
+            logger.debug("empty update payload")
             raise HTTPException(
                 status_code=status.HTTP_304_NOT_MODIFIED,
                 detail="User data provided matches existing data. No update performed.",
             )
 
+        query = {"_id": user_id}
+        if "hashed_password" not in update_payload:
+            # Aggiorna solo se almeno un campo è diverso dal valore salvato
+            query["$or"] = [{field: {"$ne": value}} for field, value in changes.items()]
+
         try:
-            result = await self.collection.update_one(
-                {"_id": user_id}, {"$set": update_payload}
+            result = await self.collection.find_one_and_update(
+                query,
+                {"$set": update_payload},
+                return_document=ReturnDocument.AFTER,
             )
-            return result
         except Exception as e:
-            print(f"Error updating user in repository: {e}")
+            logger.error("Error updating user in repository: %s", e)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Failed to update user: {e}",
             )
 
+        if result is None:
+            # Nessun documento selezionato: l'utente non esiste oppure i dati sono già aggiornati
+            if not await self.collection.count_documents({"_id": user_id}, limit=1):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+            raise HTTPException(
+                status_code=status.HTTP_304_NOT_MODIFIED,
+                detail="User data provided matches existing data. No update performed.",
+            )
+        if "name_normalized" in update_payload:
+            await self._index_name(user_id, update_payload["name_normalized"])
+        return result
+
 
 def get_user_repository(db: AsyncIOMotorDatabase = Depends(get_db)):
     """
@@ -0,0 +1,147 @@
+import os
+import types
+from functools import lru_cache
+from typing import List, Union
+
+import orjson
+from bson import ObjectId
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, TypeAdapter
+from typing_extensions import Annotated, NotRequired, TypedDict, get_args, get_origin
+
+# X | Y (types.UnionType) esiste solo da Python 3.10
+UnionType = getattr(types, "UnionType", Union)
+
+# Le date UTC terminano con "Z", come nella serializzazione di pydantic
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def orjson_default(value):
+    """
+    Converte i tipi che orjson non gestisce da solo (datetime, UUID e dataclass sono nativi).
+    """
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=orjson_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(ORJSONResponse):
+    """
+    Risposta JSON serializzata con orjson, con supporto diretto per ObjectId.
+    Usata come classe di risposta predefinita dell'applicazione.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+# Se attivo le risposte delle rotte con serializzazione rapida vengono validate con i modelli (utile nei test)
+STRICT_RESPONSE_VALIDATION = os.getenv("STRICT_RESPONSE_VALIDATION", "false").lower() in ("1", "true", "yes")
+
+
+@lru_cache(maxsize=None)
+def _trusted_typed_dict(model):
+    """
+    Costruisce un TypedDict con le stesse chiavi (alias) e tipi del modello: il suo serializzatore
+    lavora direttamente sui dict del database e ignora le chiavi non presenti nel modello.
+    """
+    fields = {}
+    for name, field in model.model_fields.items():
+        annotation = field.annotation
+        if field.metadata:
+            annotation = Annotated[(annotation, *field.metadata)]
+        annotation = _trusted_type(annotation)
+        fields[field.alias or name] = annotation if field.is_required() else NotRequired[annotation]
+    return TypedDict(f"{model.__name__}Trusted", fields)
+
+
+def _trusted_type(annotation):
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return _trusted_typed_dict(annotation)
+    origin = get_origin(annotation)
+    if origin is Annotated:
+        return Annotated[(_trusted_type(annotation.__origin__), *annotation.__metadata__)]
+    if origin in (list, Union, UnionType):
+        args = tuple(_trusted_type(arg) for arg in get_args(annotation))
+        return List[args[0]] if origin is list else Union[args]
+    return annotation
+
+
+def _defaults_plan(annotation):
+    """
+    Precalcola dove vanno aggiunti i valori predefiniti dei campi mancanti (None se non serve mai).
+    """
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        defaults = {
+            field.alias or name: field
+            for name, field in annotation.model_fields.items()
+            if not field.is_required()
+        }
+        nested = {}
+        for name, field in annotation.model_fields.items():
+            plan = _defaults_plan(field.annotation)
+            if plan is not None:
+                nested[field.alias or name] = plan
+        return ("model", defaults, nested) if defaults or nested else None
+    origin = get_origin(annotation)
+    if origin is list:
+        plan = _defaults_plan(get_args(annotation)[0])
+        return ("list", plan) if plan is not None else None
+    if origin in (Union, UnionType, Annotated):
+        for arg in get_args(annotation):
+            plan = _defaults_plan(arg)
+            if plan is not None:
+                return plan
+    return None
+
+
+def _fill_defaults(plan, value):
+    if plan is None:
+        return value
+    if plan[0] == "list":
+        return [_fill_defaults(plan[1], item) for item in value] if isinstance(value, list) else value
+    if not isinstance(value, dict):
+        return value
+    _, defaults, nested = plan
+    missing = defaults.keys() - value.keys()
+    if not missing and not nested:
+        return value
+    # Copia: i dict possono arrivare da una cache e non vanno modificati
+    value = dict(value)
+    for key in missing:
+        value[key] = defaults[key].get_default(call_default_factory=True)
+    for key, nested_plan in nested.items():
+        if key in value:
+            value[key] = _fill_defaults(nested_plan, value[key])
+    return value
+
+
+class TrustedSerializer:
+    """
+    Serializza in JSON i dati letti dal database con la forma del modello di risposta, senza validarli.
+
+    I dati del repository sono già conformi ai modelli, quindi la validazione di FastAPI (campo per campo,
+    email comprese) è solo un costo: qui si usa un serializzatore precompilato su un TypedDict equivalente,
+    che mantiene solo i campi del modello, usa gli alias e aggiunge i valori predefiniti dei campi mancanti.
+    Con STRICT_RESPONSE_VALIDATION i dati vengono invece validati come farebbe FastAPI.
+    """
+
+    def __init__(self, annotation):
+        self.strict_adapter = TypeAdapter(annotation)
+        self.adapter = TypeAdapter(_trusted_type(annotation))
+        self.defaults = _defaults_plan(annotation)
+
+    def dump_json(self, value) -> bytes:
+        if STRICT_RESPONSE_VALIDATION:
+            return self.strict_adapter.dump_json(self.strict_adapter.validate_python(value), by_alias=True)
+        return self.adapter.dump_json(_fill_defaults(self.defaults, value), warnings=False)
+
+    def response(self, value, **kwargs) -> Response:
+        return Response(content=self.dump_json(value), media_type="application/json", **kwargs)
@@ -1,3 +1,4 @@
+import logging
 import os
 from fastapi import APIRouter, Depends, HTTPException, status
 from datetime import datetime, timedelta, timezone
@@ -17,6 +18,9 @@ from app.repositories.user_repository import UserRepository, get_user_repository
 import app.schemas as schemas
 from app.utils import verify_password
 from app.auth_roles import AccessRoles
+from app.service.activity_tracker import activity_tracker
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
@@ -34,10 +38,10 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def security_check(): # pragma: no cover
     if SECRET_KEY_JWT == "$2b$12$zqt9Rgv1PzORjG5ghJSb6OSdYrt7f7cLc38a21DgX/DMyqt80AUCi":
-        print(
-            "WARNING: SECRET_KEY_JWT is not set. Using default value for development purposes only."
+        logger.warning(
+            "SECRET_KEY_JWT is not set. Using default value for development purposes only. "
+            "Please set SECRET_KEY_JWT in your environment variables."
         )
-        print("Please set SECRET_KEY_JWT in your environment variables.")
 security_check()
 
 
@@ -107,7 +111,7 @@ def verify_token(token: str, required_scopes: List[str] = None):
 
         if required_scopes:
             user_permissions = payload.get("scopes", [])
-            print(f"User permissions: {user_permissions}")
+            logger.debug("User permissions: %s", user_permissions)
             if not any(scope in user_permissions for scope in required_scopes):
                 raise HTTPException(
                     status_code=403,
@@ -122,14 +126,18 @@ def verify_user(token: str = Depends(oauth2_scheme)):
     """
     Verifica la validità del token JWT e restituisce il payload decodificato.
     """
-    return verify_token(token)
+    payload = verify_token(token)
+    activity_tracker.touch(payload.get("sub"))
+    return payload
 
 
 def verify_admin(token: str = Depends(oauth2_scheme)):
     """
     Verifica la validità del token JWT e restituisce il payload decodificato.
     """
-    return verify_token(token, required_scopes=AccessRoles.ADMIN)
+    payload = verify_token(token, required_scopes=AccessRoles.ADMIN)
+    activity_tracker.touch(payload.get("sub"))
+    return payload
 
 
 @router.post("/token", response_model=schemas.Token)
@@ -166,6 +174,8 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    activity_tracker.touch(user.get("_id"), login=True)
+
     # Ottieni i permessi dell'utente
     user_permissions = user.get("scopes", ["user"])
 
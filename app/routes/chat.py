@@ -1,3 +1,4 @@
+import logging
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List
 from bson import ObjectId
@@ -6,16 +7,22 @@ from typing import Optional
 
 from app.repositories.chat_repository import ChatRepository, get_chat_repository
 import app.schemas as schemas
+from app.responses import TrustedSerializer
 from app.routes.auth import (
     verify_user,
     verify_admin,
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/chats",
     tags=["chat"],
 )
 
+# Serializzazione senza validazione dei messaggi letti dal database (vedi TrustedSerializer)
+chat_messages_serializer = TrustedSerializer(schemas.ChatMessages)
+
 
 @router.get(
     "/new_chat",
@@ -214,7 +221,7 @@ async def get_chat_messages(
         "messages": existing_chat.get("messages", []),
     }
 
-    return result
+    return chat_messages_serializer.response(result)
 
 
 @router.patch("/{chat_id}/messages/{message_id}/rating")
@@ -251,7 +258,7 @@ async def rate_message(
             ObjectId(chat_id), ObjectId(message_id), rating_data.rating
         )
 
-        print(f"Result: {result}")
+        logger.debug("Result: %s", result)
         if result.matched_count == 0:
             raise HTTPException(
                 status_code=404,
@@ -1,6 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+import json
+import logging
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+import os
 from bson import ObjectId
+from gridfs.errors import NoFile
 from pymongo.errors import DuplicateKeyError
 
 from app.repositories.user_repository import UserRepository
@@ -11,14 +16,32 @@ from app.routes.auth import (
     authenticate_user,
     get_user_repository,
 )
-from app.utils import get_object_id
-from app.repositories.document_repository import get_document_repository
+from app.utils import get_object_id, parse_byte_range, make_etag, etag_matches
+from app.repositories.document_file_repository import (
+    DocumentFileRepository,
+    get_document_file_repository,
+)
+from app.repositories.document_repository import (
+    DocumentRepository,
+    get_document_repository,
+    INGESTION_LEASE_SECONDS,
+)
+from app.repositories.sync_repository import SyncTokenExpired, SYNC_CHANGES_MAX_LIMIT
+from app.responses import TrustedSerializer
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/documents",
     tags=["document"],
 )
 
+# Header Cache-Control di GET /documents: no-cache obbliga il client a rivalidare con If-None-Match
+DOCUMENTS_CACHE_CONTROL = os.getenv("DOCUMENTS_CACHE_CONTROL", "private, no-cache")
+
+# Serializzazione senza validazione dei documenti letti dal database (vedi TrustedSerializer)
+documents_serializer = TrustedSerializer(List[schemas.DocumentResponse])
+
 
 
 @router.post("", status_code=status.HTTP_201_CREATED)
@@ -54,33 +77,112 @@ async def upload_document(
         )
 
 
+@router.post(
+    "/batch",
+    status_code=status.HTTP_201_CREATED,
+    response_model=schemas.DocumentBatchResult,
+)
+async def upload_documents(
+    documents: List[schemas.Document],
+    current_user=Depends(verify_admin),
+    document_repository=Depends(get_document_repository),
+):
+    """
+    Registra più documenti con un'unica scrittura.
+
+    I documenti con lo stesso percorso file vengono registrati una volta sola; quelli già presenti
+    nel database non vengono modificati.
+
+    ### Args:
+    * **documents (List[schemas.Document])**: I documenti da registrare.
+
+    ### Returns:
+    * **created**: Gli ID dei documenti registrati.
+    * **existing**: Gli ID dei documenti già presenti.
+
+    ### Raises:
+    * **HTTPException.HTTP_500_INTERNAL_SERVER_ERROR**: Se si verifica un errore durante l'inserimento.
+    """
+    try:
+        created, existing = await document_repository.insert_documents(
+            owner_email=current_user.get("sub"), documents=documents
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Registrazione dei documenti fallita: {e}",
+        )
+
+    return {
+        "created": [str(document_id) for document_id in created],
+        "existing": [str(document_id) for document_id in existing],
+    }
+
+
 @router.get(
     "", response_model=List[schemas.DocumentResponse]
 )
 async def get_documents(
+    request: Request,
+    limit: int = Query(100, ge=1, le=500, description="Numero massimo di documenti"),
+    cursor: Optional[str] = Query(None, description="Cursore restituito nell'header X-Next-Cursor"),
+    owner_email: Optional[str] = Query(None, description="Email di chi ha caricato il documento"),
+    uploaded_from: Optional[str] = Query(None, description="Data minima di caricamento (YYYY-MM-DD)"),
+    uploaded_to: Optional[str] = Query(None, description="Data massima di caricamento (YYYY-MM-DD)"),
+    title_prefix: Optional[str] = Query(None, description="Prefisso del titolo"),
     current_user=Depends(verify_admin),
     document_repository=Depends(get_document_repository),
 ):
     """
-    Restituisce la lista di tutti i documenti.
+    Restituisce una pagina di documenti, dal più recente al meno recente.
+
+    Se esistono altri documenti, il cursore per la pagina successiva viene restituito nell'header **X-Next-Cursor**.
+    L'ETag è calcolato dalla versione dei documenti e dai parametri della richiesta: se l'header
+    If-None-Match lo contiene la risposta è 304 senza leggere i documenti.
+
+    ### Args:
+    * **limit**: Numero massimo di documenti (massimo 500).
+    * **cursor**: Il cursore della pagina successiva.
+    * **owner_email**: Filtra per email di chi ha caricato il documento.
+    * **uploaded_from**, **uploaded_to**: Filtrano per data di caricamento (YYYY-MM-DD, estremi inclusi).
+    * **title_prefix**: Filtra per prefisso del titolo.
 
     ### Returns:
     * **List[schemas.DocumentResponse]**: La lista dei documenti.
 
     ### Raises:
-    * **HTTPException.HTTP_404_NOT_FOUND**: Se non ci sono documenti nel database.
+    * **HTTPException.HTTP_400_BAD_REQUEST**: Se le date o il cursore non sono validi.
     * **HTTPException.HTTP_500_INTERNAL_SERVER_ERROR**: Se si verifica un errore durante il recupero dei documenti.
     """
+    # La versione viene letta prima dei documenti: una modifica successiva cambia l'ETag della richiesta seguente
+    version = await document_repository.get_version()
+    etag = make_etag(
+        json.dumps([version, limit, cursor, owner_email, uploaded_from, uploaded_to, title_prefix])
+    )
+    headers = {"Cache-Control": DOCUMENTS_CACHE_CONTROL, "ETag": etag}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
-    documents = await document_repository.get_documents()
-
-    # if not documents:
-    #     raise HTTPException(
-    #         status_code=status.HTTP_404_NOT_FOUND,
-    #         detail="Nessun documento trovato",
-    #     )
+    try:
+        documents = await document_repository.get_documents(
+            limit=limit,
+            cursor=cursor,
+            owner_email=owner_email,
+            uploaded_from=uploaded_from,
+            uploaded_to=uploaded_to,
+            title_prefix=title_prefix,
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Parametri non validi: {e}",
+        )
 
-    return documents
+    if len(documents) == limit:
+        headers["X-Next-Cursor"] = DocumentRepository.encode_cursor(documents[-1])
+    return Response(
+        content=documents_serializer.dump_json(documents), media_type="application/json", headers=headers
+    )
 
 
 @router.delete("", status_code=status.HTTP_204_NO_CONTENT)
@@ -129,8 +231,332 @@ async def delete_document(
                 detail="Documento non trovato",
             )
     except Exception as e:
-        print(f"Error deleting document: {e}")
+        logger.error("Error deleting document: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Eliminazione del file fallita: {e}",
         )
+
+
+@router.delete("/batch", response_model=schemas.DocumentBatchDeleteResult)
+async def delete_documents(
+    files: schemas.DocumentBatchDelete,
+    admin: schemas.UserAuth,
+    current_user=Depends(verify_admin),
+    document_repository=Depends(get_document_repository),
+    user_repository: UserRepository = Depends(get_user_repository),
+):
+    """
+    Elimina più documenti con un'unica verifica delle credenziali.
+
+    ### Args:
+    * **files (schemas.DocumentBatchDelete)**: Gli id dei documenti da eliminare.
+    * **admin (schemas.UserAuth)**: Le credenziali dell'amministratore.
+
+    ### Returns:
+    * **schemas.DocumentBatchDeleteResult**: Gli id eliminati e quelli non trovati (o non validi).
+
+    ### Raises:
+    * **HTTPException.HTTP_401_UNAUTHORIZED**: Se le credenziali non sono valide.
+    * **HTTPException.HTTP_403_FORBIDDEN**: Se le credenziali non corrispondono all'admin loggato.
+    * **HTTPException.HTTP_500_INTERNAL_SERVER_ERROR**: Se si verifica un errore durante l'eliminazione.
+    """
+    valid_user = await authenticate_user(
+        current_user.get("sub"), admin.current_password, user_repository
+    )
+    if not valid_user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Credenziali non valide",
+        )
+    if valid_user.get("_id") != current_user.get("sub"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Credentials do not match the logged-in admin",
+        )
+
+    invalid = [document_id for document_id in files.ids if not ObjectId.is_valid(document_id)]
+    try:
+        deleted, missing = await document_repository.delete_documents(
+            [ObjectId(document_id) for document_id in files.ids if ObjectId.is_valid(document_id)]
+        )
+    except Exception as e:
+        logger.error("Error deleting documents: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Eliminazione dei file fallita: {e}",
+        )
+
+    return {
+        "deleted": [str(document_id) for document_id in deleted],
+        "missing": [str(document_id) for document_id in missing] + invalid,
+    }
+
+
+@router.get("/changes", response_model=schemas.SyncChanges)
+async def get_document_changes(
+    since: Optional[str] = None,
+    limit: int = Query(SYNC_CHANGES_MAX_LIMIT, ge=1, le=SYNC_CHANGES_MAX_LIMIT),
+    current_user=Depends(verify_user),
+    document_repository=Depends(get_document_repository),
+):
+    """
+    Restituisce gli id dei documenti inseriti, modificati ed eliminati dopo il token since.
+
+    Senza since restituisce tutti gli id come inseriti. Il client salva il token restituito e lo
+    passa alla richiesta successiva; finché has_more è true ci sono altre modifiche da leggere.
+
+    ### Args:
+    * **since**: Il token restituito dalla richiesta precedente.
+    * **limit**: Numero massimo di modifiche restituite.
+
+    ### Returns:
+    * **result (schemas.SyncChanges)**: Gli id inseriti, modificati ed eliminati e il nuovo token.
+
+    ### Raises:
+    * **HTTPException.HTTP_400_BAD_REQUEST**: Se il token non è valido.
+    * **HTTPException.HTTP_410_GONE**: Se il token è troppo vecchio ed è necessaria una sincronizzazione completa.
+    """
+    try:
+        return await document_repository.get_changes(since=since, limit=limit)
+    except SyncTokenExpired:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Sync token expired, a full resync is required",
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
+
+
+@router.post("/ingestion/claim", response_model=schemas.DocumentResponse)
+async def claim_document(
+    lease: schemas.IngestionLease,
+    current_user=Depends(verify_admin),
+    document_repository=Depends(get_document_repository),
+):
+    """
+    Assegna al worker il prossimo documento da ingerire.
+
+    Il documento resta assegnato al worker fino alla scadenza del lease; se il worker non conclude
+    (o non rinnova il lease) in tempo, il documento torna disponibile per gli altri worker.
+
+    ### Args:
+    * **lease (schemas.IngestionLease)**: L'identificativo del worker e la durata del lease in secondi.
+
+    ### Returns:
+    * **schemas.DocumentResponse**: Il documento assegnato.
+    * **204 No Content**: Se non ci sono documenti da ingerire.
+    """
+    document = await document_repository.claim_document(
+        lease.worker_id, lease.lease_seconds or INGESTION_LEASE_SECONDS
+    )
+    if not document:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    return document
+
+
+async def _update_ingestion(document_id: str, update):
+    """
+    Esegue un aggiornamento dello stato di ingestione e solleva 409 se il worker ha perso il lease.
+    """
+    if not ObjectId.is_valid(document_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Documento non trovato")
+    if not await update(ObjectId(document_id)):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Il lease del documento non appartiene al worker o è scaduto",
+        )
+
+
+@router.post("/{document_id}/ingestion/renew", status_code=status.HTTP_204_NO_CONTENT)
+async def renew_ingestion_lease(
+    document_id: str,
+    lease: schemas.IngestionLease,
+    current_user=Depends(verify_admin),
+    document_repository=Depends(get_document_repository),
+):
+    """
+    Prolunga il lease del worker sul documento.
+
+    ### Args:
+    * **document_id**: L'ID del documento.
+    * **lease (schemas.IngestionLease)**: L'identificativo del worker e la nuova durata del lease in secondi.
+
+    ### Raises:
+    * **HTTPException.HTTP_409_CONFLICT**: Se il worker non possiede più il lease.
+    """
+    await _update_ingestion(
+        document_id,
+        lambda _id: document_repository.renew_lease(
+            _id, lease.worker_id, lease.lease_seconds or INGESTION_LEASE_SECONDS
+        ),
+    )
+
+
+@router.post("/{document_id}/ingestion/complete", status_code=status.HTTP_204_NO_CONTENT)
+async def complete_ingestion(
+    document_id: str,
+    lease: schemas.IngestionLease,
+    current_user=Depends(verify_admin),
+    document_repository=Depends(get_document_repository),
+):
+    """
+    Segna il documento come ingerito.
+
+    ### Args:
+    * **document_id**: L'ID del documento.
+    * **lease (schemas.IngestionLease)**: L'identificativo del worker.
+
+    ### Raises:
+    * **HTTPException.HTTP_409_CONFLICT**: Se il worker non possiede più il lease.
+    """
+    await _update_ingestion(
+        document_id,
+        lambda _id: document_repository.complete_ingestion(_id, lease.worker_id),
+    )
+
+
+@router.post("/{document_id}/ingestion/fail", status_code=status.HTTP_204_NO_CONTENT)
+async def fail_ingestion(
+    document_id: str,
+    failure: schemas.IngestionFailure,
+    current_user=Depends(verify_admin),
+    document_repository=Depends(get_document_repository),
+):
+    """
+    Segnala un errore di ingestione: il documento torna in attesa o, esauriti i tentativi, passa a failed.
+
+    ### Args:
+    * **document_id**: L'ID del documento.
+    * **failure (schemas.IngestionFailure)**: L'identificativo del worker e l'errore.
+
+    ### Raises:
+    * **HTTPException.HTTP_409_CONFLICT**: Se il worker non possiede più il lease.
+    """
+    await _update_ingestion(
+        document_id,
+        lambda _id: document_repository.fail_ingestion(_id, failure.worker_id, failure.error),
+    )
+
+
+@router.put(
+    "/{document_id}/content",
+    response_model=schemas.DocumentContentResult,
+)
+async def upload_document_content(
+    document_id: str,
+    request: Request,
+    current_user=Depends(verify_admin),
+    document_repository=Depends(get_document_repository),
+    document_file_repository: DocumentFileRepository = Depends(get_document_file_repository),
+):
+    """
+    Carica il contenuto di un documento già registrato.
+
+    Il corpo della richiesta contiene i byte del file (non multipart) e viene salvato su GridFS
+    a blocchi, senza mai tenere in memoria l'intero file. File con lo stesso contenuto vengono salvati una volta sola.
+
+    ### Args:
+    * **document_id**: L'ID del documento.
+
+    ### Returns:
+    * **schemas.DocumentContentResult**: ID del file, SHA-256, dimensione e se il contenuto era già presente.
+
+    ### Raises:
+    * **HTTPException.HTTP_404_NOT_FOUND**: Se il documento non esiste.
+    * **HTTPException.HTTP_500_INTERNAL_SERVER_ERROR**: Se si verifica un errore durante il caricamento.
+    """
+    if not ObjectId.is_valid(document_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Documento non trovato")
+    document = await document_repository.get_document_by_id(ObjectId(document_id))
+    if not document:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Documento non trovato")
+
+    content_type = request.headers.get("content-type", "application/octet-stream")
+    try:
+        file_info = await document_file_repository.upload(
+            filename=document.get("file_path"),
+            chunks=request.stream(),
+            content_type=content_type,
+        )
+        await document_repository.set_document_file(document["_id"], file_info, content_type)
+    except Exception as e:
+        logger.error("Error uploading document content: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Upload del file fallito: {e}",
+        )
+
+    return {**file_info, "file_id": str(file_info["file_id"])}
+
+
+@router.get("/{document_id}/content")
+async def download_document_content(
+    document_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    current_user=Depends(verify_admin),
+    document_repository=Depends(get_document_repository),
+    document_file_repository: DocumentFileRepository = Depends(get_document_file_repository),
+):
+    """
+    Scarica il contenuto di un documento, a blocchi e senza caricarlo interamente in memoria.
+
+    Supporta l'header HTTP **Range** con un singolo intervallo di byte (risposta 206 Partial Content).
+
+    ### Args:
+    * **document_id**: L'ID del documento.
+
+    ### Raises:
+    * **HTTPException.HTTP_404_NOT_FOUND**: Se il documento o il suo contenuto non esistono.
+    * **HTTPException.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE**: Se l'intervallo richiesto non è valido.
+    """
+    if not ObjectId.is_valid(document_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Documento non trovato")
+    document = await document_repository.get_document_by_id(ObjectId(document_id))
+    if not document or not document.get("file_id"):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contenuto del documento non trovato")
+
+    try:
+        grid_out = await document_file_repository.open_download(document["file_id"])
+    except NoFile:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contenuto del documento non trovato")
+    total_length = grid_out.length
+
+    try:
+        byte_range = parse_byte_range(range_header, total_length)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Intervallo non valido",
+            headers={"Content-Range": f"bytes */{total_length}"},
+        )
+
+    start, end = byte_range if byte_range else (0, total_length - 1)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(end - start + 1),
+    }
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{total_length}"
+    if start:
+        await grid_out.seek(start)
+
+    async def stream_content():
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await grid_out.readchunk()
+            if not chunk:
+                break
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+            yield chunk
+
+    return StreamingResponse(
+        stream_content(),
+        status_code=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+        media_type=document.get("content_type") or "application/octet-stream",
+        headers=headers,
+    )
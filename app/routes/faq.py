@@ -1,16 +1,52 @@
-from fastapi import APIRouter, status, Depends, HTTPException
+import gzip
+import os
+from fastapi import APIRouter, status, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from pymongo.errors import DuplicateKeyError
 from bson import ObjectId
 
 import app.schemas as schemas
-from typing import List
-from app.repositories.faq_repository import FaqRepository, get_faq_repository
+from typing import List, Optional
+from app.repositories.faq_repository import FaqRepository, get_faq_repository, FAQ_SEARCH_MAX_LIMIT
 from app.repositories.user_repository import UserRepository, get_user_repository
+from app.repositories.sync_repository import SyncTokenExpired, SYNC_CHANGES_MAX_LIMIT
+from app.cache import faq_cache
+from app.responses import TrustedSerializer
+from app.utils import make_etag, etag_matches
+from app.service.faq_io import parse_faqs, export_csv, export_ndjson
 from app.routes.auth import verify_admin, authenticate_user, verify_user
 
 router = APIRouter(prefix="/faqs", tags=["faq"])
 
+faq_list_serializer = TrustedSerializer(List[schemas.FAQResponse])
+
+# Header Cache-Control di GET /faqs: no-cache obbliga il client a rivalidare con If-None-Match
+FAQS_CACHE_CONTROL = os.getenv("FAQS_CACHE_CONTROL", "private, no-cache")
+
+# Numero massimo di FAQ in un file di importazione
+FAQ_IMPORT_MAX_ROWS = 10000
+
+
+def cached_response(request: Request, body: dict):
+    """
+    Restituisce il corpo già serializzato, compresso se il client accetta gzip,
+    oppure 304 se il client ha già questa versione (If-None-Match).
+    """
+    use_gzip = "gzip" in request.headers.get("accept-encoding", "")
+    headers = {
+        "Vary": "Accept-Encoding",
+        "Cache-Control": FAQS_CACHE_CONTROL,
+        # La versione compressa è una rappresentazione diversa e ha un ETag diverso
+        "ETag": body["etag_gzip"] if use_gzip else body["etag"],
+    }
+    if etag_matches(request.headers.get("if-none-match"), body["etag"], body["etag_gzip"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=body["gzip"], media_type="application/json", headers=headers)
+    return Response(content=body["json"], media_type="application/json", headers=headers)
+
 
 @router.post("", status_code=status.HTTP_201_CREATED)
 async def create_faq(
@@ -55,18 +91,29 @@ async def create_faq(
 
 @router.get("", response_model=List[schemas.FAQResponse])
 async def get_faqs(
+    request: Request,
     current_user=Depends(verify_user),
     faq_repo: FaqRepository = Depends(get_faq_repository),
 ):
     """
     Restituisce una lista di tutte le FAQ.
 
+    La risposta serializzata (e compressa con gzip) resta in cache finché una FAQ non viene
+    creata, modificata o eliminata. Se l'header If-None-Match contiene l'ETag della versione
+    corrente la risposta è 304 senza corpo.
+
     ### Returns:
     * **result (List[schemas.FAQResponse])**: Lista di FAQ.
 
     ### Raises:
     * **HTTPException.HTTP_404_NOT_FOUND**: Se non ci sono FAQ nel database.
     """
+    body = faq_cache.get()
+    if body is not None:
+        return cached_response(request, body)
+
+    # La versione va letta prima della query, così una modifica concorrente non lascia in cache dati vecchi
+    version = faq_cache.version
     faqs = await faq_repo.get_faqs()
 
     # Ritorna la lista di user se esistente, altrimenti solleva un'eccezione 404
@@ -75,7 +122,170 @@ async def get_faqs(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No faqs found",
         )
-    return faqs
+
+    json_body = faq_list_serializer.dump_json(faqs)
+    etag = make_etag(json_body)
+    body = {
+        "json": json_body,
+        "gzip": gzip.compress(json_body),
+        "etag": etag,
+        "etag_gzip": etag[:-1] + '-gzip"',
+    }
+    faq_cache.set(body, version)
+    return cached_response(request, body)
+
+
+@router.get("/search", response_model=schemas.FAQSearchResponse)
+async def search_faqs(
+    q: str = Query(..., min_length=1, max_length=200, description="Testo da cercare"),
+    limit: int = Query(10, ge=1, le=FAQ_SEARCH_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    current_user=Depends(verify_user),
+    faq_repo: FaqRepository = Depends(get_faq_repository),
+):
+    """
+    Cerca le FAQ per titolo, domanda e risposta, ordinate per rilevanza.
+
+    ### Args:
+    * **q**: Il testo da cercare.
+    * **limit**: Numero massimo di risultati.
+    * **offset**: Numero di risultati da saltare (usare next_offset della pagina precedente).
+
+    ### Returns:
+    * **result (schemas.FAQSearchResponse)**: Le FAQ trovate con il loro punteggio e l'offset della pagina successiva.
+    """
+    results, next_offset = await faq_repo.search_faqs(q, limit=limit, offset=offset)
+    return {"results": results, "next_offset": next_offset}
+
+
+@router.post("/match", response_model=schemas.FAQMatchResponse)
+async def match_faq(
+    request: schemas.FAQMatchRequest,
+    current_user=Depends(verify_user),
+    faq_repo: FaqRepository = Depends(get_faq_repository),
+):
+    """
+    Cerca una FAQ la cui domanda coincide (quasi alla lettera) con quella ricevuta.
+
+    La similarità è il coseno TF-IDF sugli n-grammi di caratteri; se supera la soglia
+    (FAQ_MATCH_THRESHOLD) la FAQ viene restituita e la domanda può essere risposta senza LLM.
+
+    ### Args:
+    * **request (schemas.FAQMatchRequest)**: La domanda dell'utente.
+
+    ### Returns:
+    * **result (schemas.FAQMatchResponse)**: La FAQ trovata (o null) e la similarità migliore.
+    """
+    faq, score = await faq_repo.match_faq(request.question)
+    return {"match": faq, "score": score}
+
+
+@router.post("/import", response_model=schemas.FAQImportResult)
+async def import_faqs(
+    request: Request,
+    current_user=Depends(verify_admin),
+    faq_repo: FaqRepository = Depends(get_faq_repository),
+):
+    """
+    Importa le FAQ da un file NDJSON o CSV inviato come corpo della richiesta.
+
+    Il formato è scelto dal Content-Type (**text/csv** oppure **application/x-ndjson**); le FAQ
+    sono identificate dal titolo: quelle esistenti vengono aggiornate, le altre create, tutte con
+    un'unica scrittura. Se una riga non è valida non viene importato nulla.
+
+    ### Returns:
+    * **result (schemas.FAQImportResult)**: Il numero di FAQ create, aggiornate e invariate.
+
+    ### Raises:
+    * **HTTPException.HTTP_413_REQUEST_ENTITY_TOO_LARGE**: Se il file contiene più di 10000 FAQ.
+    * **HTTPException.HTTP_422_UNPROCESSABLE_ENTITY**: Se il file contiene righe non valide.
+    * **HTTPException.HTTP_500_INTERNAL_SERVER_ERROR**: Se si verifica un errore durante l'importazione.
+    """
+    try:
+        faqs, errors = parse_faqs(await request.body(), request.headers.get("content-type"))
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="The file must be UTF-8 encoded",
+        )
+    if errors:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=errors)
+    if len(faqs) > FAQ_IMPORT_MAX_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {FAQ_IMPORT_MAX_ROWS} FAQs can be imported at once",
+        )
+
+    try:
+        return await faq_repo.import_faqs(faqs, author_email=current_user.get("sub"))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An error occurred: {str(e)}",
+        )
+
+
+@router.get("/export")
+async def export_faqs(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    current_user=Depends(verify_admin),
+    faq_repo: FaqRepository = Depends(get_faq_repository),
+):
+    """
+    Esporta tutte le FAQ in formato NDJSON o CSV, leggendole dal database mentre vengono inviate.
+
+    ### Args:
+    * **format**: ndjson (predefinito) oppure csv.
+    """
+    if format == "csv":
+        return StreamingResponse(
+            export_csv(faq_repo.iter_faqs()),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="faqs.csv"'},
+        )
+    return StreamingResponse(
+        export_ndjson(faq_repo.iter_faqs()),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="faqs.ndjson"'},
+    )
+
+
+@router.get("/changes", response_model=schemas.SyncChanges)
+async def get_faq_changes(
+    since: Optional[str] = None,
+    limit: int = Query(SYNC_CHANGES_MAX_LIMIT, ge=1, le=SYNC_CHANGES_MAX_LIMIT),
+    current_user=Depends(verify_user),
+    faq_repo: FaqRepository = Depends(get_faq_repository),
+):
+    """
+    Restituisce gli id delle FAQ inseriti, modificati ed eliminati dopo il token since.
+
+    Senza since restituisce tutti gli id come inseriti. Il client salva il token restituito e lo
+    passa alla richiesta successiva; finché has_more è true ci sono altre modifiche da leggere.
+
+    ### Args:
+    * **since**: Il token restituito dalla richiesta precedente.
+    * **limit**: Numero massimo di modifiche restituite.
+
+    ### Returns:
+    * **result (schemas.SyncChanges)**: Gli id inseriti, modificati ed eliminati e il nuovo token.
+
+    ### Raises:
+    * **HTTPException.HTTP_400_BAD_REQUEST**: Se il token non è valido.
+    * **HTTPException.HTTP_410_GONE**: Se il token è troppo vecchio ed è necessaria una sincronizzazione completa.
+    """
+    try:
+        return await faq_repo.get_changes(since=since, limit=limit)
+    except SyncTokenExpired:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Sync token expired, a full resync is required",
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
 
 
 @router.patch(
@@ -0,0 +1,79 @@
+import hmac
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+import app.schemas as schemas
+from app.repositories.slow_query_repository import (
+    SLOW_QUERY_MAX_LIMIT,
+    SlowQueryRepository,
+    get_slow_query_repository,
+)
+from app.routes.auth import oauth2_scheme, verify_admin
+from app.service.pool_monitor import pool_monitor
+
+router = APIRouter(prefix="/monitoring", tags=["monitoring"])
+# Endpoint letto da Prometheus, fuori dal prefisso /monitoring per seguire la convenzione
+metrics_router = APIRouter(tags=["monitoring"])
+
+# Token con cui Prometheus può leggere /metrics (Authorization: Bearer <token>); senza, serve un token admin
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+def verify_metrics_access(token: str = Depends(oauth2_scheme)):
+    """
+    Consente la lettura delle metriche con METRICS_TOKEN o con il token JWT di un amministratore.
+    """
+    if METRICS_TOKEN and hmac.compare_digest(token.encode("utf-8"), METRICS_TOKEN.encode("utf-8")):
+        return None
+    return verify_admin(token)
+
+
+@router.get("/pool")
+async def get_pool_stats(
+    current_user=Depends(verify_admin),
+):
+    """
+    Restituisce le statistiche del pool di connessioni a MongoDB.
+
+    ### Returns:
+    * **checkouts**: Numero di connessioni ottenute dal pool.
+    * **checkout_failures**: Numero di richieste che non hanno ottenuto una connessione, per motivo.
+    * **checked_out**: Connessioni attualmente in uso.
+    * **avg_wait_ms**, **max_wait_ms**, **wait_histogram_ms**: Attese per ottenere una connessione.
+    """
+    return pool_monitor.stats()
+
+
+@router.get("/slow_queries", response_model=List[schemas.SlowQuery])
+async def get_slow_queries(
+    collection: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=SLOW_QUERY_MAX_LIMIT),
+    current_user=Depends(verify_admin),
+    slow_query_repository: SlowQueryRepository = Depends(get_slow_query_repository),
+):
+    """
+    Restituisce le operazioni lente su MongoDB più recenti, con la forma della query e il piano di esecuzione.
+
+    ### Args:
+    * **collection**: Se indicata, solo le operazioni su questa collection.
+    * **limit**: Numero massimo di operazioni restituite.
+
+    ### Returns:
+    * **List[SlowQuery]**: Le operazioni lente, dalla più recente.
+    """
+    return await slow_query_repository.get_slow_queries(collection=collection, limit=limit)
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+def get_metrics(current_user=Depends(verify_metrics_access)):
+    """
+    Restituisce le metriche nel formato testuale di Prometheus.
+    Espongono dettagli interni (pool, cache), quindi richiedono METRICS_TOKEN o un token admin.
+
+    ### Raises:
+    * **HTTPException.HTTP_401_UNAUTHORIZED**: Se il token non è valido.
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,6 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+import os
 
 import app.schemas as schemas
+from app.cache import settings_cache
+from app.utils import make_etag, etag_matches
 from app.routes.auth import verify_admin
 from app.repositories.setting_repository import (
     SettingRepository,
@@ -9,17 +12,24 @@ from app.repositories.setting_repository import (
 
 router = APIRouter(prefix="/settings", tags=["setting"])
 
+# Header Cache-Control di GET /settings: no-cache obbliga il client a rivalidare con If-None-Match
+SETTINGS_CACHE_CONTROL = os.getenv("SETTINGS_CACHE_CONTROL", "no-cache")
+
 
 @router.get(
     "",
     response_model=schemas.Settings,
 )
 async def get_settings(
+    request: Request,
     setting_repository: SettingRepository = Depends(get_setting_repository),
 ):
     """
     Restituisce le impostazioni dell'applicazione.
 
+    La risposta serializzata resta in cache fino al prossimo aggiornamento; se l'header
+    If-None-Match contiene l'ETag corrente la risposta è 304 senza corpo.
+
     ### Returns:
     * **schemas.Settings**: Le impostazioni dell'applicazione.
 
@@ -27,19 +37,29 @@ async def get_settings(
     * **HTTPException.HTTP_404_NOT_FOUND**: Se le impostazioni non sono state trovate.
     * **HTTPException.HTTP_500_INTERNAL_SERVER_ERROR**: Se si verifica un errore durante il recupero delle impostazioni.
     """
-    try:
-        settings = await setting_repository.get_settings()
-        if not settings:
+    body = settings_cache.get("response")
+    if body is None:
+        version = settings_cache.version
+        try:
+            settings = await setting_repository.get_settings()
+            if not settings:
+                raise HTTPException(
+                    status_code=404,
+                    detail="Settings not found",
+                )
+        except Exception as e:
             raise HTTPException(
-                status_code=404,
-                detail="Settings not found",
+                status_code=500,
+                detail=f"Error retrieving settings: {str(e)}",
             )
-        return settings
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error retrieving settings: {str(e)}",
-        )
+        json_body = schemas.Settings.model_validate(settings).model_dump_json().encode("utf-8")
+        body = {"json": json_body, "etag": make_etag(json_body)}
+        settings_cache.set(body, version, "response")
+
+    headers = {"ETag": body["etag"], "Cache-Control": SETTINGS_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), body["etag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body["json"], media_type="application/json", headers=headers)
 
 
 @router.patch(
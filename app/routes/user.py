@@ -1,6 +1,8 @@
+import logging
 import os
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from typing import List, Optional
+from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from pymongo.errors import DuplicateKeyError
 from jose import jwt, JWTError
@@ -14,15 +16,30 @@ from app.routes.auth import (
     authenticate_user,
 )
 from app.repositories.user_repository import UserRepository, get_user_repository
+from app.repositories.password_reset_repository import (
+    PasswordResetRepository,
+    get_password_reset_repository,
+)
+from app.repositories.announcement_repository import (
+    AnnouncementRepository,
+    get_announcement_repository,
+)
 
-from app.utils import get_password_hash, verify_password
+from app.utils import get_password_hash, verify_password, normalize_name
 from app.service.email_service import EmailService
+from app.service.announcement_service import lease_remaining_seconds, schedule_announcement
+from app.responses import TrustedSerializer
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/users",
     tags=["user"],
 )
 
+# Serializzazione senza validazione degli utenti letti dal database (vedi TrustedSerializer)
+users_serializer = TrustedSerializer(List[schemas.User])
+
 style = """<style>
                         body {
                         background-color: #f8f9fa;
@@ -107,10 +124,10 @@ ALGORITHM = "HS256"
 
 def security_check(): # pragma: no cover
     if SECRET_KEY_JWT == "$2b$12$zqt9Rgv1PzORjG5ghJSb6OSdYrt7f7cLc38a21DgX/DMyqt80AUCi":
-        print(
-            "WARNING: SECRET_KEY_JWT is not set. Using default value for development purposes only."
+        logger.warning(
+            "SECRET_KEY_JWT is not set. Using default value for development purposes only. "
+            "Please set SECRET_KEY_JWT in your environment variables."
         )
-        print("Please set SECRET_KEY_JWT in your environment variables.")
 security_check()
 
 
@@ -140,6 +157,7 @@ async def register_user(
     new_user = {
         "_id": user_data.email,
         "name": user_data.name,
+        "name_normalized": normalize_name(user_data.name),
         "hashed_password": hashed_password,
         "is_initialized": False,
         "remember_me": False,
@@ -207,7 +225,7 @@ async def register_user(
         	status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         	detail=f"Failed to send email to user: {e}",
         )
-        # print(f"  Error: Failed to send to user the password: {e}")
+        # logger.error("Failed to send to user the password: %s", e)
 
     return {"message": "User registered successfully", "password": password}
 
@@ -238,7 +256,43 @@ async def get_users(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No users found",
         )
-    return users
+    return users_serializer.response(users)
+
+
+@router.get(
+    "/search",
+    response_model=schemas.UserSearchResponse,
+)
+async def search_users(
+    q: str = Query(..., min_length=1, description="Prefisso dell'email o di una parola del nome"),
+    limit: int = Query(20, ge=1, le=50, description="Numero massimo di risultati"),
+    after: Optional[str] = Query(None, description="Cursore restituito dalla pagina precedente"),
+    current_user=Depends(verify_admin),
+    user_repo: UserRepository = Depends(get_user_repository),
+):
+    """
+    Cerca gli utenti per prefisso dell'email o di una parola del nome (es. per i suggerimenti durante la digitazione).
+
+    ### Args:
+    * **q**: Il testo da cercare; maiuscole e accenti vengono ignorati.
+    * **limit**: Numero massimo di risultati (massimo 50).
+    * **after**: Il valore next_cursor della pagina precedente.
+
+    ### Returns:
+    * **users**: Gli utenti trovati, prima quelli trovati per email e poi quelli trovati per nome.
+    * **next_cursor**: Il cursore per la pagina successiva, null se non ci sono altri risultati.
+
+    ### Raises:
+    * **HTTPException.HTTP_400_BAD_REQUEST**: Se il cursore non è valido.
+    """
+    try:
+        users, next_cursor = await user_repo.search_users(q, limit=limit, after=after)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid parameters: {e}",
+        )
+    return {"users": users, "next_cursor": next_cursor}
 
 
 @router.get(
@@ -307,15 +361,12 @@ async def update_user(
         user_data=user_new_data,
     )
 
-    if result.modified_count == 0 and result.matched_count > 0:
-        return {"message": "User data is already up to date."}
-    elif result.matched_count == 0:
+    if not result:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found during update attempt",
         )
-    else:
-        return {"message": "User updated successfully."}
+    return {"message": "User updated successfully."}
 
 
 
@@ -344,7 +395,7 @@ async def delete_user(
         valid_user = await authenticate_user(
             current_user.get("sub"), admin.current_password, user_repository
         )
-        print(f"valid_user: {valid_user}")
+        logger.debug("valid_user: %s", bool(valid_user))
         if not valid_user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -417,7 +468,7 @@ async def update_password(
                 is_initialized=initialized,
             ),
         )
-        if result.matched_count == 0:
+        if not result:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found during password update attempt",
@@ -426,7 +477,7 @@ async def update_password(
             return {"message": "Password updated successfully"}
         
     except Exception as e:
-        print(f"Error updating password: {e}")
+        logger.error("Error updating password: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to update password: {e}",
@@ -441,10 +492,15 @@ async def update_password(
 async def reset_password(
     user_data: schemas.UserForgotPassword,
     user_repository: UserRepository = Depends(get_user_repository),
+    password_reset_repository: PasswordResetRepository = Depends(get_password_reset_repository),
 ):
     """
     Resetta la password dell'utente e invia un'email con la nuova password temporanea.
 
+    Le richieste ripetute per la stessa email entro PASSWORD_RESET_WINDOW_SECONDS vengono assorbite:
+    non generano una nuova password né un'altra email (password nella risposta è None).
+    Se l'email non viene inviata la richiesta non viene registrata, così l'utente può riprovare subito.
+
     ### Args:
     * **user_data**: I dati dell'utente di cui resettare la password.
 
@@ -461,16 +517,26 @@ async def reset_password(
                 detail="User not found",
             )
 
+        # Richiesta duplicata nella finestra: nessun hash, scrittura o email
+        if not await password_reset_repository.try_acquire(user_data.email):
+            return {"message": "Password reset email sent successfully", "password": None}
+
         password = os.urandom(16).hex()
 
-        await user_repository.update_user(
-            user_id=user_data.email,
-            user_data=schemas.UserUpdate(
-                _id=user_data.email,
-                password=password,
-                is_initialized=False,
-            ),
-        )
+        try:
+            await user_repository.update_user(
+                user_id=user_data.email,
+                user_data=schemas.UserUpdate(
+                    _id=user_data.email,
+                    password=password,
+                    is_initialized=False,
+                ),
+                fresh_password=True,
+            )
+        except Exception:
+            # Il reset non è avvenuto: la prossima richiesta deve poter riprovare
+            await password_reset_repository.release(user_data.email)
+            raise
 
        
         try:
@@ -522,7 +588,9 @@ async def reset_password(
             #     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             #     detail=f"Failed to send email to user: {e}",
             # )
-            print("  Error: Failed to send to user the password")
+            logger.error("Failed to send to user the password: %s", e)
+            # La password è cambiata ma l'utente non l'ha ricevuta: deve poter chiedere subito un nuovo reset
+            await password_reset_repository.release(user_data.email)
 
     except Exception as e:
         raise HTTPException(
@@ -530,3 +598,122 @@ async def reset_password(
             detail=f"Failed to send password reset email: {e}",
         )
     return {"message": "Password reset email sent successfully", "password": password}
+
+
+@router.post("/announcements", status_code=status.HTTP_202_ACCEPTED)
+async def create_announcement(
+    announcement: schemas.Announcement,
+    current_user=Depends(verify_admin),
+    announcement_repository: AnnouncementRepository = Depends(get_announcement_repository),
+):
+    """
+    Invia un annuncio via email a tutti gli utenti registrati.
+
+    L'invio avviene in background, rispettando la quota di email al minuto del provider.
+    Con **bcc** a True gli utenti vengono raggruppati in copia nascosta, altrimenti ricevono un'email ciascuno.
+
+    ### Args:
+    * **announcement (schemas.Announcement)**: Oggetto, corpo HTML e modalità di invio dell'annuncio.
+
+    ### Returns:
+    * **id**: L'ID dell'annuncio, da usare per seguirne l'avanzamento.
+
+    ### Raises:
+    * **HTTPException.HTTP_500_INTERNAL_SERVER_ERROR**: Se non è possibile registrare l'annuncio.
+    """
+    try:
+        announcement_id = await announcement_repository.create_announcement(
+            announcement, author_email=current_user.get("sub")
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create announcement: {e}",
+        )
+
+    schedule_announcement(announcement_repository.database, announcement_id)
+    return {"id": str(announcement_id), "status": "pending"}
+
+
+@router.get(
+    "/announcements/{announcement_id}",
+    response_model=schemas.AnnouncementResponse,
+)
+async def get_announcement(
+    announcement_id: str,
+    current_user=Depends(verify_admin),
+    announcement_repository: AnnouncementRepository = Depends(get_announcement_repository),
+):
+    """
+    Restituisce lo stato di avanzamento di un annuncio.
+
+    ### Args:
+    * **announcement_id**: L'ID dell'annuncio.
+
+    ### Returns:
+    * **schemas.AnnouncementResponse**: L'annuncio con stato e numero di destinatari serviti.
+
+    ### Raises:
+    * **HTTPException.HTTP_404_NOT_FOUND**: Se l'annuncio non esiste.
+    """
+    if not ObjectId.is_valid(announcement_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Announcement not found",
+        )
+
+    announcement = await announcement_repository.get_announcement(ObjectId(announcement_id))
+    if not announcement:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Announcement not found",
+        )
+    return announcement
+
+
+@router.post(
+    "/announcements/{announcement_id}/resume",
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def resume_announcement(
+    announcement_id: str,
+    current_user=Depends(verify_admin),
+    announcement_repository: AnnouncementRepository = Depends(get_announcement_repository),
+):
+    """
+    Riprende l'invio di un annuncio interrotto o fallito dall'ultimo destinatario servito.
+
+    ### Args:
+    * **announcement_id**: L'ID dell'annuncio.
+
+    ### Raises:
+    * **HTTPException.HTTP_404_NOT_FOUND**: Se l'annuncio non esiste.
+    * **HTTPException.HTTP_400_BAD_REQUEST**: Se l'annuncio è già stato completato.
+    * **HTTPException.HTTP_409_CONFLICT**: Se l'annuncio è già in invio (lease non scaduto).
+    """
+    if not ObjectId.is_valid(announcement_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Announcement not found",
+        )
+
+    announcement = await announcement_repository.get_announcement(ObjectId(announcement_id))
+    if not announcement:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Announcement not found",
+        )
+    if announcement.get("status") == "completed":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Announcement already completed",
+        )
+    if lease_remaining_seconds(announcement) > 0:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Announcement is already being sent",
+        )
+
+    await announcement_repository.reset_announcement(announcement["_id"])
+    schedule_announcement(announcement_repository.database, announcement["_id"])
+    return {"id": announcement_id, "status": "pending"}
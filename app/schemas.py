@@ -1,6 +1,7 @@
 from pydantic import BaseModel, EmailStr, Field, field_validator
 from bson import ObjectId
 from typing import Optional, List, Annotated, Any, Callable
+from datetime import datetime
 from pydantic_core import core_schema
 import re
 
@@ -41,6 +42,21 @@ class User(BaseModel):
     is_initialized: bool = False
     remember_me: bool = False
     scopes: List[str] = ["user"]
+    last_login: Optional[datetime] = None
+    last_active: Optional[datetime] = None
+
+
+class UserSummary(BaseModel):
+    id: EmailStr = Field(alias="_id")
+    name: str
+    scopes: List[str] = ["user"]
+    is_initialized: bool = False
+    last_active: Optional[datetime] = None
+
+
+class UserSearchResponse(BaseModel):
+    users: List[UserSummary]
+    next_cursor: Optional[str] = None
 
 
 class UserAuth(BaseModel):
@@ -129,10 +145,56 @@ class DocumentResponse(Document):
     id: PydanticObjectId = Field(alias="_id")
     owner_email: EmailStr
     uploaded_at: str
+    file_id: Optional[PydanticObjectId] = None
+    sha256: Optional[str] = None
+    size: Optional[int] = None
+    content_type: Optional[str] = None
+    ingestion_state: Optional[str] = None
+    ingestion_attempts: Optional[int] = None
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
 
 class DocumentDelete(BaseModel):
     id: str
 
+
+class DocumentBatchDelete(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=5000)
+
+
+class DocumentBatchDeleteResult(BaseModel):
+    deleted: List[str]
+    missing: List[str]
+
+
+class DocumentContentResult(BaseModel):
+    file_id: str
+    sha256: str
+    length: int
+    deduplicated: bool
+
+
+class IngestionLease(BaseModel):
+    worker_id: str
+    lease_seconds: Optional[int] = Field(None, ge=1, le=24 * 3600)
+
+
+class IngestionFailure(BaseModel):
+    worker_id: str
+    error: str
+
+
+class DocumentBatchResult(BaseModel):
+    created: List[str]
+    existing: List[str]
+
+class SyncChanges(BaseModel):
+    inserted: List[str]
+    updated: List[str]
+    deleted: List[str]
+    token: str
+    has_more: bool
+
 class FAQ(BaseModel):
     # id: PydanticObjectId = Field(alias="_id")
     title: str
@@ -169,10 +231,51 @@ class FAQResponse(FAQ):
     updated_at: str
 
 
+class FAQSearchResult(FAQResponse):
+    score: float
+
+
+class FAQSearchResponse(BaseModel):
+    results: List[FAQSearchResult]
+    next_offset: Optional[int] = None
+
+
+class FAQImportResult(BaseModel):
+    created: int
+    updated: int
+    unchanged: int
+
+
+class FAQMatchRequest(BaseModel):
+    question: str = Field(..., min_length=1, max_length=2000)
+
+
+class FAQMatchResponse(BaseModel):
+    match: Optional[FAQResponse] = None
+    score: float
+
+
 class EmailSchema(BaseModel):
     email: List[EmailStr]
 
 
+class Announcement(BaseModel):
+    subject: str
+    body: str
+    bcc: bool = True
+
+
+class AnnouncementResponse(Announcement):
+    id: PydanticObjectId = Field(alias="_id")
+    status: str
+    sent_count: int = 0
+    last_recipient: Optional[str] = None
+    created_by: EmailStr
+    created_at: str
+    updated_at: str
+    error: Optional[str] = None
+
+
 class Settings(BaseModel):
     color_primary: Optional[str] = None
     color_primary_hover: Optional[str] = None
@@ -190,3 +293,15 @@ class Stats(BaseModel):
     average_messages_per_user: float
     positive_rating_percentage: float
     active_users: int
+
+
+class SlowQuery(BaseModel):
+    id: PydanticObjectId = Field(alias="_id")
+    timestamp: datetime
+    database: str
+    collection: str
+    command: str
+    duration_ms: float
+    shape: dict
+    explain: Optional[dict] = None
+    explain_error: Optional[str] = None
@@ -0,0 +1,90 @@
+import logging
+import asyncio
+import os
+import time
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from app.utils import get_timezone
+
+logger = logging.getLogger(__name__)
+
+# Ogni quanti secondi le attività accumulate vengono scritte sul database
+ACTIVITY_FLUSH_INTERVAL_SECONDS = float(os.getenv("ACTIVITY_FLUSH_INTERVAL_SECONDS", 5))
+
+
+class ActivityTracker:
+    """
+    Accumula in memoria l'ultimo accesso e l'ultima attività di ogni utente.
+
+    Le richieste si limitano ad aggiornare un dizionario; periodicamente tutte le attività
+    accumulate vengono scritte con un unico bulk_write di aggiornamenti $max, così più
+    richieste dello stesso utente nello stesso intervallo costano una sola scrittura.
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    def touch(self, email: str, login: bool = False):
+        """
+        Registra un'attività dell'utente (e, se login è True, anche un accesso).
+        """
+        if not email:
+            return
+        now = time.time()
+        entry = self._pending.get(email)
+        if entry is None:
+            entry = self._pending[email] = {}
+        entry["last_active"] = now
+        if login:
+            entry["last_login"] = now
+
+    async def flush(self, collection):
+        """
+        Scrive le attività accumulate sulla collection users.
+        Restituisce il numero di utenti aggiornati.
+        """
+        if not self._pending:
+            return 0
+
+        pending, self._pending = self._pending, {}
+        timezone = get_timezone()
+        operations = [
+            UpdateOne(
+                {"_id": email},
+                {
+                    "$max": {
+                        field: datetime.fromtimestamp(timestamp, timezone)
+                        for field, timestamp in fields.items()
+                    }
+                },
+            )
+            for email, fields in pending.items()
+        ]
+
+        try:
+            await collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error("Error flushing user activity: %s", e)
+            # Rimette in coda le attività non scritte, senza sovrascrivere quelle più recenti
+            for email, fields in pending.items():
+                entry = self._pending.setdefault(email, {})
+                for field, timestamp in fields.items():
+                    entry[field] = max(entry.get(field, timestamp), timestamp)
+            return 0
+        return len(operations)
+
+    async def run(self, collection, interval: float = ACTIVITY_FLUSH_INTERVAL_SECONDS):
+        """
+        Svuota periodicamente il buffer delle attività finché il task non viene cancellato.
+        """
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                await self.flush(collection)
+        finally:
+            await self.flush(collection)
+
+
+activity_tracker = ActivityTracker()
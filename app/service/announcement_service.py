@@ -0,0 +1,181 @@
+import logging
+import asyncio
+import os
+from datetime import datetime, timezone
+from bson import ObjectId
+
+from app.repositories.announcement_repository import AnnouncementRepository
+from app.repositories.user_repository import UserRepository
+from app.service.email_service import EmailService
+
+logger = logging.getLogger(__name__)
+
+# Numero massimo di email inviate al minuto (quota del provider SMTP)
+MAIL_RATE_LIMIT_PER_MINUTE = int(os.getenv("MAIL_RATE_LIMIT_PER_MINUTE", 20))
+# Numero di destinatari in copia nascosta per ogni email
+MAIL_BCC_BATCH_SIZE = int(os.getenv("MAIL_BCC_BATCH_SIZE", 50))
+# Numero di destinatari letti per blocco negli invii con un'email per utente
+MAIL_RECIPIENTS_BATCH_SIZE = int(os.getenv("MAIL_RECIPIENTS_BATCH_SIZE", 100))
+# Durata del lease di un invio: scaduto il lease, un altro processo può riprenderlo
+ANNOUNCEMENT_LEASE_SECONDS = int(os.getenv("ANNOUNCEMENT_LEASE_SECONDS", 300))
+# Margine dopo la scadenza del lease prima di riprovare a prendere in carico l'invio
+ANNOUNCEMENT_RETRY_MARGIN_SECONDS = 1
+
+
+class RateLimiter:
+    """
+    Distanzia le chiamate in modo da non superare rate_per_minute chiamate al minuto.
+    """
+
+    def __init__(self, rate_per_minute: int):
+        self.interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = None
+        self._loop = None
+
+    def _get_lock(self):
+        # Il lock viene creato nel loop che lo usa: su Python 3.9 un lock creato all'import è legato a un altro loop
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._lock, self._loop = asyncio.Lock(), loop
+        return self._lock
+
+    async def wait(self):
+        async with self._get_lock():
+            now = asyncio.get_running_loop().time()
+            if self._next_slot > now:
+                await asyncio.sleep(self._next_slot - now)
+                now = self._next_slot
+            self._next_slot = now + self.interval
+
+
+# Il limite è condiviso da tutti gli annunci inviati dal processo
+mail_rate_limiter = RateLimiter(MAIL_RATE_LIMIT_PER_MINUTE)
+
+# Task in esecuzione per annuncio: evitano che vengano raccolti dal garbage collector e che lo stesso
+# annuncio venga avviato due volte nel processo
+_running_tasks = {}
+
+
+def lease_remaining_seconds(announcement) -> float:
+    """
+    Restituisce i secondi che mancano alla scadenza del lease dell'annuncio (0 se non è in carico).
+    """
+    lease_expires_at = announcement.get("lease_expires_at")
+    if announcement.get("status") != "running" or not lease_expires_at:
+        return 0
+    if lease_expires_at.tzinfo is None:
+        # Motor restituisce le date in UTC senza fuso orario
+        lease_expires_at = lease_expires_at.replace(tzinfo=timezone.utc)
+    return max((lease_expires_at - datetime.now(timezone.utc)).total_seconds(), 0)
+
+
+class AnnouncementService:
+    def __init__(
+        self,
+        announcement_repository: AnnouncementRepository,
+        user_repository: UserRepository,
+        email_service: EmailService = None,
+        rate_limiter: RateLimiter = None,
+    ):
+        self.announcement_repository = announcement_repository
+        self.user_repository = user_repository
+        self.email_service = email_service or EmailService()
+        self.rate_limiter = rate_limiter or mail_rate_limiter
+
+    async def send_announcement(self, announcement_id: ObjectId):
+        """
+        Invia l'annuncio a tutti gli utenti, riprendendo dall'ultimo destinatario servito.
+
+        I destinatari vengono letti dalla collection users con un cursore ordinato per email;
+        dopo ogni email inviata il punto di ripresa viene salvato, quindi in caso di crash
+        al più l'ultimo blocco viene inviato di nuovo.
+        Ritorna False se l'annuncio è concluso o fallito.
+        """
+        announcement = await self._claim(announcement_id)
+        if not announcement:
+            return False
+
+        batch_size = MAIL_BCC_BATCH_SIZE if announcement.get("bcc") else MAIL_RECIPIENTS_BATCH_SIZE
+        try:
+            async for emails in self.user_repository.iter_user_emails(
+                after=announcement.get("last_recipient"), batch_size=batch_size
+            ):
+                if announcement.get("bcc"):
+                    await self._send(announcement, to=[self.email_service.conf.MAIL_FROM], bcc=emails)
+                    await self.announcement_repository.record_progress(
+                        announcement_id, emails[-1], len(emails), ANNOUNCEMENT_LEASE_SECONDS
+                    )
+                else:
+                    for email in emails:
+                        await self._send(announcement, to=[email])
+                        await self.announcement_repository.record_progress(
+                            announcement_id, email, 1, ANNOUNCEMENT_LEASE_SECONDS
+                        )
+        except Exception as e:
+            logger.error("Error sending announcement %s: %s", announcement_id, e)
+            await self.announcement_repository.finish_announcement(
+                announcement_id, error=str(e)
+            )
+            return False
+
+        await self.announcement_repository.finish_announcement(announcement_id)
+        return True
+
+    async def _claim(self, announcement_id: ObjectId):
+        """
+        Prende in carico l'annuncio. Se è in carico ad un altro processo (o al processo che
+        lo inviava prima di un riavvio) aspetta la scadenza del lease e riprova: se quel
+        processo è attivo rinnova il lease e l'attesa continua, altrimenti l'invio viene ripreso.
+        """
+        while True:
+            announcement = await self.announcement_repository.claim_announcement(
+                announcement_id, ANNOUNCEMENT_LEASE_SECONDS
+            )
+            if announcement:
+                return announcement
+
+            current = await self.announcement_repository.get_announcement(announcement_id)
+            if not current or current.get("status") != "running" or not current.get("lease_expires_at"):
+                return None
+            await asyncio.sleep(lease_remaining_seconds(current) + ANNOUNCEMENT_RETRY_MARGIN_SECONDS)
+
+    async def _send(self, announcement, to, bcc=None):
+        await self.rate_limiter.wait()
+        await self.email_service.send_email(
+            to=to,
+            subject=announcement.get("subject"),
+            body=announcement.get("body"),
+            bcc=bcc,
+        )
+
+
+def schedule_announcement(database, announcement_id: ObjectId):
+    """
+    Avvia l'invio dell'annuncio in un task in background, se non è già in corso nel processo.
+    """
+    task = _running_tasks.get(announcement_id)
+    if task is not None and not task.done():
+        return task
+    service = AnnouncementService(
+        AnnouncementRepository(database), UserRepository(database)
+    )
+    task = asyncio.create_task(service.send_announcement(announcement_id))
+    _running_tasks[announcement_id] = task
+
+    def forget(done):
+        # Nel frattempo potrebbe essere stato avviato un nuovo invio dello stesso annuncio
+        if _running_tasks.get(announcement_id) is done:
+            del _running_tasks[announcement_id]
+
+    task.add_done_callback(forget)
+    return task
+
+
+async def resume_announcements(database):
+    """
+    Riprende gli annunci rimasti in sospeso, ad esempio dopo un riavvio del server.
+    """
+    repository = AnnouncementRepository(database)
+    for announcement_id in await repository.get_unfinished_announcements():
+        schedule_announcement(database, announcement_id)
@@ -0,0 +1,28 @@
+import logging
+import asyncio
+import os
+
+from pymongo.errors import PyMongoError
+
+from app.repositories.document_file_repository import DocumentFileRepository
+
+logger = logging.getLogger(__name__)
+
+# Ogni quanti secondi vengono cercati ed eliminati i file GridFS non più usati da nessun documento
+DOCUMENT_FILES_CLEANUP_INTERVAL_SECONDS = float(os.getenv("DOCUMENT_FILES_CLEANUP_INTERVAL_SECONDS", 3600))
+
+
+async def run_document_file_cleanup(database, interval: float = DOCUMENT_FILES_CLEANUP_INTERVAL_SECONDS):
+    """
+    Elimina periodicamente i file orfani (contenuto sostituito o documento eliminato), finché il task non viene cancellato.
+    """
+    repository = DocumentFileRepository(database)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            deleted = await repository.delete_orphans()
+        except PyMongoError as e:
+            logger.error("Error deleting orphaned document files: %s", e)
+            continue
+        if deleted:
+            logger.info("Deleted %s orphaned document files", deleted)
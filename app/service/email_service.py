@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 
 from fastapi import BackgroundTasks, FastAPI
 from fastapi_mail import ConnectionConfig, FastMail, MessageSchema, MessageType
@@ -26,12 +26,18 @@ class EmailService:
         )
         self.mail = FastMail(self.conf)
 
-    async def send_email(self, to: List[EmailStr], subject: str, body: str):
+    async def send_email(
+        self,
+        to: List[EmailStr],
+        subject: str,
+        body: str,
+        bcc: Optional[List[EmailStr]] = None,
+    ):
         if not self.is_configuration_valid():
           raise ValueError("Email configuration is not valid. Please check your environment variables.")
         else:
             message = MessageSchema(
-                subject=subject, recipients=to, body=body, subtype=MessageType.html #or MessageType.plain        
+                subject=subject, recipients=to, bcc=bcc or [], body=body, subtype=MessageType.html #or MessageType.plain        
             )
             await self.mail.send_message(message)
     
@@ -0,0 +1,54 @@
+import csv
+import io
+import json
+
+from pydantic import ValidationError
+
+import app.schemas as schemas
+
+# Colonne dei file CSV di FAQ
+FAQ_FIELDS = ("title", "question", "answer")
+
+
+def parse_faqs(body: bytes, content_type: str):
+    """
+    Legge le FAQ da un file NDJSON (una FAQ JSON per riga) o CSV (con intestazione title,question,answer).
+
+    Returns:
+        tuple: La lista delle FAQ valide e la lista degli errori, ciascuno con il numero di riga.
+    """
+    text = body.decode("utf-8-sig")
+    if "csv" in (content_type or ""):
+        rows = enumerate(csv.DictReader(io.StringIO(text)), start=2)
+    else:
+        rows = (
+            (number, line) for number, line in enumerate(text.splitlines(), start=1) if line.strip()
+        )
+
+    faqs, errors = [], []
+    for number, row in rows:
+        try:
+            if isinstance(row, str):
+                row = json.loads(row)
+            faqs.append(schemas.FAQ.model_validate(row))
+        except (ValueError, ValidationError) as e:
+            errors.append({"line": number, "error": str(e)})
+    return faqs, errors
+
+
+async def export_ndjson(faqs):
+    async for faq in faqs:
+        yield json.dumps({field: faq.get(field) for field in FAQ_FIELDS}, ensure_ascii=False) + "\n"
+
+
+async def export_csv(faqs):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FAQ_FIELDS)
+    async for faq in faqs:
+        writer.writerow([faq.get(field) for field in FAQ_FIELDS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.getvalue():
+        yield buffer.getvalue()
@@ -0,0 +1,110 @@
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+from app.utils import strip_accents
+
+# Similarità minima (coseno, da 0 a 1) perché una domanda venga considerata uguale a una FAQ
+FAQ_MATCH_THRESHOLD = float(os.getenv("FAQ_MATCH_THRESHOLD", 0.8))
+
+# Lunghezza degli n-grammi di caratteri
+NGRAM_SIZE = 3
+
+SPACES_REGEX = re.compile(r"[\W_]+")
+
+
+def char_ngrams(text: str):
+    """
+    Restituisce gli n-grammi di caratteri del testo normalizzato (minuscolo, senza accenti e punteggiatura).
+    """
+    normalized = SPACES_REGEX.sub(" ", strip_accents(text or "").casefold()).strip()
+    if not normalized:
+        return Counter()
+    padded = f" {normalized} "
+    return Counter(padded[i : i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1))
+
+
+class FaqMatcher:
+    """
+    Matrice TF-IDF sugli n-grammi di caratteri delle domande delle FAQ.
+
+    La matrice è salvata per colonne (per ogni n-gramma, le FAQ che lo contengono e il peso):
+    il punteggio di una domanda rispetto a tutte le FAQ si calcola con un solo np.bincount
+    sugli n-grammi della domanda. Le righe sono normalizzate, quindi il punteggio è il coseno.
+    """
+
+    def __init__(self, faqs: list):
+        self.faqs = faqs
+        rows = [char_ngrams(faq.get("question")) for faq in faqs]
+
+        self.vocabulary = {}
+        for ngrams in rows:
+            for ngram in ngrams:
+                self.vocabulary.setdefault(ngram, len(self.vocabulary))
+
+        document_frequency = np.zeros(len(self.vocabulary), dtype=np.float32)
+        triplets = []
+        for row, ngrams in enumerate(rows):
+            for ngram, count in ngrams.items():
+                column = self.vocabulary[ngram]
+                document_frequency[column] += 1
+                triplets.append((column, row, count))
+
+        self.idf = np.log((1 + len(faqs)) / (1 + document_frequency)) + 1
+        triplets.sort()
+        columns = np.fromiter((t[0] for t in triplets), dtype=np.int64, count=len(triplets))
+        self.rows = np.fromiter((t[1] for t in triplets), dtype=np.int64, count=len(triplets))
+        counts = np.fromiter((t[2] for t in triplets), dtype=np.float32, count=len(triplets))
+        self.weights = (1 + np.log(counts)) * self.idf[columns]
+
+        # Norma di ogni riga, per passare dal prodotto scalare al coseno
+        norms = np.sqrt(np.bincount(self.rows, weights=self.weights**2, minlength=len(faqs)))
+        self.weights /= norms[self.rows]
+        self.column_starts = np.searchsorted(columns, np.arange(len(self.vocabulary) + 1))
+
+    def scores(self, question: str):
+        """
+        Restituisce il coseno tra la domanda e ciascuna FAQ.
+        """
+        query = char_ngrams(question)
+        if not query or not self.faqs:
+            return np.zeros(len(self.faqs), dtype=np.float32)
+
+        # Gli n-grammi assenti dalle FAQ non contribuiscono al punteggio ma contano nella norma della domanda
+        unknown_idf = np.log(1 + len(self.faqs)) + 1
+        columns, query_weights, norm = [], [], 0.0
+        for ngram, count in query.items():
+            column = self.vocabulary.get(ngram)
+            weight = (1 + np.log(count)) * (self.idf[column] if column is not None else unknown_idf)
+            norm += weight**2
+            if column is not None:
+                columns.append(column)
+                query_weights.append(weight)
+        if not columns:
+            return np.zeros(len(self.faqs), dtype=np.float32)
+        columns = np.array(columns, dtype=np.int64)
+        query_weights = np.array(query_weights, dtype=np.float32) / np.sqrt(norm)
+
+        # Posizioni delle voci delle colonne della domanda, concatenate
+        starts = self.column_starts[columns]
+        lengths = self.column_starts[columns + 1] - starts
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+        return np.bincount(
+            self.rows[positions],
+            weights=self.weights[positions] * np.repeat(query_weights, lengths),
+            minlength=len(self.faqs),
+        )
+
+    def best_match(self, question: str, threshold: float = FAQ_MATCH_THRESHOLD):
+        """
+        Restituisce la FAQ più simile alla domanda e il suo punteggio; la FAQ è None se il punteggio è sotto la soglia.
+        """
+        if not self.faqs:
+            return None, 0.0
+        scores = self.scores(question)
+        best = int(np.argmax(scores))
+        score = min(float(scores[best]), 1.0)
+        return (self.faqs[best] if score >= threshold else None), score
@@ -0,0 +1,95 @@
+import math
+import os
+import re
+from collections import Counter
+
+from app.utils import strip_accents
+
+# "mongo" usa l'indice di testo di MongoDB, "memory" l'indice invertito in memoria
+FAQ_SEARCH_BACKEND = os.getenv("FAQ_SEARCH_BACKEND", "mongo")
+
+# Peso di ogni campo nel punteggio, uguale a quello dell'indice di testo di MongoDB
+FAQ_SEARCH_WEIGHTS = {"title": 10, "question": 5, "answer": 1}
+
+ITALIAN_STOPWORDS = {
+    "a", "ad", "al", "alla", "alle", "agli", "ai", "allo", "anche", "che", "chi", "ci", "come",
+    "con", "da", "dal", "dalla", "dalle", "dei", "del", "della", "delle", "degli", "dello", "di",
+    "e", "ed", "gli", "ha", "hanno", "ho", "i", "il", "in", "io", "la", "le", "lo", "ma", "mi",
+    "ne", "nei", "nel", "nella", "nelle", "non", "o", "per", "perche", "piu", "quale", "quando",
+    "se", "si", "sono", "su", "sul", "sulla", "ti", "tra", "un", "una", "uno", "va", "vi",
+}
+
+# Suffissi flessivi rimossi dallo stemmer, dal più lungo al più corto
+ITALIAN_SUFFIXES = (
+    "azioni", "azione", "amento", "amenti", "imento", "imenti", "mente",
+    "ando", "endo", "are", "ere", "ire", "ato", "ata", "ati", "ate",
+    "ito", "ita", "iti", "ite", "uto", "uta", "uti", "ute",
+    "i", "e", "a", "o",
+)
+
+WORD_REGEX = re.compile(r"\w+")
+
+
+def stem(word: str):
+    """
+    Stemmer leggero per l'italiano: rimuove il suffisso flessivo più lungo lasciando almeno 3 caratteri.
+    """
+    for suffix in ITALIAN_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)]
+    return word
+
+
+def tokenize(text: str):
+    """
+    Restituisce i termini del testo: minuscoli, senza accenti, senza stopword e ridotti alla radice.
+    """
+    if not text:
+        return []
+    words = WORD_REGEX.findall(strip_accents(text).casefold())
+    return [stem(word) for word in words if word not in ITALIAN_STOPWORDS]
+
+
+class FaqSearchIndex:
+    """
+    Indice invertito in memoria sulle FAQ, per le installazioni senza indice di testo.
+
+    Per ogni termine conserva le FAQ che lo contengono con la frequenza pesata per campo;
+    il punteggio è un BM25 sulle frequenze pesate.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, faqs: list):
+        self.faqs = faqs
+        self.postings = {}
+        self.lengths = []
+        for position, faq in enumerate(faqs):
+            frequencies = Counter()
+            for field, weight in FAQ_SEARCH_WEIGHTS.items():
+                for term in tokenize(faq.get(field)):
+                    frequencies[term] += weight
+            self.lengths.append(sum(frequencies.values()))
+            for term, frequency in frequencies.items():
+                self.postings.setdefault(term, []).append((position, frequency))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+
+    def search(self, query: str, limit: int, offset: int = 0):
+        """
+        Restituisce le FAQ che contengono almeno un termine della query, dalla più rilevante.
+        Returns:
+            list: Coppie (faq, punteggio).
+        """
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.faqs) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, frequency in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / self.average_length)
+                scores[position] = scores.get(position, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(self.faqs[position], score) for position, score in ranked[offset : offset + limit]]
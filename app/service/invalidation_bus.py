@@ -0,0 +1,96 @@
+import logging
+import asyncio
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.cache import faq_cache, settings_cache
+
+logger = logging.getLogger(__name__)
+
+# Codici di errore per cui il resume token non è più utilizzabile
+CHANGE_STREAM_TOKEN_LOST_CODES = {280, 286}
+# Codice restituito quando il deployment non supporta i change stream (server standalone)
+CHANGE_STREAM_NOT_SUPPORTED_CODE = 40573
+
+# Attesa massima tra due tentativi di riconnessione
+INVALIDATION_BUS_MAX_BACKOFF_SECONDS = 30
+
+
+class InvalidationBus:
+    """
+    Ascolta i change stream di MongoDB e invalida le cache locali quando un qualunque processo
+    modifica le collection osservate.
+
+    Dopo una disconnessione lo stream riprende dall'ultimo resume token, quindi nessuna modifica
+    va persa; se il token non è più valido (oplog scaduto) tutte le cache vengono invalidate.
+    Vengono osservate solo le collection con almeno una funzione registrata: gli eventi delle
+    altre verrebbero trasmessi e decodificati senza effetto.
+    """
+
+    def __init__(self, collections=("settings", "faq")):
+        self.collections = tuple(collections)
+        self.resume_token = None
+        self._subscribers = {name: [] for name in self.collections}
+
+    def subscribe(self, collection: str, callback):
+        """
+        Registra una funzione chiamata (con l'evento) a ogni modifica della collection.
+        """
+        self._subscribers[collection].append(callback)
+
+    def dispatch(self, change: dict):
+        for callback in self._subscribers.get(change.get("ns", {}).get("coll"), []):
+            try:
+                callback(change)
+            except Exception as e:
+                logger.error("Error in invalidation callback: %s", e)
+
+    def invalidate_all(self):
+        """
+        Invalida tutte le cache: usato quando alcune modifiche potrebbero essere state perse.
+        """
+        for name in self.collections:
+            self.dispatch({"ns": {"coll": name}, "operationType": "invalidate"})
+
+    async def run(self, database):
+        """
+        Consuma il change stream finché il task non viene cancellato, riconnettendosi in caso di errore.
+        """
+        watched = [name for name in self.collections if self._subscribers[name]]
+        if not watched:
+            return
+        pipeline = [{"$match": {"ns.coll": {"$in": watched}}}]
+        backoff = 1
+        while True:
+            try:
+                async with database.watch(pipeline, resume_after=self.resume_token) as stream:
+                    if self.resume_token is None:
+                        # Senza token le modifiche precedenti all'apertura non sono note
+                        self.invalidate_all()
+                    backoff = 1
+                    async for change in stream:
+                        self.resume_token = change["_id"]
+                        self.dispatch(change)
+                        if change.get("operationType") == "invalidate":
+                            # Lo stream è chiuso (es. database eliminato) e non può essere ripreso
+                            self.resume_token = None
+                            self.invalidate_all()
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_NOT_SUPPORTED_CODE:
+                    logger.warning("Change streams are not supported (standalone MongoDB): cache invalidation relies on TTLs")
+                    return
+                if e.code in CHANGE_STREAM_TOKEN_LOST_CODES:
+                    logger.warning("Change stream resume token lost, restarting: %s", e)
+                    self.resume_token = None
+                    continue
+                logger.error("Change stream error: %s", e)
+            except PyMongoError as e:
+                logger.error("Change stream error: %s", e)
+
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, INVALIDATION_BUS_MAX_BACKOFF_SECONDS)
+
+
+invalidation_bus = InvalidationBus()
+invalidation_bus.subscribe("settings", lambda change: settings_cache.bump())
+invalidation_bus.subscribe("faq", lambda change: faq_cache.bump())
@@ -0,0 +1,109 @@
+import threading
+
+from pymongo import monitoring
+
+# Limiti superiori (in millisecondi) delle fasce dell'istogramma delle attese
+POOL_WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Raccoglie le statistiche del pool di connessioni di MongoDB, in particolare
+    quanto le richieste aspettano per ottenere una connessione.
+
+    Motor esegue le operazioni in thread separati, quindi gli eventi possono arrivare in parallelo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.checkouts = 0
+        self.waits = 0
+        self.checkout_failures = {}
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.wait_histogram = {bucket: 0 for bucket in POOL_WAIT_BUCKETS_MS + (float("inf"),)}
+        self.checked_out = 0
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.pools_cleared = 0
+
+    def _record_wait(self, duration):
+        if duration is None:
+            return
+        wait_ms = duration * 1000
+        self.waits += 1
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+        for bucket in self.wait_histogram:
+            if wait_ms <= bucket:
+                self.wait_histogram[bucket] += 1
+                break
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self._record_wait(event.duration)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures[event.reason] = self.checkout_failures.get(event.reason, 0) + 1
+            self._record_wait(event.duration)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pools_cleared += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def stats(self):
+        with self._lock:
+            return self._stats()
+
+    def _stats(self):
+        return {
+            "checkouts": self.checkouts,
+            "checkout_failures": dict(self.checkout_failures),
+            "checked_out": self.checked_out,
+            "open_connections": self.connections_created - self.connections_closed,
+            "pools_cleared": self.pools_cleared,
+            "waits": self.waits,
+            "total_wait_ms": self.total_wait_ms,
+            "avg_wait_ms": self.total_wait_ms / self.waits if self.waits else 0.0,
+            "max_wait_ms": self.max_wait_ms,
+            "wait_histogram_ms": {
+                ("+Inf" if bucket == float("inf") else str(bucket)): count
+                for bucket, count in self.wait_histogram.items()
+            },
+        }
+
+
+pool_monitor = PoolMonitor()
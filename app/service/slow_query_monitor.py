@@ -0,0 +1,212 @@
+import logging
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+
+from app.repositories.slow_query_repository import SlowQueryRepository
+from app.utils import get_timezone
+
+logger = logging.getLogger(__name__)
+
+# Durata oltre la quale un'operazione su MongoDB viene registrata come lenta
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", 100))
+# Intervallo minimo tra due explain della stessa forma di query (l'explain riesegue la query)
+SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS", 300))
+# Operazioni lente in attesa di essere registrate; oltre questo numero vengono scartate
+SLOW_QUERY_QUEUE_SIZE = int(os.getenv("SLOW_QUERY_QUEUE_SIZE", 100))
+
+# Comandi di cui si può eseguire l'explain senza effetti sui dati
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "findAndModify"}
+# Campi del comando che descrivono la query (gli altri, es. i documenti inseriti, non vengono salvati)
+SHAPE_FIELDS = ("filter", "query", "pipeline", "sort", "projection", "key", "update", "updates", "deletes", "hint")
+# Campi aggiunti dal driver che non vanno ripetuti nel comando explain
+DRIVER_FIELDS = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "startTransaction", "autocommit", "readConcern", "writeConcern"}
+# Campi del piano di esecuzione riportati nel registro (i limiti degli indici contengono i valori della query)
+PLAN_FIELDS = ("stage", "indexName", "keyPattern", "direction", "isMultiKey")
+# Numero massimo di elementi di una lista riportati nella forma della query
+SHAPE_MAX_ITEMS = 20
+
+
+def redact(value):
+    """
+    Sostituisce i valori della query con "?", mantenendo nomi dei campi, operatori e riferimenti a campi ($campo).
+    """
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if not any(isinstance(item, (dict, list, tuple)) for item in value):
+            # Lista di valori (es. $in): ne basta uno per la forma
+            return ["?"] if value else []
+        return [redact(item) for item in value[:SHAPE_MAX_ITEMS]]
+    if isinstance(value, str) and value.startswith("$"):
+        return value
+    return "?"
+
+
+def query_shape(command: dict):
+    return {field: redact(command[field]) for field in SHAPE_FIELDS if field in command}
+
+
+def _find_key(document, key):
+    """
+    Cerca (in ampiezza) il primo valore con la chiave data, anche nei documenti annidati.
+    """
+    pending = [document]
+    while pending:
+        current = pending.pop(0)
+        if isinstance(current, dict):
+            if key in current:
+                return current[key]
+            pending.extend(current.values())
+        elif isinstance(current, list):
+            pending.extend(current)
+    return None
+
+
+def _plan_stages(plan):
+    if not isinstance(plan, dict):
+        return None
+    # Con il motore di esecuzione SBE il piano è in queryPlan
+    plan = plan.get("queryPlan", plan)
+    summary = {field: plan[field] for field in PLAN_FIELDS if field in plan}
+    if "inputStage" in plan:
+        summary["inputStage"] = _plan_stages(plan["inputStage"])
+    if "inputStages" in plan:
+        summary["inputStages"] = [_plan_stages(stage) for stage in plan["inputStages"]]
+    return summary
+
+
+def summarize_explain(explain: dict):
+    """
+    Riduce l'output di explain al piano scelto e alle statistiche di esecuzione, senza i valori della query.
+    """
+    planner = _find_key(explain, "queryPlanner") or {}
+    stats = _find_key(explain, "executionStats") or {}
+    return {
+        "winning_plan": _plan_stages(planner.get("winningPlan")),
+        "n_returned": stats.get("nReturned"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "execution_time_ms": stats.get("executionTimeMillis"),
+    }
+
+
+class SlowQueryMonitor(monitoring.CommandListener):
+    """
+    Individua i comandi MongoDB più lenti della soglia e li registra nella collection slow_queries.
+
+    Il listener viene chiamato dai thread del driver e si limita ad accodare l'operazione;
+    l'explain e la scrittura del registro avvengono nel task run(), fuori dal percorso delle richieste.
+    """
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_THRESHOLD_MS):
+        self.threshold_micros = threshold_ms * 1000
+        self.dropped = 0
+        self._commands = {}
+        self._explained_at = {}
+        # Coda e loop vengono creati in run(): su Python 3.9 una coda è legata al loop in cui viene creata
+        self._queue = None
+        self._loop = None
+
+    def started(self, event):
+        self._commands[(event.connection_id, event.request_id)] = (event.database_name, event.command)
+
+    def succeeded(self, event):
+        database_name, command = self._commands.pop((event.connection_id, event.request_id), (None, None))
+        if command is None or self._loop is None or event.duration_micros < self.threshold_micros:
+            return
+        collection = command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = command.get("collection", "")
+        if collection == "slow_queries" or event.command_name == "explain":
+            # Le operazioni del monitor stesso non vengono registrate
+            return
+        operation = {
+            "database": database_name,
+            "collection": collection,
+            "command_name": event.command_name,
+            "command": command,
+            "duration_ms": event.duration_micros / 1000,
+        }
+        self._loop.call_soon_threadsafe(self._enqueue, operation)
+
+    def failed(self, event):
+        self._commands.pop((event.connection_id, event.request_id), None)
+
+    def _enqueue(self, operation):
+        try:
+            self._queue.put_nowait(operation)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def _should_explain(self, operation, shape):
+        if operation["command_name"] not in EXPLAINABLE_COMMANDS:
+            return False
+        fingerprint = (
+            operation["collection"],
+            operation["command_name"],
+            json.dumps(shape, sort_keys=True, default=str),
+        )
+        now = time.monotonic()
+        if now - self._explained_at.get(fingerprint, float("-inf")) < SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS:
+            return False
+        if len(self._explained_at) > 1000:
+            self._explained_at.clear()
+        self._explained_at[fingerprint] = now
+        return True
+
+    async def build_record(self, client, operation):
+        """
+        Prepara il record dell'operazione lenta, eseguendo l'explain se possibile.
+        """
+        shape = query_shape(operation["command"])
+        record = {
+            "timestamp": datetime.now(get_timezone()),
+            "database": operation["database"],
+            "collection": operation["collection"],
+            "command": operation["command_name"],
+            "duration_ms": operation["duration_ms"],
+            "shape": shape,
+            "explain": None,
+        }
+        if self._should_explain(operation, shape):
+            command = {key: value for key, value in operation["command"].items() if key not in DRIVER_FIELDS}
+            try:
+                explain = await client.get_database(operation["database"]).command(
+                    {"explain": command, "verbosity": "executionStats"}
+                )
+                record["explain"] = summarize_explain(explain)
+            except PyMongoError as e:
+                record["explain_error"] = str(e)
+        return record
+
+    async def run(self, database):
+        """
+        Registra le operazioni lente accodate, finché il task non viene cancellato.
+        """
+        repository = SlowQueryRepository(database)
+        try:
+            await repository.ensure_collection()
+        except PyMongoError as e:
+            logger.error("Error creating slow_queries collection: %s", e)
+            return
+
+        self._queue = asyncio.Queue(maxsize=SLOW_QUERY_QUEUE_SIZE)
+        self._loop = asyncio.get_running_loop()
+        try:
+            while True:
+                operation = await self._queue.get()
+                try:
+                    await repository.add(await self.build_record(database.client, operation))
+                except PyMongoError as e:
+                    logger.error("Error recording slow query: %s", e)
+        finally:
+            self._loop = None
+
+
+slow_query_monitor = SlowQueryMonitor()
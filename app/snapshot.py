@@ -0,0 +1,193 @@
+import logging
+import asyncio
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+import bson
+
+from app.cache import faq_cache, settings_cache
+
+logger = logging.getLogger(__name__)
+
+# File della snapshot condivisa tra i worker (meglio su tmpfs, es. /dev/shm); se vuoto la snapshot è disattivata
+CONFIG_SNAPSHOT_PATH = os.getenv("CONFIG_SNAPSHOT_PATH", "")
+# Età massima della snapshot: oltre questo limite i dati vengono letti da MongoDB finché non viene ripubblicata
+CONFIG_SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("CONFIG_SNAPSHOT_MAX_AGE_SECONDS", 60))
+# Intervallo minimo tra due controlli del file (stat) da parte dello stesso worker
+CONFIG_SNAPSHOT_CHECK_INTERVAL_SECONDS = float(os.getenv("CONFIG_SNAPSHOT_CHECK_INTERVAL_SECONDS", 1))
+
+# Intestazione: magic, versione (ns) e lunghezza del contenuto BSON
+SNAPSHOT_MAGIC = b"SPLC"
+SNAPSHOT_HEADER = struct.Struct("<4sQI")
+
+
+class ConfigSnapshot:
+    """
+    Snapshot in sola lettura di impostazioni e FAQ, condivisa tra i worker tramite un file mappato in memoria.
+
+    Chi modifica i dati pubblica un nuovo file (scritto a parte e sostituito con os.replace, quindi
+    i lettori non vedono mai un file a metà). Ogni worker controlla con uno stat, al più una volta
+    ogni CONFIG_SNAPSHOT_CHECK_INTERVAL_SECONDS, se il file è cambiato e solo in quel caso lo rimappa;
+    quando la versione cambia invalida le proprie cache.
+    La versione è l'istante di pubblicazione: una snapshot più vecchia di CONFIG_SNAPSHOT_MAX_AGE_SECONDS
+    (ad esempio perché i dati sono stati modificati da un altro nodo e la ripubblicazione periodica è fallita)
+    non viene usata e i dati vengono letti da MongoDB.
+    """
+
+    def __init__(
+        self,
+        path: str = CONFIG_SNAPSHOT_PATH,
+        caches=(faq_cache, settings_cache),
+        max_age: float = CONFIG_SNAPSHOT_MAX_AGE_SECONDS,
+    ):
+        self.path = path
+        self.caches = caches
+        self.max_age = max_age
+        self.version = None
+        self._file_id = None
+        self._mmap = None
+        self._data = None
+        self._next_check = 0.0
+        for cache in caches:
+            # Ogni lettura dalle cache controlla prima se la snapshot è cambiata
+            cache.refresh = self.read
+
+    def read(self):
+        """
+        Restituisce il contenuto della snapshot, o None se è disattivata o non ancora pubblicata.
+        """
+        if not self.path:
+            return None
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + CONFIG_SNAPSHOT_CHECK_INTERVAL_SECONDS
+            self._check()
+        if self._data is None or time.time_ns() - self.version > self.max_age * 1e9:
+            return None
+        return self._data
+
+    def _check(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            # Snapshot rimossa dopo una pubblicazione fallita
+            self._file_id = self._data = None
+            return
+
+        file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if file_id != self._file_id:
+            try:
+                self._remap(file_id)
+            except (OSError, ValueError, bson.errors.BSONError) as e:
+                logger.error("Error reading config snapshot: %s", e)
+                self._file_id = self._data = None
+
+    def _remap(self, file_id):
+        with open(self.path, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, length = SNAPSHOT_HEADER.unpack_from(mapped)
+        if magic != SNAPSHOT_MAGIC:
+            mapped.close()
+            raise ValueError("invalid snapshot header")
+        data = bson.decode(mapped[SNAPSHOT_HEADER.size : SNAPSHOT_HEADER.size + length])
+
+        if self._mmap is not None:
+            self._mmap.close()
+        changed = data != self._data
+        self._mmap, self._file_id, self._data, self.version = mapped, file_id, data, version
+        if changed:
+            # Un altro worker ha pubblicato dati nuovi (la ripubblicazione periodica degli stessi dati no):
+            # le cache locali sono obsolete
+            for cache in self.caches:
+                cache.bump()
+
+    def _lock(self):
+        """
+        Apre il file di lock che serializza le pubblicazioni dei worker (va chiuso dal chiamante).
+        """
+        lock = open(self.path + ".lock", "a")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def _published_version(self):
+        try:
+            with open(self.path, "rb") as file:
+                return SNAPSHOT_HEADER.unpack(file.read(SNAPSHOT_HEADER.size))[1]
+        except (FileNotFoundError, struct.error):
+            return None
+
+    def write(self, data: dict, version: int):
+        """
+        Pubblica una nuova snapshot sostituendo atomicamente il file.
+        Il file non viene sostituito se contiene già una versione più recente.
+        Returns:
+            bool: True se la snapshot è stata pubblicata.
+        """
+        payload = bson.encode(data)
+        with self._lock():
+            current_version = self._published_version()
+            if current_version is not None and current_version > version:
+                return False
+
+            descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".")
+            try:
+                with os.fdopen(descriptor, "wb") as file:
+                    file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, version, len(payload)))
+                    file.write(payload)
+                os.replace(temporary_path, self.path)
+            except BaseException:
+                os.unlink(temporary_path)
+                raise
+        return True
+
+    def discard(self, version: int):
+        """
+        Rimuove la snapshot se non è più recente di version, così i worker leggono da MongoDB.
+        Usato quando la pubblicazione di dati modificati fallisce.
+        """
+        with self._lock():
+            current_version = self._published_version()
+            if current_version is not None and current_version <= version:
+                os.unlink(self.path)
+
+
+config_snapshot = ConfigSnapshot()
+
+
+async def publish_snapshot(database):
+    """
+    Legge impostazioni e FAQ dal database e pubblica la snapshot per tutti i worker.
+    Se la pubblicazione fallisce la snapshot precedente, ormai obsoleta, viene rimossa.
+    """
+    if not config_snapshot.path:
+        return
+    # La versione è presa prima delle letture: una pubblicazione concorrente con dati più recenti non viene sovrascritta
+    version = time.time_ns()
+    try:
+        data = {
+            "settings": await database.get_collection("settings").find_one({"_id": "main"}),
+            "faqs": await database.get_collection("faq").find().to_list(length=None),
+        }
+        await asyncio.to_thread(config_snapshot.write, data, version)
+    except Exception as e:
+        logger.error("Error publishing config snapshot: %s", e)
+        try:
+            await asyncio.to_thread(config_snapshot.discard, version)
+        except OSError as e:
+            logger.error("Error removing stale config snapshot: %s", e)
+
+
+async def refresh_snapshot(database):
+    """
+    Ripubblica periodicamente la snapshot, finché il task non viene cancellato: raccoglie le modifiche
+    fatte da altri nodi prima che la snapshot superi l'età massima.
+    """
+    if not config_snapshot.path:
+        return
+    while True:
+        await asyncio.sleep(config_snapshot.max_age / 2)
+        await publish_snapshot(database)
@@ -2,6 +2,7 @@ from passlib.context import CryptContext
 import uuid
 import pytz
 import hashlib
+import unicodedata
 from bson import ObjectId
 import os
 
@@ -32,3 +33,73 @@ def get_timezone():
     Get the timezone of the server.
     """
     return pytz.timezone(os.getenv("TZ", "Europe/Rome"))
+
+
+def strip_accents(text):
+    """
+    Rimuove gli accenti dal testo (es. "perché" -> "perche").
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def normalize_name(name):
+    """
+    Normalizza un nome per la ricerca per prefisso: minuscolo, senza accenti e spazi superflui.
+    Restituisce la lista dei suffissi per parola (es. "Mario De Rossi" -> ["mario de rossi", "de rossi", "rossi"]),
+    così che un indice multikey permetta di cercare per prefisso a partire da qualunque parola.
+    """
+    if not name:
+        return []
+    words = strip_accents(name).casefold().split()
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+def parse_byte_range(range_header, total_length):
+    """
+    Interpreta un header HTTP Range con un singolo intervallo di byte (es. "bytes=0-499", "bytes=500-", "bytes=-500").
+    Restituisce la coppia (inizio, fine) con la fine inclusa, oppure None se l'header è assente o non interpretabile.
+    Raises:
+        ValueError: Se l'intervallo non è soddisfacibile per un file di total_length byte.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start, _, end = range_header[len("bytes="):].strip().partition("-")
+    if (start and not start.isdigit()) or (end and not end.isdigit()) or not (start or end):
+        return None
+    if total_length == 0:
+        raise ValueError("Range not satisfiable")
+
+    if not start:
+        # Intervallo finale: gli ultimi N byte
+        suffix_length = int(end)
+        if suffix_length == 0:
+            raise ValueError("Range not satisfiable")
+        return max(0, total_length - suffix_length), total_length - 1
+
+    first = int(start)
+    last = int(end) if end else total_length - 1
+    if first >= total_length or last < first:
+        raise ValueError("Range not satisfiable")
+    return first, min(last, total_length - 1)
+
+
+def make_etag(content):
+    """
+    Restituisce un ETag forte (tra virgolette) calcolato come hash del contenuto.
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return '"' + hashlib.sha256(content).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match, *etags):
+    """
+    Controlla se l'header If-None-Match contiene uno degli ETag passati (confronto debole, RFC 9110).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return any(etag.removeprefix("W/") in candidates for etag in etags)
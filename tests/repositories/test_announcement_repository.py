@@ -0,0 +1,87 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from bson import ObjectId
+
+from app.repositories.announcement_repository import (
+    AnnouncementRepository,
+    get_announcement_repository,
+)
+from app.schemas import Announcement
+
+
+@pytest.fixture
+def mock_database():
+    mock_db = MagicMock()
+    mock_collection = MagicMock()
+    mock_collection.find_one = AsyncMock()
+    mock_collection.insert_one = AsyncMock()
+    mock_collection.update_one = AsyncMock()
+    mock_collection.find_one_and_update = AsyncMock()
+    mock_db.get_collection.return_value = mock_collection
+    return mock_db
+
+
+@pytest.fixture
+def announcement_repository(mock_database):
+    return AnnouncementRepository(mock_database)
+
+
+@pytest.mark.asyncio
+async def test__unit_test__create_announcement(announcement_repository, mock_database):
+    mock_collection = mock_database.get_collection.return_value
+    announcement_id = ObjectId()
+    mock_collection.insert_one.return_value = MagicMock(inserted_id=announcement_id)
+
+    result = await announcement_repository.create_announcement(
+        Announcement(subject="Manutenzione", body="<p>Domani</p>"), "admin@test.it"
+    )
+
+    assert result == announcement_id
+    inserted = mock_collection.insert_one.call_args[0][0]
+    assert inserted["status"] == "pending"
+    assert inserted["last_recipient"] is None
+    assert inserted["bcc"] is True
+
+
+@pytest.mark.asyncio
+async def test__unit_test__claim_announcement(announcement_repository, mock_database):
+    mock_collection = mock_database.get_collection.return_value
+    announcement_id = ObjectId()
+    mock_collection.find_one_and_update.return_value = {"_id": announcement_id, "status": "running"}
+
+    result = await announcement_repository.claim_announcement(announcement_id, 60)
+
+    assert result["status"] == "running"
+    query = mock_collection.find_one_and_update.call_args[0][0]
+    assert query["_id"] == announcement_id
+    assert {"status": "pending"} in query["$or"]
+
+
+@pytest.mark.asyncio
+async def test__unit_test__record_progress(announcement_repository, mock_database):
+    mock_collection = mock_database.get_collection.return_value
+    announcement_id = ObjectId()
+
+    await announcement_repository.record_progress(announcement_id, "b@test.it", 2, 60)
+
+    query, update = mock_collection.update_one.call_args[0]
+    assert query == {"_id": announcement_id}
+    assert update["$set"]["last_recipient"] == "b@test.it"
+    assert update["$inc"] == {"sent_count": 2}
+
+
+@pytest.mark.asyncio
+async def test__unit_test__finish_announcement_with_error(announcement_repository, mock_database):
+    mock_collection = mock_database.get_collection.return_value
+
+    await announcement_repository.finish_announcement(ObjectId(), error="SMTP down")
+
+    update = mock_collection.update_one.call_args[0][1]
+    assert update["$set"]["status"] == "failed"
+    assert update["$set"]["error"] == "SMTP down"
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_announcement_repository_returns_instance(mock_database):
+    repo = get_announcement_repository(mock_database)
+    assert isinstance(repo, AnnouncementRepository)
@@ -0,0 +1,108 @@
+import hashlib
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from bson import ObjectId
+
+from gridfs.errors import NoFile
+
+from app.repositories.document_file_repository import (
+    DocumentFileRepository,
+    get_document_file_repository,
+)
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+@pytest.fixture
+def mock_database():
+    mock_db = MagicMock()
+    mock_collection = MagicMock()
+    mock_collection.find_one = AsyncMock(return_value=None)
+    mock_collection.find_one_and_update = AsyncMock(return_value=None)
+    mock_collection.create_index = AsyncMock()
+    mock_db.get_collection.return_value = mock_collection
+    return mock_db
+
+
+@pytest.fixture
+def grid_in():
+    grid_in = MagicMock()
+    grid_in._id = ObjectId()
+    grid_in.closed = False
+    grid_in.write = AsyncMock()
+    grid_in.set = AsyncMock()
+    grid_in.close = AsyncMock()
+    grid_in.abort = AsyncMock()
+    return grid_in
+
+
+@pytest.fixture
+def document_file_repository(mock_database, grid_in):
+    repository = DocumentFileRepository(mock_database)
+    repository._bucket = MagicMock()
+    repository._bucket.open_upload_stream.return_value = grid_in
+    return repository
+
+
+@pytest.mark.asyncio
+async def test__unit_test__upload_hashes_while_streaming(document_file_repository, grid_in):
+    result = await document_file_repository.upload("a.pdf", chunks(b"hello ", b"", b"world"), "application/pdf")
+
+    assert result == {
+        "file_id": grid_in._id,
+        "sha256": hashlib.sha256(b"hello world").hexdigest(),
+        "length": 11,
+        "deduplicated": False,
+    }
+    assert grid_in.write.await_count == 2
+    grid_in.set.assert_any_await("sha256", result["sha256"])
+    grid_in.close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__upload_deduplicates_content(document_file_repository, mock_database, grid_in):
+    existing_id = ObjectId()
+    mock_database.get_collection().find_one_and_update.return_value = {"_id": existing_id, "length": 5}
+
+    result = await document_file_repository.upload("a.pdf", chunks(b"hello"), "application/pdf")
+
+    assert result["file_id"] == existing_id
+    assert result["deduplicated"] is True
+    grid_in.abort.assert_awaited_once()
+    grid_in.close.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__upload_error_aborts(document_file_repository, grid_in):
+    grid_in.write.side_effect = Exception("DB error")
+
+    with pytest.raises(Exception):
+        await document_file_repository.upload("a.pdf", chunks(b"hello"), "application/pdf")
+    grid_in.abort.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_document_file_repository_returns_instance(mock_database):
+    repo = get_document_file_repository(mock_database)
+    assert isinstance(repo, DocumentFileRepository)
+
+
+@pytest.mark.asyncio
+async def test__unit_test__delete_orphans(document_file_repository, mock_database):
+    shared, orphan, already_deleted = ObjectId(), ObjectId(), ObjectId()
+    collection = mock_database.get_collection()
+    collection.find.return_value.to_list = AsyncMock(
+        return_value=[{"_id": shared}, {"_id": orphan}, {"_id": already_deleted}]
+    )
+    # Il file deduplicato è ancora usato da un altro documento
+    collection.distinct = AsyncMock(return_value=[shared])
+    document_file_repository._bucket.delete = AsyncMock(side_effect=[None, NoFile("deleted")])
+
+    assert await document_file_repository.delete_orphans() == 1
+
+    deleted = [call.args[0] for call in document_file_repository._bucket.delete.await_args_list]
+    assert deleted == [orphan, already_deleted]
+    assert collection.distinct.await_args.args == ("file_id", {"file_id": {"$in": [shared, orphan, already_deleted]}})
@@ -2,10 +2,11 @@ import pytest
 from unittest.mock import AsyncMock, MagicMock
 from datetime import datetime
 from bson import ObjectId
-from pymongo.errors import DuplicateKeyError
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
-from app.repositories.document_repository import DocumentRepository, get_document_repository
+from app.repositories.document_repository import DocumentRepository, get_document_repository, INGESTION_MAX_ATTEMPTS
 from app.schemas import Document
+from app.utils import get_object_id
 
 
 @pytest.fixture
@@ -13,8 +14,14 @@ def mock_database():
     mock_db = MagicMock()
     mock_collection = MagicMock()
     mock_collection.find.return_value.to_list = AsyncMock(return_value=[])
+    mock_collection.find.return_value.sort.return_value = mock_collection.find.return_value
+    mock_collection.find.return_value.limit.return_value = mock_collection.find.return_value
     mock_collection.insert_one = AsyncMock()
+    mock_collection.update_one = AsyncMock()
     mock_collection.delete_one = AsyncMock()
+    mock_collection.delete_many = AsyncMock()
+    mock_collection.insert_many = AsyncMock()
+    mock_collection.find_one_and_update = AsyncMock(return_value={"seq": 1})
     mock_db.get_collection.return_value = mock_collection
     return mock_db
 
@@ -32,6 +39,75 @@ async def test__unit_test__get_documents(document_repository, mock_database):
     assert result == expected_documents
 
 
+@pytest.mark.asyncio
+async def test__unit_test__get_documents_filters(document_repository, mock_database, monkeypatch):
+    monkeypatch.setenv("TZ", "Europe/Rome")
+    mock_collection = mock_database.get_collection()
+    last_id = ObjectId()
+    cursor = DocumentRepository.encode_cursor({"_id": last_id, "uploaded_at": "2025-05-02T10:00:00+02:00"})
+
+    await document_repository.get_documents(
+        limit=1000,
+        cursor=cursor,
+        owner_email="admin@test.it",
+        uploaded_from="2025-05-01",
+        uploaded_to="2025-05-31",
+        title_prefix="Listino (",
+    )
+
+    query = mock_collection.find.call_args[0][0]
+    assert query["$and"][0] == {"owner_email": "admin@test.it"}
+    # I limiti sono i giorni locali (ora legale, +02:00) convertiti in UTC
+    assert query["$and"][1] == {
+        "uploaded_at": {"$gte": "2025-04-30T22:00:00.000000+00:00", "$lt": "2025-05-31T22:00:00.000000+00:00"}
+    }
+    assert query["$and"][2] == {"title": {"$regex": "^Listino\\ \\("}}
+    assert query["$and"][3]["$or"][1] == {
+        "uploaded_at": "2025-05-02T08:00:00.000000+00:00", "_id": {"$lt": last_id}
+    }
+    mock_collection.find.return_value.limit.assert_called_once_with(500)
+
+
+def test__unit_test__encode_cursor_orders_across_dst():
+    # 02:30 dopo il ritorno all'ora solare (+01:00) è successivo a 02:45 dell'ora legale (+02:00),
+    # ma come stringa con il fuso orario locale risulterebbe precedente
+    before = DocumentRepository.decode_cursor(
+        DocumentRepository.encode_cursor({"_id": ObjectId(), "uploaded_at": "2025-10-26T02:45:00+02:00"})
+    )[0]
+    after = DocumentRepository.decode_cursor(
+        DocumentRepository.encode_cursor({"_id": ObjectId(), "uploaded_at": "2025-10-26T02:30:00+01:00"})
+    )[0]
+    assert before < after
+
+
+@pytest.mark.asyncio
+async def test__unit_test__normalize_uploaded_at(document_repository, mock_database):
+    document_id = ObjectId()
+    collection = mock_database.get_collection()
+
+    async def find(*args, **kwargs):
+        yield {"_id": document_id, "uploaded_at": "2025-05-02T10:00:00+02:00"}
+    collection.find = MagicMock(side_effect=find)
+    collection.bulk_write = AsyncMock()
+
+    await document_repository.normalize_uploaded_at()
+
+    operation = collection.bulk_write.await_args.args[0][0]
+    assert operation._filter == {"_id": document_id, "uploaded_at": "2025-05-02T10:00:00+02:00"}
+    assert operation._doc == {"$set": {"uploaded_at": "2025-05-02T08:00:00.000000+00:00"}}
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_documents_invalid_date(document_repository):
+    with pytest.raises(ValueError):
+        await document_repository.get_documents(uploaded_from="01/05/2025")
+
+
+def test__unit_test__decode_cursor_invalid():
+    with pytest.raises(ValueError):
+        DocumentRepository.decode_cursor("not-a-cursor")
+
+
 @pytest.mark.asyncio
 async def test__unit_test__insert_document_success(document_repository, mock_database, monkeypatch):
     email = "test@example.com"
@@ -83,6 +159,42 @@ async def test__unit_test__insert_document_duplicate_key(document_repository, mo
         await document_repository.insert_document(email, doc)
 
 
+@pytest.mark.asyncio
+async def test__unit_test__insert_documents(document_repository, mock_database):
+    documents = [
+        Document(title="A", file_path="/a.pdf"),
+        Document(title="A bis", file_path="/a.pdf"),
+        Document(title="B", file_path="/b.pdf"),
+    ]
+    existing_id = get_object_id("/b.pdf")
+    mock_database.get_collection().insert_many = AsyncMock(
+        side_effect=BulkWriteError({"writeErrors": [{"code": 11000, "op": {"_id": existing_id}}]})
+    )
+
+    created, existing = await document_repository.insert_documents("admin@test.it", documents)
+
+    assert created == [get_object_id("/a.pdf")]
+    assert existing == [existing_id]
+    inserted, = mock_database.get_collection().insert_many.call_args[0]
+    assert len(inserted) == 2
+    assert mock_database.get_collection().insert_many.call_args[1] == {"ordered": False}
+
+
+@pytest.mark.asyncio
+async def test__unit_test__insert_documents_error(document_repository, mock_database):
+    mock_database.get_collection().insert_many = AsyncMock(
+        side_effect=BulkWriteError({"writeErrors": [{"code": 121, "op": {"_id": ObjectId()}}]})
+    )
+
+    with pytest.raises(Exception, match="Error inserting documents"):
+        await document_repository.insert_documents("admin@test.it", [Document(title="A", file_path="/a.pdf")])
+
+
+@pytest.mark.asyncio
+async def test__unit_test__insert_documents_empty(document_repository):
+    assert await document_repository.insert_documents("admin@test.it", []) == ([], [])
+
+
 @pytest.mark.asyncio
 async def test__unit_test__delete_document(document_repository, mock_database):
     file_id = ObjectId()
@@ -105,4 +217,81 @@ async def test__unit_test__delete_document_error(document_repository, mock_datab
 async def test__unit_test__get_document_repository_returns_instance(mock_database):
     test_db = mock_database["test_database"]
     repo = get_document_repository(test_db)
-    assert isinstance(repo, DocumentRepository)
\ No newline at end of file
+    assert isinstance(repo, DocumentRepository)
+
+@pytest.mark.asyncio
+async def test__unit_test__claim_document(document_repository, mock_database):
+    claimed = {"_id": ObjectId(), "ingestion_state": "processing", "lease_owner": "worker-1"}
+    # La prima chiamata riserva il numero di sequenza, la seconda assegna il documento
+    mock_database.get_collection().find_one_and_update = AsyncMock(side_effect=[{"seq": 3}, claimed])
+
+    result = await document_repository.claim_document("worker-1", lease_seconds=60)
+
+    assert result == claimed
+    query, update = mock_database.get_collection().find_one_and_update.await_args.args
+    assert query["$or"][0] == {"ingestion_state": "pending"}
+    assert query["$or"][1]["ingestion_state"] == "processing"
+    assert "$lt" in query["$or"][1]["lease_expires_at"]
+    assert update["$set"]["lease_owner"] == "worker-1"
+    assert update["$inc"] == {"ingestion_attempts": 1}
+    # Il lease compare nella lista dei documenti: anche l'assegnazione è una modifica
+    assert update["$set"]["sync_seq"] == 3
+
+
+@pytest.mark.asyncio
+async def test__unit_test__fail_expired_leases(document_repository, mock_database):
+    expired_id = ObjectId()
+    collection = mock_database.get_collection()
+    collection.find.return_value.to_list = AsyncMock(return_value=[{"_id": expired_id}])
+    collection.bulk_write = AsyncMock(return_value=MagicMock(modified_count=1))
+
+    assert await document_repository.fail_expired_leases() == 1
+
+    query = collection.find.call_args.args[0]
+    assert query["ingestion_state"] == "processing"
+    assert query["ingestion_attempts"] == {"$gte": INGESTION_MAX_ATTEMPTS}
+    operation = collection.bulk_write.await_args.args[0][0]
+    assert operation._filter["_id"] == expired_id
+    assert operation._doc["$set"]["ingestion_state"] == "failed"
+    assert operation._doc["$set"]["sync_seq"] == 1
+
+
+@pytest.mark.asyncio
+async def test__unit_test__complete_ingestion_requires_lease(document_repository, mock_database):
+    document_id = ObjectId()
+    mock_database.get_collection().update_one = AsyncMock(return_value=MagicMock(matched_count=0))
+
+    assert await document_repository.complete_ingestion(document_id, "worker-1") is False
+    query = mock_database.get_collection().update_one.await_args_list[0].args[0]
+    assert query == {"_id": document_id, "ingestion_state": "processing", "lease_owner": "worker-1"}
+
+
+@pytest.mark.asyncio
+async def test__unit_test__fail_ingestion(document_repository, mock_database):
+    mock_database.get_collection().update_one = AsyncMock(return_value=MagicMock(matched_count=1))
+
+    assert await document_repository.fail_ingestion(ObjectId(), "worker-1", "boom") is True
+    pipeline = mock_database.get_collection().update_one.await_args_list[0].args[1]
+    assert pipeline[0]["$set"]["ingestion_error"] == {"$literal": "boom"}
+    assert pipeline[0]["$set"]["sync_seq"] == 1
+    assert pipeline[1] == {"$unset": ["lease_owner", "lease_expires_at"]}
+
+
+
+@pytest.mark.asyncio
+async def test__unit_test__delete_documents(document_repository, mock_database):
+    found_id, missing_id = ObjectId(), ObjectId()
+    mock_collection = mock_database.get_collection()
+
+    async def find(*args, **kwargs):
+        yield {"_id": found_id}
+    mock_collection.find = MagicMock(side_effect=find)
+    mock_collection.delete_many = AsyncMock()
+
+    deleted, missing = await document_repository.delete_documents([found_id, missing_id, found_id])
+
+    assert deleted == [found_id]
+    assert missing == [missing_id]
+    mock_collection.delete_many.assert_awaited_once_with({"_id": {"$in": [found_id]}})
+    tombstones = mock_collection.insert_many.await_args.args[0]
+    assert [tombstone["doc_id"] for tombstone in tombstones] == [found_id]
@@ -18,6 +18,9 @@ def mock_database():
     mock_collection.insert_one = AsyncMock()
     mock_collection.update_one = AsyncMock()
     mock_collection.delete_one = AsyncMock()
+    mock_collection.delete_many = AsyncMock()
+    mock_collection.insert_many = AsyncMock()
+    mock_collection.find_one_and_update = AsyncMock(return_value={"seq": 1})
     mock_db.get_collection.return_value = mock_collection
     return mock_db
 
@@ -96,7 +99,10 @@ async def test__unit_test__update_faq_success(faq_repository, mock_database, mon
     mock_database.get_collection().update_one = AsyncMock(return_value=mock_result)
 
     await faq_repository.update_faq(faq_id, faq_data, "user@example.com")
-    mock_database.get_collection().update_one.assert_called_once()
+    update, release = mock_database.get_collection().update_one.await_args_list
+    assert update.args[0] == {"_id": faq_id}
+    # Il numero di sequenza viene rilasciato dopo la scrittura
+    assert release.args == ({"_id": "faq"}, {"$pull": {"pending": {"seq": 1}}})
 
 @pytest.mark.asyncio
 async def test__unit_test__update_faq_not_updated(faq_repository, mock_database, monkeypatch):
@@ -181,4 +187,108 @@ async def test__unit_test__delete_faq_error(faq_repository, mock_database):
 async def test__unit_test__get_faq_repository_returns_instance(mock_database):
     test_db = mock_database["test_database"]
     repo = get_faq_repository(test_db)
-    assert isinstance(repo, FaqRepository)
\ No newline at end of file
+    assert isinstance(repo, FaqRepository)
+
+@pytest.mark.asyncio
+async def test__unit_test__delete_faq_records_tombstone(faq_repository, mock_database):
+    faq_id = ObjectId()
+    mock_database.get_collection().delete_one = AsyncMock(return_value=MagicMock(deleted_count=1))
+
+    await faq_repository.delete_faq(faq_id)
+
+    tombstones = mock_database.get_collection().insert_many.await_args.args[0]
+    assert tombstones[0]["collection"] == "faq"
+    assert tombstones[0]["doc_id"] == faq_id
+
+
+@pytest.mark.asyncio
+async def test__unit_test__delete_faq_tombstone_before_delete(faq_repository, mock_database, monkeypatch):
+    collection = mock_database.get_collection()
+    calls = []
+    collection.insert_many = AsyncMock(side_effect=lambda *args: calls.append("tombstone"))
+    collection.delete_one = AsyncMock(
+        side_effect=lambda *args: calls.append("delete") or MagicMock(deleted_count=1)
+    )
+    monkeypatch.setattr(
+        "app.repositories.faq_repository.publish_snapshot", AsyncMock(side_effect=Exception("disk full"))
+    )
+
+    with pytest.raises(Exception):
+        await faq_repository.delete_faq(ObjectId())
+
+    # La tombstone è già scritta quando il delete avviene: l'errore dello snapshot non la perde
+    assert calls == ["tombstone", "delete"]
+    collection.delete_many.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__search_faqs_text_index(faq_repository, mock_database):
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.skip.return_value = cursor
+    cursor.limit.return_value = cursor
+    cursor.to_list = AsyncMock(return_value=[{"_id": ObjectId(), "score": 2.0}] * 3)
+    mock_database.get_collection().find = MagicMock(return_value=cursor)
+
+    results, next_offset = await faq_repository.search_faqs("password", limit=2, offset=4)
+
+    assert len(results) == 2
+    assert next_offset == 6
+    query = mock_database.get_collection().find.call_args.args[0]
+    assert query == {"$text": {"$search": "password", "$language": "italian"}}
+    cursor.skip.assert_called_once_with(4)
+    cursor.limit.assert_called_once_with(3)
+
+
+@pytest.mark.asyncio
+async def test__unit_test__search_faqs_in_memory(faq_repository, monkeypatch):
+    from app.cache import faq_cache
+
+    monkeypatch.setattr("app.repositories.faq_repository.FAQ_SEARCH_BACKEND", "memory")
+    faq = {"_id": ObjectId(), "title": "Password", "question": "Come la cambio?", "answer": "Dal profilo"}
+    faq_repository.get_faqs = AsyncMock(return_value=[faq])
+    faq_cache.bump()
+
+    results, next_offset = await faq_repository.search_faqs("password")
+    await faq_repository.search_faqs("profilo")
+
+    assert results[0]["_id"] == faq["_id"]
+    assert results[0]["score"] > 0
+    assert next_offset is None
+    # L'indice viene costruito una sola volta finché le FAQ non cambiano
+    faq_repository.get_faqs.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__match_faq(faq_repository):
+    from app.cache import faq_cache
+
+    faq = {"_id": ObjectId(), "title": "Password", "question": "Come cambio la password?", "answer": "Dal profilo"}
+    faq_repository.get_faqs = AsyncMock(return_value=[faq])
+    faq_cache.bump()
+
+    match, score = await faq_repository.match_faq("come cambio la password")
+
+    assert match == faq
+    assert score > 0.9
+
+
+@pytest.mark.asyncio
+async def test__unit_test__import_faqs(faq_repository, mock_database):
+    mock_database.get_collection().bulk_write = AsyncMock(
+        return_value=MagicMock(upserted_count=1, modified_count=0)
+    )
+    faqs = [
+        FAQ(title="T1", question="Q", answer="old"),
+        FAQ(title="T2", question="Q", answer="$5"),
+        FAQ(title="T1", question="Q", answer="new"),
+    ]
+
+    result = await faq_repository.import_faqs(faqs, "admin@test.it")
+
+    assert result == {"created": 1, "updated": 0, "unchanged": 1}
+    operations = mock_database.get_collection().bulk_write.await_args.args[0]
+    assert len(operations) == 2
+    assert operations[0]._filter == {"title": "T1"}
+    assert operations[0]._doc[0]["$set"]["answer"] == {"$literal": "new"}
+    assert operations[0]._upsert is True
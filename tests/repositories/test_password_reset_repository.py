@@ -0,0 +1,70 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from app.repositories.password_reset_repository import (
+    PasswordResetRepository,
+    get_password_reset_repository,
+)
+
+
+@pytest.fixture
+def mock_database():
+    mock_db = MagicMock()
+    mock_db.command = AsyncMock()
+    mock_collection = MagicMock()
+    mock_collection.find_one_and_update = AsyncMock()
+    mock_collection.delete_one = AsyncMock()
+    mock_collection.create_index = AsyncMock()
+    mock_db.get_collection.return_value = mock_collection
+    return mock_db
+
+
+@pytest.fixture
+def password_reset_repository(mock_database):
+    return PasswordResetRepository(mock_database)
+
+
+@pytest.mark.asyncio
+async def test__unit_test__try_acquire_first_request(password_reset_repository, mock_database):
+    mock_collection = mock_database.get_collection.return_value
+
+    assert await password_reset_repository.try_acquire("a@test.it", 60) is True
+
+    query = mock_collection.find_one_and_update.call_args[0][0]
+    assert query["_id"] == "a@test.it"
+    assert "$lt" in query["requested_at"]
+    assert mock_collection.find_one_and_update.call_args[1] == {"upsert": True}
+
+
+@pytest.mark.asyncio
+async def test__unit_test__try_acquire_duplicate(password_reset_repository, mock_database):
+    mock_collection = mock_database.get_collection.return_value
+    mock_collection.find_one_and_update.side_effect = DuplicateKeyError("dup")
+
+    assert await password_reset_repository.try_acquire("a@test.it", 60) is False
+
+
+@pytest.mark.asyncio
+async def test__unit_test__release(password_reset_repository, mock_database):
+    mock_collection = mock_database.get_collection.return_value
+
+    await password_reset_repository.release("a@test.it")
+
+    mock_collection.delete_one.assert_awaited_once_with({"_id": "a@test.it"})
+
+
+@pytest.mark.asyncio
+async def test__unit_test__ensure_indexes_updates_ttl(password_reset_repository, mock_database):
+    mock_collection = mock_database.get_collection.return_value
+    mock_collection.create_index.side_effect = OperationFailure("IndexOptionsConflict")
+
+    await password_reset_repository.ensure_indexes()
+
+    assert mock_database.command.call_args[0][:2] == ("collMod", "password_resets")
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_password_reset_repository_returns_instance(mock_database):
+    repo = get_password_reset_repository(mock_database)
+    assert isinstance(repo, PasswordResetRepository)
@@ -0,0 +1,70 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.cache import settings_cache
+from app.repositories.setting_repository import (
+    DEFAULT_SETTINGS,
+    SettingRepository,
+    get_setting_repository,
+)
+from app.schemas import Settings
+
+
+@pytest.fixture
+def mock_database():
+    mock_db = MagicMock()
+    mock_collection = MagicMock()
+    mock_collection.find_one = AsyncMock(return_value={"_id": "main", **DEFAULT_SETTINGS})
+    mock_collection.update_one = AsyncMock()
+    mock_collection.find_one_and_update = AsyncMock()
+    mock_db.get_collection.return_value = mock_collection
+    return mock_db
+
+
+@pytest.fixture
+def setting_repository(mock_database):
+    settings_cache.bump()
+    return SettingRepository(mock_database)
+
+
+def test__unit_test__constructor_does_no_io(setting_repository, mock_database):
+    mock_database.get_collection().update_one.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__seed_defaults(setting_repository, mock_database):
+    await setting_repository.seed_defaults()
+    mock_database.get_collection().update_one.assert_awaited_once_with(
+        {"_id": "main"}, {"$setOnInsert": DEFAULT_SETTINGS}, upsert=True
+    )
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_settings_cached(setting_repository, mock_database):
+    first = await setting_repository.get_settings()
+    second = await SettingRepository(mock_database).get_settings()
+
+    assert first == second == {"_id": "main", **DEFAULT_SETTINGS}
+    mock_database.get_collection().find_one.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__update_settings_refreshes_cache(setting_repository, mock_database):
+    updated = {"_id": "main", **DEFAULT_SETTINGS, "message_history": 50}
+    mock_database.get_collection().find_one_and_update.return_value = updated
+    await setting_repository.get_settings()
+
+    await setting_repository.update_settings(Settings(**{**DEFAULT_SETTINGS, "message_history": 50}))
+
+    assert await setting_repository.get_settings() == updated
+    assert mock_database.get_collection().find_one.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test__unit_test__update_settings_unchanged(setting_repository):
+    with pytest.raises(Exception, match="already up to date"):
+        await setting_repository.update_settings(Settings(**DEFAULT_SETTINGS))
+
+
+def test__unit_test__get_setting_repository_returns_instance(mock_database):
+    assert isinstance(get_setting_repository(mock_database), SettingRepository)
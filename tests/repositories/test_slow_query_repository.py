@@ -0,0 +1,40 @@
+import pytest
+from unittest.mock import MagicMock, AsyncMock
+from pymongo.errors import CollectionInvalid
+
+from app.repositories.slow_query_repository import SlowQueryRepository, SLOW_QUERY_MAX_LIMIT
+
+
+@pytest.fixture
+def slow_query_repository():
+    database = MagicMock()
+    database.create_collection = AsyncMock()
+    return SlowQueryRepository(database)
+
+
+@pytest.mark.asyncio
+async def test__unit_test__ensure_collection(slow_query_repository):
+    await slow_query_repository.ensure_collection()
+    args, kwargs = slow_query_repository.database.create_collection.await_args
+    assert args == ("slow_queries",)
+    assert kwargs["capped"] is True
+
+
+@pytest.mark.asyncio
+async def test__unit_test__ensure_collection_already_exists(slow_query_repository):
+    slow_query_repository.database.create_collection.side_effect = CollectionInvalid("exists")
+    await slow_query_repository.ensure_collection()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_slow_queries(slow_query_repository):
+    cursor = MagicMock()
+    cursor.sort.return_value.limit.return_value.to_list = AsyncMock(return_value=[{"collection": "chats"}])
+    slow_query_repository.collection.find = MagicMock(return_value=cursor)
+
+    result = await slow_query_repository.get_slow_queries(collection="chats", limit=10000)
+
+    assert result == [{"collection": "chats"}]
+    slow_query_repository.collection.find.assert_called_once_with({"collection": "chats"})
+    cursor.sort.assert_called_once_with("$natural", -1)
+    cursor.sort.return_value.limit.assert_called_once_with(SLOW_QUERY_MAX_LIMIT)
@@ -0,0 +1,176 @@
+import time
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from bson import ObjectId
+
+from app.repositories.sync_repository import (
+    SyncRepository,
+    SyncTokenExpired,
+    SYNC_PENDING_TIMEOUT_SECONDS,
+    SYNC_TOMBSTONE_TTL_SECONDS,
+)
+
+
+def make_cursor(items):
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.limit.return_value = cursor
+    cursor.to_list = AsyncMock(return_value=items)
+    return cursor
+
+
+@pytest.fixture
+def mock_database():
+    mock_db = MagicMock()
+    collections = {"sync_counters": MagicMock(), "sync_tombstones": MagicMock()}
+    collections["sync_counters"].find_one_and_update = AsyncMock(return_value={"seq": 10})
+    collections["sync_counters"].find_one = AsyncMock(return_value={"seq": 10})
+    collections["sync_counters"].update_one = AsyncMock()
+    collections["sync_tombstones"].insert_many = AsyncMock()
+    collections["sync_tombstones"].delete_many = AsyncMock()
+    collections["sync_tombstones"].find.return_value = make_cursor([])
+    mock_db.get_collection.side_effect = collections.__getitem__
+    return mock_db
+
+
+@pytest.fixture
+def sync_repository(mock_database):
+    return SyncRepository(mock_database)
+
+
+@pytest.mark.asyncio
+async def test__unit_test__next_seq_reserves_range(sync_repository):
+    assert await sync_repository.next_seq("faq", 3) == 8
+    args, kwargs = sync_repository.counters.find_one_and_update.await_args
+    assert args[0] == {"_id": "faq"}
+    assert args[1][0] == {"$set": {"seq": {"$add": [{"$ifNull": ["$seq", 0]}, 3]}}}
+    assert kwargs["upsert"] is True
+
+
+@pytest.mark.asyncio
+async def test__unit_test__reserve_releases_on_error(sync_repository):
+    with pytest.raises(RuntimeError):
+        async with sync_repository.reserve("faq", 3) as seq:
+            assert seq == 8
+            raise RuntimeError()
+
+    sync_repository.counters.update_one.assert_awaited_once_with(
+        {"_id": "faq"}, {"$pull": {"pending": {"seq": 8}}}
+    )
+
+
+@pytest.mark.asyncio
+async def test__unit_test__current_seq_stops_before_pending(sync_repository):
+    now = time.time()
+    sync_repository.counters.find_one.return_value = {
+        "seq": 10,
+        "pending": [
+            {"seq": 7, "reserved_at": now},
+            {"seq": 9, "reserved_at": now},
+            # Prenotazione di un processo terminato: non blocca il feed
+            {"seq": 3, "reserved_at": now - SYNC_PENDING_TIMEOUT_SECONDS - 1},
+        ],
+    }
+
+    assert await sync_repository.current_seq("faq") == 6
+
+
+@pytest.mark.asyncio
+async def test__unit_test__record_deletions(sync_repository):
+    ids = [ObjectId(), ObjectId()]
+    async with sync_repository.record_deletions("faq", ids):
+        # Le tombstone sono scritte prima della cancellazione, con i numeri ancora riservati
+        sync_repository.counters.update_one.assert_not_awaited()
+
+    tombstones = sync_repository.tombstones.insert_many.await_args.args[0]
+    assert [(t["doc_id"], t["seq"]) for t in tombstones] == [(ids[0], 9), (ids[1], 10)]
+    sync_repository.tombstones.delete_many.assert_not_awaited()
+    sync_repository.counters.update_one.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__record_deletions_removes_tombstones_on_error(sync_repository):
+    with pytest.raises(RuntimeError):
+        async with sync_repository.record_deletions("faq", [ObjectId(), ObjectId()]):
+            raise RuntimeError()
+
+    sync_repository.tombstones.delete_many.assert_awaited_once_with(
+        {"collection": "faq", "seq": {"$gte": 9, "$lt": 11}}
+    )
+
+
+def test__unit_test__decode_token():
+    assert SyncRepository.decode_token(SyncRepository.encode_token(42)) == 42
+    with pytest.raises(ValueError):
+        SyncRepository.decode_token("abc")
+    with pytest.raises(SyncTokenExpired):
+        SyncRepository.decode_token(f"1.{int(time.time()) - SYNC_TOMBSTONE_TTL_SECONDS - 10}")
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_changes(sync_repository):
+    inserted, updated, deleted, recreated = ObjectId(), ObjectId(), ObjectId(), ObjectId()
+    collection = MagicMock()
+    collection.find.return_value = make_cursor(
+        [
+            {"_id": updated, "created_seq": 2, "sync_seq": 6},
+            {"_id": inserted, "created_seq": 7, "sync_seq": 7},
+            {"_id": recreated, "created_seq": 9, "sync_seq": 9},
+        ]
+    )
+    sync_repository.tombstones.find.return_value = make_cursor(
+        [{"doc_id": deleted, "seq": 8}, {"doc_id": recreated, "seq": 6}]
+    )
+
+    result = await sync_repository.get_changes(collection, "faq", SyncRepository.encode_token(5))
+
+    assert result["inserted"] == [str(inserted), str(recreated)]
+    assert result["updated"] == [str(updated)]
+    assert result["deleted"] == [str(deleted)]
+    assert result["has_more"] is False
+    assert SyncRepository.decode_token(result["token"]) == 10
+    assert collection.find.call_args_list[0].args[0] == {"sync_seq": {"$gt": 5, "$lte": 10}}
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_changes_ignores_tombstone_of_existing_document(sync_repository):
+    survivor = ObjectId()
+    collection = MagicMock()
+    collection.find.side_effect = [make_cursor([]), make_cursor([{"_id": survivor}])]
+    # Tombstone rimasta da un processo terminato prima di eliminare il documento
+    sync_repository.tombstones.find.return_value = make_cursor([{"doc_id": survivor, "seq": 8}])
+
+    result = await sync_repository.get_changes(collection, "faq", SyncRepository.encode_token(5))
+
+    assert result["deleted"] == []
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_changes_waits_for_pending_writes(sync_repository):
+    # La scrittura con il numero 8 non è ancora conclusa: il token non deve superarla
+    sync_repository.counters.find_one.return_value = {
+        "seq": 10, "pending": [{"seq": 8, "reserved_at": time.time()}],
+    }
+    collection = MagicMock()
+    collection.find.return_value = make_cursor([{"_id": ObjectId(), "created_seq": 6, "sync_seq": 6}])
+
+    result = await sync_repository.get_changes(collection, "faq", SyncRepository.encode_token(5))
+
+    assert SyncRepository.decode_token(result["token"]) == 7
+    assert collection.find.call_args.args[0] == {"sync_seq": {"$gt": 5, "$lte": 7}}
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_changes_paginates(sync_repository):
+    collection = MagicMock()
+    collection.find.return_value = make_cursor(
+        [{"_id": ObjectId(), "created_seq": seq, "sync_seq": seq} for seq in (1, 2, 3)]
+    )
+
+    result = await sync_repository.get_changes(collection, "faq", limit=2)
+
+    assert len(result["inserted"]) == 2
+    assert result["has_more"] is True
+    assert SyncRepository.decode_token(result["token"]) == 2
+    # Senza token le tombstone non servono
+    sync_repository.tombstones.find.assert_not_called()
@@ -3,7 +3,7 @@ from unittest.mock import AsyncMock, MagicMock
 from fastapi import HTTPException
 from app.repositories.user_repository import UserRepository, get_user_repository
 from app.utils import get_password_hash
-from app.schemas import User, UserUpdate
+from app.schemas import UserUpdate
 
 
 @pytest.fixture
@@ -15,7 +15,11 @@ def mock_database():
     mock_collection.find().to_list = AsyncMock()
     mock_collection.insert_one = AsyncMock()
     mock_collection.update_one = AsyncMock()
+    mock_collection.find_one_and_update = AsyncMock()
+    mock_collection.count_documents = AsyncMock()
     mock_collection.delete_one = AsyncMock()
+    mock_collection.delete_many = AsyncMock()
+    mock_collection.bulk_write = AsyncMock()
     mock_db.get_collection.return_value = mock_collection
     return mock_db
 
@@ -51,19 +55,22 @@ async def test__unit_test__create_user(user_repository, mock_database):
     mock_collection = mock_database.get_collection.return_value
     mock_collection.insert_one.return_value = MagicMock(inserted_id="user@test.com")
 
-    user = User(
-        _id="user@test.com",
-        name="Test",
-        hashed_password="hash",
-        is_initialized=False,
-        remember_me=False,
-        scopes=["user"]
-    )
+    user = {
+        "_id": "user@test.com",
+        "name": "Test",
+        "name_normalized": ["test"],
+        "hashed_password": "hash",
+        "is_initialized": False,
+        "remember_me": False,
+        "scopes": ["user"],
+    }
 
     result = await user_repository.create_user(user)
 
     mock_collection.insert_one.assert_awaited_once_with(user)
     assert result.inserted_id == "user@test.com"
+    operations = mock_collection.bulk_write.await_args.args[0]
+    assert operations[1]._filter == {"term": "test", "user_id": "user@test.com"}
 
 
 @pytest.mark.asyncio
@@ -165,7 +172,7 @@ async def test__unit_test__update_user_success(user_repository, mock_database):
         "remember_me": False,
         "scopes": ["user"]
     }
-    mock_collection.update_one.return_value = MagicMock(modified_count=1)
+    mock_collection.find_one_and_update.return_value = {"_id": "user@test.com", "name": "Test"}
 
     update_data = UserUpdate(
          _id = "user@test.com",
@@ -179,8 +186,8 @@ async def test__unit_test__update_user_success(user_repository, mock_database):
 
     result = await user_repository.update_user("user@test.com", update_data)
 
-    assert result.modified_count == 1
-    mock_collection.update_one.assert_awaited_once()
+    assert result["name"] == "Test"
+    mock_collection.find_one_and_update.assert_awaited_once()
 
 @pytest.mark.asyncio
 async def test__unit_test__update_user_success_with_no_password(user_repository, mock_database):
@@ -192,7 +199,7 @@ async def test__unit_test__update_user_success_with_no_password(user_repository,
         "remember_me": False,
         "scopes": ["user"]
     }
-    mock_collection.update_one.return_value = MagicMock(modified_count=1)
+    mock_collection.find_one_and_update.return_value = {"_id": "user@test.com", "scopes": ["admin"]}
 
     update_data = UserUpdate(
          _id = "user@test.com",
@@ -204,8 +211,11 @@ async def test__unit_test__update_user_success_with_no_password(user_repository,
 
     result = await user_repository.update_user("user@test.com", update_data)
 
-    assert result.modified_count == 1
-    mock_collection.update_one.assert_awaited_once()
+    assert result["scopes"] == ["admin"]
+    mock_collection.find_one.assert_not_awaited()
+    query, update = mock_collection.find_one_and_update.call_args[0]
+    assert {"scopes": {"$ne": ["admin"]}} in query["$or"]
+    assert update == {"$set": {"is_initialized": True, "remember_me": True, "scopes": ["admin"]}}
 
 
 @pytest.mark.asyncio
@@ -218,7 +228,7 @@ async def test__unit_test__update_user_error(user_repository, mock_database):
         "remember_me": False,
         "scopes": ["user"]
     }
-    mock_collection.update_one.side_effect = Exception("DB error")
+    mock_collection.find_one_and_update.side_effect = Exception("DB error")
 
     update_data = UserUpdate(
          _id = "user@test.com",
@@ -250,7 +260,8 @@ async def test__unit_test__update_user_no_modified(user_repository, mock_databas
         "remember_me": False,
         "scopes": ["admin"]
     }
-    mock_collection.update_one.return_value = MagicMock(modified_count=1)
+    mock_collection.find_one_and_update.return_value = None
+    mock_collection.count_documents.return_value = 1
 
     update_data = UserUpdate(
         _id = "user@test.com",
@@ -279,8 +290,208 @@ async def test__unit_test__update_user_not_found(user_repository, mock_database)
 
     assert exc_info.value.status_code == 404
 
+@pytest.mark.asyncio
+async def test__unit_test__update_user_fresh_password_skips_verify(user_repository, mock_database, monkeypatch):
+    mock_collection = mock_database.get_collection.return_value
+    mock_collection.find_one_and_update.return_value = {"_id": "user@test.com"}
+    verify = MagicMock()
+    monkeypatch.setattr("app.repositories.user_repository.verify_password", verify)
+
+    update_data = UserUpdate(_id="user@test.com", password="random", is_initialized=False)
+    await user_repository.update_user("user@test.com", update_data, fresh_password=True)
+
+    verify.assert_not_called()
+    mock_collection.find_one.assert_not_awaited()
+    query, update = mock_collection.find_one_and_update.call_args[0]
+    assert query == {"_id": "user@test.com"}
+    assert "hashed_password" in update["$set"]
+
+
+@pytest.mark.asyncio
+async def test__unit_test__update_user_not_found_without_password(user_repository, mock_database):
+    mock_collection = mock_database.get_collection.return_value
+    mock_collection.find_one_and_update.return_value = None
+    mock_collection.count_documents.return_value = 0
+
+    update_data = UserUpdate(_id="missing@test.com", name="Nobody")
+
+    with pytest.raises(HTTPException) as exc_info:
+        await user_repository.update_user("missing@test.com", update_data)
+
+    assert exc_info.value.status_code == 404
+
+
 @pytest.mark.asyncio
 async def test__unit_test__get_user_repository_returns_instance(mock_database):
     test_db = mock_database["test_database"]
     repo = get_user_repository(test_db)
-    assert isinstance(repo, UserRepository)
\ No newline at end of file
+    assert isinstance(repo, UserRepository)
+
+class AsyncCursor:
+    def __init__(self, items):
+        self.items = list(items)
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def batch_size(self, *args):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    async def to_list(self, length=None):
+        return self.items[:length]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.items:
+            raise StopAsyncIteration
+        return self.items.pop(0)
+
+
+@pytest.mark.asyncio
+async def test__unit_test__iter_user_emails(user_repository, mock_database):
+    mock_collection = mock_database.get_collection.return_value
+    mock_collection.find = MagicMock(
+        side_effect=[
+            AsyncCursor([{"_id": "b@test.it"}, {"_id": "c@test.it"}]),
+            AsyncCursor([{"_id": "d@test.it"}]),
+        ]
+    )
+
+    batches = [batch async for batch in user_repository.iter_user_emails(after="a@test.it", batch_size=2)]
+
+    assert batches == [["b@test.it", "c@test.it"], ["d@test.it"]]
+    # Ogni blocco è una nuova query che riparte dall'ultima email: nessun cursore resta aperto tra i blocchi
+    assert [call.args[0] for call in mock_collection.find.call_args_list] == [
+        {"_id": {"$gt": "a@test.it"}},
+        {"_id": {"$gt": "c@test.it"}},
+    ]
+
+
+def make_cursor(items):
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.limit.return_value = cursor
+    cursor.to_list = AsyncMock(return_value=items)
+    return cursor
+
+
+@pytest.fixture
+def search_collections():
+    collections = {"users": MagicMock(), "user_name_terms": MagicMock()}
+    database = MagicMock()
+    database.get_collection.side_effect = collections.__getitem__
+    return UserRepository(database), collections["users"], collections["user_name_terms"]
+
+
+@pytest.mark.asyncio
+async def test__unit_test__search_users(search_collections):
+    repository, users, name_terms = search_collections
+    by_email = [{"_id": "rossi@test.it", "name": "Paolo Bianchi"}]
+    users.find = MagicMock(
+        side_effect=[make_cursor(by_email), make_cursor([{"_id": "mario@test.it", "name": "Mario Rossi"}])]
+    )
+    # rossi@test.it è già stato trovato per email
+    name_terms.find = MagicMock(
+        return_value=make_cursor([
+            {"term": "rossi", "user_id": "mario@test.it"},
+            {"term": "rossi", "user_id": "rossi@test.it"},
+        ])
+    )
+
+    found, next_cursor = await repository.search_users("Rossì", limit=3)
+
+    assert [user["_id"] for user in found] == ["rossi@test.it", "mario@test.it"]
+    assert UserRepository.decode_search_cursor(next_cursor) == ["name", "rossi", "rossi@test.it"]
+    assert users.find.call_args_list[0].args[0] == {"_id": {"$regex": "^rossì"}}
+    assert "hashed_password" not in users.find.call_args_list[0].args[1]
+    assert name_terms.find.call_args.args[0] == {"term": {"$regex": "^rossi"}}
+    # L'ordinamento corrisponde all'indice (term, user_id)
+    name_terms.find.return_value.sort.assert_called_once_with([("term", 1), ("user_id", 1)])
+
+
+@pytest.mark.asyncio
+async def test__unit_test__search_users_pages(search_collections):
+    repository, users, name_terms = search_collections
+    page = [{"_id": "rossi@test.it"}, {"_id": "rossi2@test.it"}]
+    users.find = MagicMock(return_value=make_cursor(page))
+
+    found, next_cursor = await repository.search_users("rossi", limit=2)
+
+    # Pagina piena di risultati per email: la ricerca per nome non viene eseguita
+    assert found == page
+    assert UserRepository.decode_search_cursor(next_cursor) == ["email", "rossi2@test.it"]
+    name_terms.find.assert_not_called()
+
+    users.find = MagicMock(return_value=make_cursor([]))
+    name_terms.find = MagicMock(return_value=make_cursor([]))
+    await repository.search_users("rossi", limit=2, after=repository.encode_search_cursor("name", "rossi", "a@test.it"))
+
+    users.find.assert_not_called()
+    assert name_terms.find.call_args.args[0]["$or"] == [
+        {"term": {"$gt": "rossi"}},
+        {"term": "rossi", "user_id": {"$gt": "a@test.it"}},
+    ]
+
+
+@pytest.mark.asyncio
+async def test__unit_test__search_users_invalid_cursor(user_repository):
+    with pytest.raises(ValueError):
+        await user_repository.search_users("rossi", after="not-a-cursor")
+
+
+@pytest.mark.asyncio
+async def test__unit_test__search_users_empty_query(user_repository, mock_database):
+    users, next_cursor = await user_repository.search_users("   ")
+    assert users == []
+    assert next_cursor is None
+
+
+@pytest.mark.asyncio
+async def test__unit_test__ensure_indexes_backfills_names(user_repository, mock_database):
+    mock_collection = mock_database.get_collection.return_value
+    mock_collection.create_index = AsyncMock()
+    mock_collection.bulk_write = AsyncMock()
+    mock_collection.count_documents = AsyncMock(return_value=0)
+    mock_collection.find = MagicMock(
+        side_effect=[
+            AsyncCursor([{"_id": "a@test.it", "name": "Anna Verdi"}]),
+            AsyncCursor([{"_id": "a@test.it", "name_normalized": ["anna verdi", "verdi"]}]),
+        ]
+    )
+
+    await user_repository.ensure_indexes()
+
+    mock_collection.create_index.assert_any_await([("term", 1), ("user_id", 1)], unique=True)
+    operations = mock_collection.bulk_write.await_args_list[0].args[0]
+    assert operations[0]._doc == {"$set": {"name_normalized": ["anna verdi", "verdi"]}}
+    # user_name_terms vuota: viene costruita per tutti gli utenti
+    operations = mock_collection.bulk_write.await_args_list[1].args[0]
+    assert [operation._filter for operation in operations] == [
+        {"term": "anna verdi", "user_id": "a@test.it"},
+        {"term": "verdi", "user_id": "a@test.it"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test__unit_test__ensure_indexes_backfills_terms_in_batches(user_repository, mock_database, monkeypatch):
+    monkeypatch.setattr("app.repositories.user_repository.USER_NAME_TERMS_BATCH_SIZE", 3)
+    mock_collection = mock_database.get_collection.return_value
+    mock_collection.create_index = AsyncMock()
+    mock_collection.bulk_write = AsyncMock()
+    mock_collection.count_documents = AsyncMock(return_value=0)
+    mock_collection.find = MagicMock(
+        side_effect=[
+            AsyncCursor([]),
+            AsyncCursor([{"_id": f"u{i}@test.it", "name_normalized": ["anna verdi", "verdi"]} for i in range(3)]),
+        ]
+    )
+
+    await user_repository.ensure_indexes()
+
+    # 6 voci in blocchi da almeno 3: due bulk_write invece di una per utente
+    assert [len(call.args[0]) for call in mock_collection.bulk_write.await_args_list] == [4, 2]
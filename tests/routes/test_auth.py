@@ -38,7 +38,7 @@ def fake_user_repo():
                 }
             return None
 
-        async def update_user(self, user_id, user_data):
+        async def update_user(self, user_id, user_data, fresh_password=False):
             return None
 
     return FakeUserRepository()
@@ -163,6 +163,13 @@ def test__unit_test__verify_user():
     result = verify_user(token)
     assert result["sub"] == data["sub"]
 
+def test__unit_test__verify_user_tracks_activity(monkeypatch):
+    tracker = MagicMock()
+    monkeypatch.setattr("app.routes.auth.activity_tracker", tracker)
+    token = create_access_token({"sub": "123"}, AccessRoles.USER)
+    verify_user(token)
+    tracker.touch.assert_called_once_with("123")
+
 def test__unit_test__verify_admin():
     data = {"sub": "123"}
     token = create_access_token(data, AccessRoles.ADMIN)
@@ -1,3 +1,4 @@
+import json
 import pytest
 from unittest.mock import MagicMock, AsyncMock, patch
 from fastapi import APIRouter, Depends, HTTPException, status
@@ -182,7 +183,8 @@ async def test__unit_test__add_message_to_chat_not_found(fake_chat_repo):
 async def test__unit_test__get_chat_messages(fake_chat_repo):
     current_user = {"sub": "hi@hi.com"}
     chat_id = "chat123"
-    messages = await get_chat_messages(chat_id, None, current_user, fake_chat_repo)
+    response = await get_chat_messages(chat_id, None, current_user, fake_chat_repo)
+    messages = json.loads(response.body)
     assert messages["messages"] == []
 
 
@@ -1,20 +1,35 @@
-from unittest.mock import MagicMock
+import json
+from unittest.mock import AsyncMock, MagicMock
 import pytest
 
 from app.routes.document import (
   upload_document,
   get_documents,
+  upload_documents,
+  upload_document_content,
+  claim_document,
+  complete_ingestion,
+  renew_ingestion_lease,
+  download_document_content,
   delete_document,
+  delete_documents,
 )
-from app.schemas import Document, DocumentDelete, UserAuth
+from app.schemas import Document, DocumentBatchDelete, DocumentDelete, IngestionLease, UserAuth
+from gridfs.errors import NoFile
 from pymongo.errors import DuplicateKeyError
 from fastapi import HTTPException
 from bson import ObjectId
 from pymongo.results import DeleteResult  
+from app.repositories.document_repository import DocumentRepository
 
 @pytest.fixture
 def fake_document_repo():
     class FakeRepository:
+        version = 7
+
+        async def get_version(self):
+            return self.version
+
         async def insert_document(self, owner_email, document):
             if document.title == "duplicate":
                 raise DuplicateKeyError("Duplicate document")
@@ -26,8 +41,22 @@ def fake_document_repo():
                 "file_path": document.file_path,
                 "owner_email": owner_email,
             }
-        async def get_documents(self):
-            return "documents"
+        async def insert_documents(self, owner_email, documents):
+            if any(document.title == "error" for document in documents):
+                raise Exception("Some error")
+            return [ObjectId("614c1b2f8e4b0c6a1d2d5d2f")], [ObjectId("614c1b2f8e4b0c6a1d2d5d25")]
+
+        async def get_documents(self, limit=None, cursor=None, owner_email=None,
+                                uploaded_from=None, uploaded_to=None, title_prefix=None):
+            if cursor == "invalid":
+                raise ValueError("Invalid cursor")
+            documents = [
+                {"_id": ObjectId("614c1b2f8e4b0c6a1d2d5d2f"), "title": "a", "file_path": "/a.pdf",
+                 "owner_email": "hi@hi.com", "uploaded_at": "2025-05-02T10:00:00+02:00"},
+                {"_id": ObjectId("614c1b2f8e4b0c6a1d2d5d25"), "title": "b", "file_path": "/b.pdf",
+                 "owner_email": "hi@hi.com", "uploaded_at": "2025-05-01T10:00:00+02:00"},
+            ]
+            return documents[:limit]
        
         async def delete_document(self, file_id):
             MockDeleteResult = MagicMock()
@@ -65,10 +94,58 @@ async def test__unit_test__upload_document_exception(fake_document_repo):
     assert excinfo.value.status_code == 500
 
 
+@pytest.mark.asyncio
+async def test__unit_test__upload_documents(fake_document_repo):
+    documents = [Document(title="A", file_path="/a.pdf"), Document(title="B", file_path="/b.pdf")]
+    result = await upload_documents(documents, current_user, fake_document_repo)
+    assert result == {"created": ["614c1b2f8e4b0c6a1d2d5d2f"], "existing": ["614c1b2f8e4b0c6a1d2d5d25"]}
+
+
+@pytest.mark.asyncio
+async def test__unit_test__upload_documents_error(fake_document_repo):
+    with pytest.raises(HTTPException) as excinfo:
+        await upload_documents([Document(title="error", file_path="/a.pdf")], current_user, fake_document_repo)
+    assert excinfo.value.status_code == 500
+
+
+def list_documents(repo, limit=100, cursor=None, if_none_match=None):
+    request = MagicMock()
+    request.headers = {"if-none-match": if_none_match} if if_none_match else {}
+    return get_documents(
+        request=request,
+        limit=limit,
+        cursor=cursor,
+        owner_email=None,
+        uploaded_from=None,
+        uploaded_to=None,
+        title_prefix=None,
+        current_user=current_user,
+        document_repository=repo,
+    )
+
+
 @pytest.mark.asyncio
 async def test__unit_test__get_documents(fake_document_repo):
-    result = await get_documents(current_user, fake_document_repo)
-    assert result == "documents"
+    response = await list_documents(fake_document_repo)
+    result = json.loads(response.body)
+    assert len(result) == 2
+    assert result[0]["_id"] == "614c1b2f8e4b0c6a1d2d5d2f"
+    assert "X-Next-Cursor" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_documents_next_cursor(fake_document_repo):
+    response = await list_documents(fake_document_repo, limit=1)
+    assert len(json.loads(response.body)) == 1
+    last = (await fake_document_repo.get_documents(limit=1))[-1]
+    assert response.headers["X-Next-Cursor"] == DocumentRepository.encode_cursor(last)
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_documents_invalid_cursor(fake_document_repo):
+    with pytest.raises(HTTPException) as excinfo:
+        await list_documents(fake_document_repo, cursor="invalid")
+    assert excinfo.value.status_code == 400
 
 
 class User:
@@ -144,3 +221,206 @@ async def test__unit_test__delete_document_delete_count_exception(fake_document_
 
     
 
+
+
+
+class FakeGridOut:
+    def __init__(self, data, chunk_size=4):
+        self.data = data
+        self.length = len(data)
+        self.chunk_size = chunk_size
+        self.position = 0
+
+    async def seek(self, position):
+        self.position = position
+
+    async def readchunk(self):
+        end = (self.position // self.chunk_size + 1) * self.chunk_size
+        chunk = self.data[self.position:end]
+        self.position += len(chunk)
+        return chunk
+
+
+@pytest.fixture
+def fake_content_repos():
+    document_id = ObjectId("614c1b2f8e4b0c6a1d2d5d2f")
+    document_repo = MagicMock()
+    document_repo.get_document_by_id = AsyncMock(
+        side_effect=lambda _id: {"_id": _id, "file_path": "/a.pdf", "file_id": ObjectId(), "content_type": "application/pdf"}
+        if _id == document_id else None
+    )
+    document_repo.set_document_file = AsyncMock()
+    file_repo = MagicMock()
+    file_repo.upload = AsyncMock(
+        return_value={"file_id": ObjectId("614c1b2f8e4b0c6a1d2d5d25"), "sha256": "abc", "length": 10, "deduplicated": False}
+    )
+    file_repo.open_download = AsyncMock(return_value=FakeGridOut(b"0123456789"))
+    return document_repo, file_repo
+
+
+async def read_body(response):
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+
+@pytest.mark.asyncio
+async def test__unit_test__upload_document_content(fake_content_repos):
+    document_repo, file_repo = fake_content_repos
+    request = MagicMock()
+    request.headers = {"content-type": "application/pdf"}
+
+    result = await upload_document_content("614c1b2f8e4b0c6a1d2d5d2f", request, current_user, document_repo, file_repo)
+
+    assert result["file_id"] == "614c1b2f8e4b0c6a1d2d5d25"
+    document_repo.set_document_file.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__upload_document_content_not_found(fake_content_repos):
+    document_repo, file_repo = fake_content_repos
+    with pytest.raises(HTTPException) as excinfo:
+        await upload_document_content("614c1b2f8e4b0c6a1d2d5d26", MagicMock(), current_user, document_repo, file_repo)
+    assert excinfo.value.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test__unit_test__download_document_content(fake_content_repos):
+    document_repo, file_repo = fake_content_repos
+
+    response = await download_document_content("614c1b2f8e4b0c6a1d2d5d2f", None, current_user, document_repo, file_repo)
+
+    assert response.status_code == 200
+    assert await read_body(response) == b"0123456789"
+
+
+@pytest.mark.asyncio
+async def test__unit_test__download_document_content_range(fake_content_repos):
+    document_repo, file_repo = fake_content_repos
+
+    response = await download_document_content("614c1b2f8e4b0c6a1d2d5d2f", "bytes=3-8", current_user, document_repo, file_repo)
+
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == "bytes 3-8/10"
+    assert await read_body(response) == b"345678"
+
+
+@pytest.mark.asyncio
+async def test__unit_test__download_document_content_range_not_satisfiable(fake_content_repos):
+    document_repo, file_repo = fake_content_repos
+    with pytest.raises(HTTPException) as excinfo:
+        await download_document_content("614c1b2f8e4b0c6a1d2d5d2f", "bytes=20-", current_user, document_repo, file_repo)
+    assert excinfo.value.status_code == 416
+
+
+@pytest.mark.asyncio
+async def test__unit_test__download_document_content_missing_file(fake_content_repos):
+    document_repo, file_repo = fake_content_repos
+    file_repo.open_download.side_effect = NoFile("no file")
+
+    with pytest.raises(HTTPException) as excinfo:
+        await download_document_content("614c1b2f8e4b0c6a1d2d5d2f", None, current_user, document_repo, file_repo)
+    assert excinfo.value.status_code == 404
+
+
+
+@pytest.mark.asyncio
+async def test__unit_test__claim_document():
+    document_repo = MagicMock()
+    document_repo.claim_document = AsyncMock(return_value={"_id": "doc"})
+    lease = IngestionLease(worker_id="worker-1", lease_seconds=30)
+
+    assert await claim_document(lease, current_user, document_repo) == {"_id": "doc"}
+    document_repo.claim_document.assert_awaited_once_with("worker-1", 30)
+
+    document_repo.claim_document.return_value = None
+    response = await claim_document(lease, current_user, document_repo)
+    assert response.status_code == 204
+
+
+@pytest.mark.asyncio
+async def test__unit_test__complete_ingestion_lease_lost():
+    document_repo = MagicMock()
+    document_repo.complete_ingestion = AsyncMock(return_value=False)
+    lease = IngestionLease(worker_id="worker-1")
+
+    with pytest.raises(HTTPException) as excinfo:
+        await complete_ingestion("614c1b2f8e4b0c6a1d2d5d2f", lease, current_user, document_repo)
+    assert excinfo.value.status_code == 409
+
+
+@pytest.mark.asyncio
+async def test__unit_test__renew_ingestion_lease():
+    document_repo = MagicMock()
+    document_repo.renew_lease = AsyncMock(return_value=True)
+    lease = IngestionLease(worker_id="worker-1")
+
+    await renew_ingestion_lease("614c1b2f8e4b0c6a1d2d5d2f", lease, current_user, document_repo)
+    document_repo.renew_lease.assert_awaited_once()
+
+
+
+@pytest.mark.asyncio
+async def test__unit_test__delete_documents(monkeypatch):
+    calls = []
+
+    async def mock_authenticate_user(email, password, repo):
+        calls.append(email)
+        return {"_id": email}
+    monkeypatch.setattr("app.routes.document.authenticate_user", mock_authenticate_user)
+    document_repo = MagicMock()
+    document_repo.delete_documents = AsyncMock(
+        return_value=([ObjectId("614c1b2f8e4b0c6a1d2d5d2f")], [ObjectId("614c1b2f8e4b0c6a1d2d5d25")])
+    )
+    files = DocumentBatchDelete(ids=["614c1b2f8e4b0c6a1d2d5d2f", "614c1b2f8e4b0c6a1d2d5d25", "not-an-id"])
+
+    result = await delete_documents(files, UserAuth(current_password="pw"), current_user, document_repo, None)
+
+    assert calls == [current_user["sub"]]
+    assert result == {
+        "deleted": ["614c1b2f8e4b0c6a1d2d5d2f"],
+        "missing": ["614c1b2f8e4b0c6a1d2d5d25", "not-an-id"],
+    }
+    assert len(document_repo.delete_documents.await_args.args[0]) == 2
+
+
+@pytest.mark.asyncio
+async def test__unit_test__delete_documents_invalid_credentials(monkeypatch):
+    async def mock_authenticate_user(email, password, repo):
+        return None
+    monkeypatch.setattr("app.routes.document.authenticate_user", mock_authenticate_user)
+    document_repo = MagicMock()
+    document_repo.delete_documents = AsyncMock()
+
+    with pytest.raises(HTTPException) as excinfo:
+        await delete_documents(
+            DocumentBatchDelete(ids=["614c1b2f8e4b0c6a1d2d5d2f"]), UserAuth(current_password="pw"),
+            current_user, document_repo, None,
+        )
+    assert excinfo.value.status_code == 401
+    document_repo.delete_documents.assert_not_awaited()
+
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_documents_etag(fake_document_repo, monkeypatch):
+    response = await list_documents(fake_document_repo)
+    etag = response.headers["ETag"]
+
+    result = await list_documents(fake_document_repo, if_none_match=etag)
+
+    assert result.status_code == 304
+    assert result.headers["ETag"] == etag
+    assert not result.body
+
+    # Con l'ETag corrente i documenti non vengono letti
+    monkeypatch.setattr(fake_document_repo, "get_documents", AsyncMock(return_value=[]))
+    await list_documents(fake_document_repo, if_none_match=etag)
+    fake_document_repo.get_documents.assert_not_awaited()
+
+    # Parametri diversi hanno un ETag diverso
+    assert (await list_documents(fake_document_repo, limit=1)).headers["ETag"] != etag
+
+    # Una modifica dei documenti cambia la versione e quindi l'ETag
+    fake_document_repo.version = 8
+    result = await list_documents(fake_document_repo, if_none_match=etag)
+    assert result.headers["ETag"] != etag
+    assert json.loads(result.body) == []
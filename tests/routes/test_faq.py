@@ -1,9 +1,13 @@
+import gzip
+import json
 import pytest
 
 from unittest.mock import MagicMock, AsyncMock
 
-from app.schemas import FAQ, FAQUpdate, UserAuth
-from app.routes.faq import create_faq, get_faqs, update_faq, delete_faq
+from app.schemas import FAQ, FAQMatchRequest, FAQUpdate, UserAuth
+from app.routes.faq import create_faq, get_faqs, search_faqs, match_faq, import_faqs, export_faqs, get_faq_changes, update_faq, delete_faq
+from app.repositories.sync_repository import SyncTokenExpired
+from app.cache import faq_cache
 from pymongo.errors import DuplicateKeyError
 from fastapi import HTTPException
 from bson import ObjectId
@@ -24,7 +28,22 @@ def fake_faq_repo():
               "created_by": author_email,
           }
       async def get_faqs(self):
-          return "faqs"
+          return [
+              {
+                  "_id": ObjectId("614c1b2f8e4b0c6a1d2d5d2f"),
+                  "title": "Title",
+                  "question": "Question?",
+                  "answer": "Answer",
+                  "created_at": "2024-01-01T00:00:00",
+                  "updated_at": "2024-01-01T00:00:00",
+              }
+          ]
+      async def get_changes(self, since=None, limit=None):
+          if since == "expired":
+              raise SyncTokenExpired()
+          if since == "bad":
+              raise ValueError("Invalid sync token: bad")
+          return {"inserted": [], "updated": [], "deleted": [], "token": "1.1", "has_more": False}
       async def update_faq(self, faq_id: ObjectId, faq_data: FAQUpdate, author_email: str):
           if str(faq_id) == "614c1b2f8e4b0c6a1d2d5d2f":
               return {
@@ -45,6 +64,13 @@ def fake_faq_repo():
 
 current_user = {"sub":"hi@hi.com"}
 
+def make_request(accept_encoding="", if_none_match=None):
+    request = MagicMock()
+    request.headers = {"accept-encoding": accept_encoding}
+    if if_none_match:
+        request.headers["if-none-match"] = if_none_match
+    return request
+
 @pytest.mark.asyncio
 async def test__unit_test__create_faq(fake_faq_repo):
     faq = FAQ(
@@ -79,14 +105,47 @@ async def test__unit_test__create_faq_error(fake_faq_repo):
 
 @pytest.mark.asyncio
 async def test__unit_test__get_faqs(fake_faq_repo):
-    result = await get_faqs(current_user, fake_faq_repo)
-    assert result == "faqs"
+    faq_cache.bump()
+    result = await get_faqs(make_request(), current_user, fake_faq_repo)
+    assert json.loads(result.body)[0]["_id"] == "614c1b2f8e4b0c6a1d2d5d2f"
+
+@pytest.mark.asyncio
+async def test__unit_test__get_faqs_cached(fake_faq_repo, monkeypatch):
+    faq_cache.bump()
+    await get_faqs(make_request(), current_user, fake_faq_repo)
+    get_faqs_mock = AsyncMock(return_value=None)
+    monkeypatch.setattr(fake_faq_repo, "get_faqs", get_faqs_mock)
+
+    result = await get_faqs(make_request("gzip, deflate"), current_user, fake_faq_repo)
+
+    get_faqs_mock.assert_not_awaited()
+    assert result.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(result.body))[0]["title"] == "Title"
+
+    faq_cache.bump()
+    with pytest.raises(HTTPException):
+        await get_faqs(make_request(), current_user, fake_faq_repo)
+
+@pytest.mark.asyncio
+async def test__unit_test__get_faqs_stale_set_skipped(fake_faq_repo, monkeypatch):
+    faq_cache.bump()
+    original = fake_faq_repo.get_faqs
+
+    async def get_faqs_with_concurrent_write():
+        faqs = await original()
+        faq_cache.bump()
+        return faqs
+    monkeypatch.setattr(fake_faq_repo, "get_faqs", get_faqs_with_concurrent_write)
+
+    await get_faqs(make_request(), current_user, fake_faq_repo)
+    assert faq_cache.get() is None
 
 @pytest.mark.asyncio
 async def test__unit_test__get_faqs_not_found(fake_faq_repo, monkeypatch):
+    faq_cache.bump()
     monkeypatch.setattr(fake_faq_repo, "get_faqs", AsyncMock(return_value=None))
     with pytest.raises(HTTPException) as excinfo:
-        await get_faqs(current_user, fake_faq_repo)
+        await get_faqs(make_request(), current_user, fake_faq_repo)
     assert excinfo.value.status_code == 404
 
 @pytest.mark.asyncio
@@ -168,4 +227,95 @@ async def test__unit_test__delete_faq_exception(fake_faq_repo, monkeypatch):
     monkeypatch.setattr("app.routes.faq.authenticate_user", mock_authenticate_user)
     with pytest.raises(HTTPException) as ex:
         await delete_faq(faq_id, admin, current_user, fake_faq_repo, None)
-    assert ex.value.status_code == 500
\ No newline at end of file
+    assert ex.value.status_code == 500
+
+@pytest.mark.asyncio
+async def test__unit_test__get_faq_changes(fake_faq_repo):
+    result = await get_faq_changes(since=None, limit=100, current_user=current_user, faq_repo=fake_faq_repo)
+    assert result["token"] == "1.1"
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_faq_changes_invalid_token(fake_faq_repo):
+    with pytest.raises(HTTPException) as excinfo:
+        await get_faq_changes(since="bad", limit=100, current_user=current_user, faq_repo=fake_faq_repo)
+    assert excinfo.value.status_code == 400
+
+    with pytest.raises(HTTPException) as excinfo:
+        await get_faq_changes(since="expired", limit=100, current_user=current_user, faq_repo=fake_faq_repo)
+    assert excinfo.value.status_code == 410
+
+
+@pytest.mark.asyncio
+async def test__unit_test__search_faqs(fake_faq_repo, monkeypatch):
+    search = AsyncMock(return_value=([{"_id": "faq", "score": 1.5}], 10))
+    monkeypatch.setattr(fake_faq_repo, "search_faqs", search, raising=False)
+
+    result = await search_faqs(q="password", limit=10, offset=0, current_user=current_user, faq_repo=fake_faq_repo)
+
+    assert result == {"results": [{"_id": "faq", "score": 1.5}], "next_offset": 10}
+    search.assert_awaited_once_with("password", limit=10, offset=0)
+
+
+@pytest.mark.asyncio
+async def test__unit_test__match_faq(fake_faq_repo, monkeypatch):
+    monkeypatch.setattr(fake_faq_repo, "match_faq", AsyncMock(return_value=(None, 0.4)), raising=False)
+
+    result = await match_faq(FAQMatchRequest(question="ciao"), current_user, fake_faq_repo)
+
+    assert result == {"match": None, "score": 0.4}
+
+
+@pytest.mark.asyncio
+async def test__unit_test__import_faqs(fake_faq_repo, monkeypatch):
+    import_mock = AsyncMock(return_value={"created": 1, "updated": 0, "unchanged": 0})
+    monkeypatch.setattr(fake_faq_repo, "import_faqs", import_mock, raising=False)
+    request = MagicMock()
+    request.headers = {"content-type": "text/csv"}
+    request.body = AsyncMock(return_value=b"title,question,answer\nT,Q,A\n")
+
+    result = await import_faqs(request, current_user, fake_faq_repo)
+
+    assert result["created"] == 1
+    assert import_mock.await_args.args[0][0].title == "T"
+
+
+@pytest.mark.asyncio
+async def test__unit_test__import_faqs_invalid_rows(fake_faq_repo, monkeypatch):
+    import_mock = AsyncMock()
+    monkeypatch.setattr(fake_faq_repo, "import_faqs", import_mock, raising=False)
+    request = MagicMock()
+    request.headers = {"content-type": "application/x-ndjson"}
+    request.body = AsyncMock(return_value=b'{"title": "T"}\n')
+
+    with pytest.raises(HTTPException) as excinfo:
+        await import_faqs(request, current_user, fake_faq_repo)
+    assert excinfo.value.status_code == 422
+    import_mock.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__export_faqs(fake_faq_repo, monkeypatch):
+    async def iter_faqs():
+        yield {"title": "T", "question": "Q", "answer": "A"}
+    monkeypatch.setattr(fake_faq_repo, "iter_faqs", iter_faqs, raising=False)
+
+    response = await export_faqs(format="csv", current_user=current_user, faq_repo=fake_faq_repo)
+
+    body = "".join([chunk async for chunk in response.body_iterator])
+    assert response.media_type == "text/csv"
+    assert body == "title,question,answer\r\nT,Q,A\r\n"
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_faqs_not_modified(fake_faq_repo):
+    faq_cache.bump()
+    first = await get_faqs(make_request(), current_user, fake_faq_repo)
+    gzipped = await get_faqs(make_request("gzip"), current_user, fake_faq_repo)
+    assert first.headers["ETag"] != gzipped.headers["ETag"]
+
+    result = await get_faqs(make_request("gzip", if_none_match=first.headers["ETag"]), current_user, fake_faq_repo)
+
+    assert result.status_code == 304
+    assert result.body == b""
+    assert result.headers["ETag"] == gzipped.headers["ETag"]
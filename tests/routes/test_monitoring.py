@@ -0,0 +1,27 @@
+import pytest
+from unittest.mock import MagicMock, AsyncMock
+
+from app.routes.monitoring import get_pool_stats, get_slow_queries
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_pool_stats():
+    stats = await get_pool_stats(current_user={"email": "admin@test.it"})
+    assert "checked_out" in stats
+    assert "wait_histogram_ms" in stats
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_slow_queries():
+    slow_query_repository = MagicMock()
+    slow_query_repository.get_slow_queries = AsyncMock(return_value=[{"collection": "chats"}])
+
+    result = await get_slow_queries(
+        collection="chats",
+        limit=20,
+        current_user={"email": "admin@test.it"},
+        slow_query_repository=slow_query_repository,
+    )
+
+    assert result == [{"collection": "chats"}]
+    slow_query_repository.get_slow_queries.assert_awaited_once_with(collection="chats", limit=20)
@@ -0,0 +1,63 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from fastapi import HTTPException
+
+from app.cache import settings_cache
+from app.routes.setting import get_settings, update_settings
+from app.schemas import Settings
+
+SETTINGS = {
+    "_id": "main",
+    "color_primary": "#5e5c64",
+    "color_primary_hover": "#44424a",
+    "color_primary_text": "white",
+    "message_history": 100,
+}
+
+
+def make_request(if_none_match=None):
+    request = MagicMock()
+    request.headers = {"if-none-match": if_none_match} if if_none_match else {}
+    return request
+
+
+@pytest.fixture
+def fake_setting_repo():
+    settings_cache.bump()
+    repo = MagicMock()
+    repo.get_settings = AsyncMock(return_value=SETTINGS)
+    repo.update_settings = AsyncMock()
+    return repo
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_settings(fake_setting_repo):
+    result = await get_settings(make_request(), fake_setting_repo)
+
+    assert result.status_code == 200
+    assert json.loads(result.body)["message_history"] == 100
+    assert result.headers["Cache-Control"] == "no-cache"
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_settings_not_modified(fake_setting_repo):
+    first = await get_settings(make_request(), fake_setting_repo)
+
+    result = await get_settings(make_request(first.headers["ETag"]), fake_setting_repo)
+
+    assert result.status_code == 304
+    fake_setting_repo.get_settings.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_settings_not_found(fake_setting_repo):
+    fake_setting_repo.get_settings.return_value = None
+    with pytest.raises(HTTPException):
+        await get_settings(make_request(), fake_setting_repo)
+
+
+@pytest.mark.asyncio
+async def test__unit_test__update_settings(fake_setting_repo):
+    await update_settings(Settings(message_history=50), {"sub": "admin@test.it"}, fake_setting_repo)
+    fake_setting_repo.update_settings.assert_awaited_once()
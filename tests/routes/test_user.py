@@ -1,3 +1,4 @@
+import json
 import pytest
 from unittest.mock import MagicMock, AsyncMock, patch
 from fastapi import HTTPException
@@ -8,6 +9,7 @@ from app.schemas import (
     UserAuth,
     UserUpdatePassword,
     UserForgotPassword,
+    Announcement,
 )
 from app.auth_roles import AccessRoles
 from pymongo.errors import DuplicateKeyError
@@ -20,7 +22,13 @@ from app.routes.user import (
     update_user,
     update_password,
     reset_password,
+    create_announcement,
+    get_announcement,
+    resume_announcement,
+    search_users,
 )
+from bson import ObjectId
+from datetime import datetime, timedelta
 
 
 @pytest.fixture
@@ -34,7 +42,7 @@ def fake_user_repo():
             return "ok"
 
         async def get_users(self):
-            return True
+            return [{"_id": "hi@hi.com", "name": "Hi", "hashed_password": "hashed", "extra": "ignored"}]
 
         async def get_by_email(self, email: str):
             if email == "hi@hi.com":
@@ -74,23 +82,16 @@ def fake_user_repo():
                     "is_initialized": False,
                 }
 
-        async def update_user(self, user_id: str, user_data: UserUpdate):
-            MockUpdateResult = MagicMock()
+        async def update_user(self, user_id: str, user_data: UserUpdate, fresh_password: bool = False):
             print(user_id, user_data)
             if user_id == "hi@hi.com" or user_id == "hihi@hi.com":
-                MockUpdateResult.modified_count = 1
-                MockUpdateResult.matched_count = 1
-                return MockUpdateResult
+                return {"_id": user_id}
             if user_id == "hi3@hi.com":
-                MockUpdateResult.modified_count = 0
-                MockUpdateResult.matched_count = 1
-                return MockUpdateResult
+                raise HTTPException(status_code=304, detail="User data provided matches existing data.")
 
             if user_id == "error@error.com":
                 raise Exception("error")
-            MockUpdateResult.modified_count = 0
-            MockUpdateResult.matched_count = 0
-            return MockUpdateResult
+            return None
 
         async def delete_user(self, user_id: str):
             if user_id == "user123@asd.com":
@@ -103,6 +104,26 @@ def fake_user_repo():
     return FakeRepository()
 
 
+@pytest.fixture
+def fake_password_reset_repo():
+    class FakePasswordResetRepository:
+        def __init__(self):
+            self.acquired = set()
+            self.released = []
+
+        async def try_acquire(self, email):
+            if email in self.acquired:
+                return False
+            self.acquired.add(email)
+            return True
+
+        async def release(self, email):
+            self.acquired.discard(email)
+            self.released.append(email)
+
+    return FakePasswordResetRepository()
+
+
 current_user = {"sub": "hi@hi.com"}
 
 
@@ -163,7 +184,10 @@ async def test__unit_test__register_user_email_error(fake_user_repo, monkeypatch
 @pytest.mark.asyncio
 async def test__unit_test__get_users(fake_user_repo, monkeypatch):
     result = await get_users(current_user, fake_user_repo)
-    assert result == True
+    users = json.loads(result.body)
+    assert users[0]["_id"] == "hi@hi.com"
+    assert users[0]["scopes"] == ["user"]
+    assert "extra" not in users[0]
 
 
 @pytest.mark.asyncio
@@ -174,6 +198,22 @@ async def test__unit_test__get_users_empty(fake_user_repo, monkeypatch):
     assert excinfo.value.status_code == 404
 
 
+@pytest.mark.asyncio
+async def test__unit_test__search_users(fake_user_repo, monkeypatch):
+    search = AsyncMock(return_value=([{"_id": "hi@hi.com", "name": "Bob"}], None))
+    monkeypatch.setattr(fake_user_repo, "search_users", search, raising=False)
+
+    result = await search_users("bo", 10, None, current_user, fake_user_repo)
+
+    assert result == {"users": [{"_id": "hi@hi.com", "name": "Bob"}], "next_cursor": None}
+    search.assert_awaited_once_with("bo", limit=10, after=None)
+
+    search.side_effect = ValueError("Invalid cursor")
+    with pytest.raises(HTTPException) as excinfo:
+        await search_users("bo", 10, "bad", current_user, fake_user_repo)
+    assert excinfo.value.status_code == 400
+
+
 @pytest.mark.asyncio
 async def test__unit_test__get_user_me(fake_user_repo, monkeypatch):
     result = await get_user(current_user, fake_user_repo)
@@ -227,8 +267,9 @@ async def test__unit_test__update_user_same_data(fake_user_repo, monkeypatch):
 
     monkeypatch.setattr("app.routes.user.authenticate_user", mock_authenticate_user)
 
-    result = await update_user(user_new_data, current_user, fake_user_repo)
-    assert result["message"] != None
+    with pytest.raises(HTTPException) as excinfo:
+        await update_user(user_new_data, current_user, fake_user_repo)
+    assert excinfo.value.status_code == 304
 
 
 @pytest.mark.asyncio
@@ -390,22 +431,22 @@ async def test__unit_test__update_password_is_not_init_with_not_found(
 
 
 @pytest.mark.asyncio
-async def test__unit_test__reset_password(fake_user_repo, monkeypatch):
+async def test__unit_test__reset_password(fake_user_repo, fake_password_reset_repo, monkeypatch):
     user_data = UserForgotPassword(email="hi@hi.com")
-    result = await reset_password(user_data, fake_user_repo)
+    result = await reset_password(user_data, fake_user_repo, fake_password_reset_repo)
     assert result["message"] != None
 
 
 @pytest.mark.asyncio
-async def test__unit_test__reset_password_not_found(fake_user_repo, monkeypatch):
+async def test__unit_test__reset_password_not_found(fake_user_repo, fake_password_reset_repo, monkeypatch):
     user_data = UserForgotPassword(email="notfound@hi.com")
     with pytest.raises(HTTPException) as excinfo:
-        await reset_password(user_data, fake_user_repo)
+        await reset_password(user_data, fake_user_repo, fake_password_reset_repo)
     assert excinfo.value.status_code == 500
 
 
 @pytest.mark.asyncio
-async def test__unit_test__reset_password_update_error(fake_user_repo, monkeypatch):
+async def test__unit_test__reset_password_update_error(fake_user_repo, fake_password_reset_repo, monkeypatch):
     user_data = UserForgotPassword(email="hi@hi.com")
 
     async def mock_update_user(*args, **kwargs):
@@ -413,12 +454,37 @@ async def test__unit_test__reset_password_update_error(fake_user_repo, monkeypat
 
     monkeypatch.setattr(fake_user_repo, "update_user", mock_update_user)
     with pytest.raises(HTTPException) as excinfo:
-        await reset_password(user_data, fake_user_repo)
+        await reset_password(user_data, fake_user_repo, fake_password_reset_repo)
     assert excinfo.value.status_code == 500
 
 
 @pytest.mark.asyncio
-async def test__unit_test__reset_password_email_error(fake_user_repo, monkeypatch):
+async def test__unit_test__reset_password_duplicate_is_absorbed(fake_user_repo, fake_password_reset_repo, monkeypatch):
+    user_data = UserForgotPassword(email="hi@hi.com")
+    update_user = AsyncMock(return_value={"_id": "hi@hi.com"})
+    monkeypatch.setattr(fake_user_repo, "update_user", update_user)
+    monkeypatch.setattr("app.routes.user.EmailService", lambda: MagicMock(send_email=AsyncMock()))
+
+    first = await reset_password(user_data, fake_user_repo, fake_password_reset_repo)
+    second = await reset_password(user_data, fake_user_repo, fake_password_reset_repo)
+
+    assert first["password"]
+    assert second == {"message": first["message"], "password": None}
+    update_user.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__reset_password_update_error_releases(fake_user_repo, fake_password_reset_repo, monkeypatch):
+    user_data = UserForgotPassword(email="hi@hi.com")
+    monkeypatch.setattr(fake_user_repo, "update_user", AsyncMock(side_effect=Exception("Update error")))
+
+    with pytest.raises(HTTPException):
+        await reset_password(user_data, fake_user_repo, fake_password_reset_repo)
+    assert fake_password_reset_repo.released == ["hi@hi.com"]
+
+
+@pytest.mark.asyncio
+async def test__unit_test__reset_password_email_error(fake_user_repo, fake_password_reset_repo, monkeypatch):
     user_data = UserForgotPassword(email="hi@hi.com")
 
     async def mock_send_email(*args, **kwargs):
@@ -430,5 +496,84 @@ async def test__unit_test__reset_password_email_error(fake_user_repo, monkeypatc
 
     mock_send_email = AsyncMock(side_effect=mock_send_email)
     monkeypatch.setattr("app.routes.user.EmailService", MockEmailService)
-    result = await reset_password(user_data, fake_user_repo)
+    result = await reset_password(user_data, fake_user_repo, fake_password_reset_repo)
     assert result["message"] != None
+    # Senza email l'utente deve poter chiedere subito un nuovo reset
+    assert fake_password_reset_repo.released == ["hi@hi.com"]
+
+
+@pytest.fixture
+def fake_announcement_repo():
+    class FakeAnnouncementRepository:
+        database = MagicMock()
+
+        async def create_announcement(self, announcement, author_email):
+            return ObjectId("614c1b2f8e4b0c6a1d2d5d2f")
+
+        async def get_announcement(self, announcement_id):
+            if str(announcement_id) == "614c1b2f8e4b0c6a1d2d5d2f":
+                return {"_id": announcement_id, "status": "failed"}
+            if str(announcement_id) == "614c1b2f8e4b0c6a1d2d5d25":
+                return {"_id": announcement_id, "status": "completed"}
+            if str(announcement_id) == "614c1b2f8e4b0c6a1d2d5d26":
+                return {
+                    "_id": announcement_id,
+                    "status": "running",
+                    "lease_expires_at": datetime.utcnow() + timedelta(minutes=5),
+                }
+            return None
+
+        async def reset_announcement(self, announcement_id):
+            return None
+
+    return FakeAnnouncementRepository()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__create_announcement(fake_announcement_repo, monkeypatch):
+    scheduled = MagicMock()
+    monkeypatch.setattr("app.routes.user.schedule_announcement", scheduled)
+
+    result = await create_announcement(
+        Announcement(subject="S", body="B"), current_user, fake_announcement_repo
+    )
+
+    assert result["id"] == "614c1b2f8e4b0c6a1d2d5d2f"
+    scheduled.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__get_announcement_not_found(fake_announcement_repo):
+    with pytest.raises(HTTPException) as excinfo:
+        await get_announcement("not-an-id", current_user, fake_announcement_repo)
+    assert excinfo.value.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test__unit_test__resume_announcement(fake_announcement_repo, monkeypatch):
+    scheduled = MagicMock()
+    monkeypatch.setattr("app.routes.user.schedule_announcement", scheduled)
+
+    result = await resume_announcement("614c1b2f8e4b0c6a1d2d5d2f", current_user, fake_announcement_repo)
+
+    assert result["status"] == "pending"
+    scheduled.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__resume_announcement_completed(fake_announcement_repo):
+    with pytest.raises(HTTPException) as excinfo:
+        await resume_announcement("614c1b2f8e4b0c6a1d2d5d25", current_user, fake_announcement_repo)
+    assert excinfo.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test__unit_test__resume_announcement_running(fake_announcement_repo, monkeypatch):
+    scheduled = MagicMock()
+    monkeypatch.setattr("app.routes.user.schedule_announcement", scheduled)
+
+    with pytest.raises(HTTPException) as excinfo:
+        await resume_announcement("614c1b2f8e4b0c6a1d2d5d26", current_user, fake_announcement_repo)
+
+    assert excinfo.value.status_code == 409
+    scheduled.assert_not_called()
@@ -0,0 +1,48 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.service.activity_tracker import ActivityTracker
+
+
+@pytest.mark.asyncio
+async def test__unit_test__flush_coalesces_activity():
+    tracker = ActivityTracker()
+    collection = MagicMock()
+    collection.bulk_write = AsyncMock()
+
+    tracker.touch("a@test.it", login=True)
+    tracker.touch("a@test.it")
+    tracker.touch("b@test.it")
+    tracker.touch(None)
+
+    updated = await tracker.flush(collection)
+
+    assert updated == 2
+    operations = collection.bulk_write.call_args[0][0]
+    assert collection.bulk_write.call_args[1] == {"ordered": False}
+    documents = {op._filter["_id"]: op._doc["$max"] for op in operations}
+    assert set(documents["a@test.it"]) == {"last_active", "last_login"}
+    assert set(documents["b@test.it"]) == {"last_active"}
+
+
+@pytest.mark.asyncio
+async def test__unit_test__flush_empty_does_not_write():
+    tracker = ActivityTracker()
+    collection = MagicMock()
+    collection.bulk_write = AsyncMock()
+
+    assert await tracker.flush(collection) == 0
+    collection.bulk_write.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__flush_error_keeps_pending():
+    tracker = ActivityTracker()
+    collection = MagicMock()
+    collection.bulk_write = AsyncMock(side_effect=Exception("DB error"))
+
+    tracker.touch("a@test.it", login=True)
+    assert await tracker.flush(collection) == 0
+
+    collection.bulk_write = AsyncMock()
+    assert await tracker.flush(collection) == 1
@@ -0,0 +1,181 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from bson import ObjectId
+from datetime import datetime, timedelta, timezone
+
+from app.service.announcement_service import AnnouncementService, RateLimiter, schedule_announcement
+
+
+class FakeUserRepository:
+    def __init__(self, emails):
+        self.emails = emails
+        self.after = None
+
+    async def iter_user_emails(self, after=None, batch_size=100):
+        self.after = after
+        remaining = [email for email in self.emails if not after or email > after]
+        for i in range(0, len(remaining), batch_size):
+            yield remaining[i:i + batch_size]
+
+
+@pytest.fixture
+def announcement_repository():
+    repository = MagicMock()
+    repository.claim_announcement = AsyncMock()
+    repository.get_announcement = AsyncMock(return_value=None)
+    repository.record_progress = AsyncMock()
+    repository.finish_announcement = AsyncMock()
+    return repository
+
+
+@pytest.fixture
+def email_service():
+    service = MagicMock()
+    service.conf.MAIL_FROM = "noreply@test.it"
+    service.send_email = AsyncMock()
+    return service
+
+
+@pytest.mark.asyncio
+async def test__unit_test__send_announcement_bcc(announcement_repository, email_service):
+    announcement_id = ObjectId()
+    announcement_repository.claim_announcement.return_value = {
+        "_id": announcement_id, "subject": "S", "body": "B", "bcc": True, "last_recipient": None,
+    }
+    service = AnnouncementService(
+        announcement_repository, FakeUserRepository(["a@t.it", "b@t.it"]), email_service, RateLimiter(0)
+    )
+
+    assert await service.send_announcement(announcement_id) is True
+
+    email_service.send_email.assert_awaited_once_with(
+        to=["noreply@test.it"], subject="S", body="B", bcc=["a@t.it", "b@t.it"]
+    )
+    announcement_repository.record_progress.assert_awaited_once()
+    announcement_repository.finish_announcement.assert_awaited_once_with(announcement_id)
+
+
+@pytest.mark.asyncio
+async def test__unit_test__send_announcement_resumes_per_user(announcement_repository, email_service):
+    announcement_id = ObjectId()
+    announcement_repository.claim_announcement.return_value = {
+        "_id": announcement_id, "subject": "S", "body": "B", "bcc": False, "last_recipient": "a@t.it",
+    }
+    user_repository = FakeUserRepository(["a@t.it", "b@t.it", "c@t.it"])
+    service = AnnouncementService(announcement_repository, user_repository, email_service, RateLimiter(0))
+
+    await service.send_announcement(announcement_id)
+
+    assert user_repository.after == "a@t.it"
+    sent_to = [call.kwargs["to"] for call in email_service.send_email.await_args_list]
+    assert sent_to == [["b@t.it"], ["c@t.it"]]
+    assert announcement_repository.record_progress.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test__unit_test__send_announcement_already_claimed(announcement_repository, email_service):
+    announcement_repository.claim_announcement.return_value = None
+    announcement_repository.get_announcement.return_value = {"status": "completed", "lease_expires_at": None}
+    service = AnnouncementService(announcement_repository, FakeUserRepository([]), email_service, RateLimiter(0))
+
+    assert await service.send_announcement(ObjectId()) is False
+    email_service.send_email.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__send_announcement_waits_for_lease(announcement_repository, email_service, monkeypatch):
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr("app.service.announcement_service.asyncio.sleep", fake_sleep)
+    announcement_id = ObjectId()
+    # Dopo un riavvio rapido il lease del processo precedente non è ancora scaduto
+    announcement_repository.claim_announcement.side_effect = [
+        None,
+        {"_id": announcement_id, "subject": "S", "body": "B", "bcc": True, "last_recipient": "a@t.it"},
+    ]
+    announcement_repository.get_announcement.return_value = {
+        "status": "running",
+        "lease_expires_at": datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(seconds=120),
+    }
+    service = AnnouncementService(
+        announcement_repository, FakeUserRepository(["a@t.it", "b@t.it"]), email_service, RateLimiter(0)
+    )
+
+    assert await service.send_announcement(announcement_id) is True
+
+    assert len(sleeps) == 1
+    assert 115 < sleeps[0] <= 121
+    email_service.send_email.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__send_announcement_error(announcement_repository, email_service):
+    announcement_id = ObjectId()
+    announcement_repository.claim_announcement.return_value = {
+        "_id": announcement_id, "subject": "S", "body": "B", "bcc": True, "last_recipient": None,
+    }
+    email_service.send_email.side_effect = Exception("SMTP down")
+    service = AnnouncementService(
+        announcement_repository, FakeUserRepository(["a@t.it"]), email_service, RateLimiter(0)
+    )
+
+    assert await service.send_announcement(announcement_id) is False
+    announcement_repository.finish_announcement.assert_awaited_once_with(announcement_id, error="SMTP down")
+    announcement_repository.record_progress.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test__unit_test__rate_limiter_spaces_calls(monkeypatch):
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr("app.service.announcement_service.asyncio.sleep", fake_sleep)
+    limiter = RateLimiter(60)
+
+    await limiter.wait()
+    await limiter.wait()
+
+    assert len(sleeps) == 1
+    assert 0 < sleeps[0] <= 1.0
+
+
+def test__unit_test__rate_limiter_lock_per_loop():
+    limiter = RateLimiter(0)
+
+    asyncio.run(limiter.wait())
+    first_lock = limiter._lock
+    asyncio.run(limiter.wait())
+
+    assert limiter._lock is not first_lock
+
+
+@pytest.mark.asyncio
+async def test__unit_test__schedule_announcement_once_per_process(monkeypatch):
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def fake_send(self, announcement_id):
+        started.set()
+        await release.wait()
+        return True
+
+    monkeypatch.setattr(AnnouncementService, "send_announcement", fake_send)
+    announcement_id = ObjectId()
+
+    first = schedule_announcement(MagicMock(), announcement_id)
+    await started.wait()
+    # Un secondo avvio durante l'invio restituisce il task già in corso
+    assert schedule_announcement(MagicMock(), announcement_id) is first
+
+    release.set()
+    await first
+    await asyncio.sleep(0)
+    second = schedule_announcement(MagicMock(), announcement_id)
+    assert second is not first
+    await second
@@ -0,0 +1,38 @@
+import pytest
+
+from app.service.faq_io import export_csv, export_ndjson, parse_faqs
+
+
+async def faqs_iterator(faqs):
+    for faq in faqs:
+        yield faq
+
+
+def test__unit_test__parse_ndjson():
+    body = b'{"title": "T1", "question": "Q1", "answer": "A1"}\n\n{"title": "T2", "question": "Q2"}\nnot json\n'
+
+    faqs, errors = parse_faqs(body, "application/x-ndjson")
+
+    assert [faq.title for faq in faqs] == ["T1"]
+    assert [error["line"] for error in errors] == [3, 4]
+
+
+def test__unit_test__parse_csv():
+    body = "﻿title,question,answer\nT1,\"Domanda, con virgola\",Risposta\n".encode("utf-8")
+
+    faqs, errors = parse_faqs(body, "text/csv; charset=utf-8")
+
+    assert errors == []
+    assert faqs[0].question == "Domanda, con virgola"
+
+
+@pytest.mark.asyncio
+async def test__unit_test__export():
+    faqs = [{"title": "T1", "question": "Q1", "answer": "A, 1"}]
+
+    ndjson = "".join([chunk async for chunk in export_ndjson(faqs_iterator(faqs))])
+    csv_body = "".join([chunk async for chunk in export_csv(faqs_iterator(faqs))])
+
+    assert ndjson == '{"title": "T1", "question": "Q1", "answer": "A, 1"}\n'
+    assert csv_body == 'title,question,answer\r\nT1,Q1,"A, 1"\r\n'
+    assert parse_faqs(csv_body.encode(), "text/csv")[0][0].answer == "A, 1"
@@ -0,0 +1,41 @@
+import numpy as np
+
+from app.service.faq_matcher import FaqMatcher, char_ngrams
+
+
+FAQS = [
+    {"question": "Come posso cambiare la password?"},
+    {"question": "Dove trovo i documenti aziendali?"},
+    {"question": "Chi contatto per problemi tecnici?"},
+]
+
+
+def test__unit_test__char_ngrams():
+    assert char_ngrams("Perché?") == char_ngrams("perche")
+    assert char_ngrams("  ") == {}
+    assert sum(char_ngrams("ciao").values()) == 4
+
+
+def test__unit_test__scores_are_cosine_similarities():
+    matcher = FaqMatcher(FAQS)
+
+    scores = matcher.scores("Come posso cambiare la password?")
+
+    assert scores.shape == (3,)
+    assert np.isclose(scores[0], 1.0)
+    assert np.all(scores[1:] < 0.2)
+    assert not matcher.scores("zzz").any()
+
+
+def test__unit_test__best_match():
+    matcher = FaqMatcher(FAQS)
+
+    faq, score = matcher.best_match("come posso cambiare password", threshold=0.8)
+    assert faq is FAQS[0]
+    assert score > 0.8
+
+    faq, score = matcher.best_match("dove si trovano i documenti", threshold=0.8)
+    assert faq is None
+    assert 0 < score < 0.8
+
+    assert FaqMatcher([]).best_match("qualcosa") == (None, 0.0)
@@ -0,0 +1,33 @@
+from bson import ObjectId
+
+from app.service.faq_search import FaqSearchIndex, stem, tokenize
+
+
+def make_faq(title, question, answer):
+    return {"_id": ObjectId(), "title": title, "question": question, "answer": answer}
+
+
+def test__unit_test__tokenize():
+    assert tokenize("Come si modificano le Password?") == ["modifican", "password"]
+    assert tokenize("Perché") == []
+    assert stem("documenti") == stem("documento") == "document"
+
+
+def test__unit_test__search_ranks_by_field_weight():
+    in_answer = make_faq("Accesso", "Come entro?", "Serve la password aziendale")
+    in_title = make_faq("Password", "Come cambio la password?", "Dal profilo")
+    other = make_faq("Documenti", "Dove trovo i documenti?", "Nella sezione documenti")
+    index = FaqSearchIndex([in_answer, in_title, other])
+
+    results = index.search("password", limit=10)
+
+    assert [faq for faq, _ in results] == [in_title, in_answer]
+    assert results[0][1] > results[1][1]
+
+
+def test__unit_test__search_paginates_and_stems():
+    faqs = [make_faq(f"Documento {i}", "Dove sono i documenti?", "Qui") for i in range(5)]
+    index = FaqSearchIndex(faqs)
+
+    assert len(index.search("documentazione documenti", limit=2, offset=4)) == 1
+    assert index.search("inesistente", limit=10) == []
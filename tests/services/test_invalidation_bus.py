@@ -0,0 +1,101 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+from pymongo.errors import AutoReconnect, OperationFailure
+
+from app.service.invalidation_bus import InvalidationBus
+
+
+class FakeStream:
+    def __init__(self, events, error=None):
+        self.events = events
+        self.error = error
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for event in self.events:
+            yield event
+        if self.error:
+            raise self.error
+        # Lo stream resta aperto finché il task non viene cancellato
+        await asyncio.Event().wait()
+
+
+def change(collection, token):
+    return {"_id": {"_data": token}, "ns": {"coll": collection}, "operationType": "update"}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    sleep = asyncio.sleep
+    monkeypatch.setattr("app.service.invalidation_bus.asyncio.sleep", lambda seconds: sleep(0))
+
+
+async def run_until(bus, database, condition):
+    task = asyncio.create_task(bus.run(database))
+    for _ in range(100):
+        await asyncio.sleep(0)
+        if condition():
+            break
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+@pytest.mark.asyncio
+async def test__unit_test__dispatch_and_resume():
+    bus = InvalidationBus()
+    events = []
+    bus.subscribe("faq", events.append)
+    database = MagicMock()
+    database.watch.side_effect = [
+        FakeStream([change("faq", "1"), change("users", "2")], error=AutoReconnect("lost")),
+        FakeStream([change("faq", "3")]),
+    ]
+
+    await run_until(bus, database, lambda: len(events) >= 3)
+
+    # Invalidazione all'apertura senza token, poi gli eventi della collection faq
+    assert [event["operationType"] for event in events] == ["invalidate", "update", "update"]
+    assert database.watch.call_args_list[1].kwargs["resume_after"] == {"_data": "2"}
+    # Viene osservata solo la collection con una funzione registrata
+    assert database.watch.call_args_list[0].args[0] == [{"$match": {"ns.coll": {"$in": ["faq"]}}}]
+    assert bus.resume_token == {"_data": "3"}
+
+
+@pytest.mark.asyncio
+async def test__unit_test__token_lost_invalidates_everything():
+    bus = InvalidationBus()
+    bus.resume_token = {"_data": "old"}
+    events = []
+    bus.subscribe("settings", events.append)
+    database = MagicMock()
+    database.watch.side_effect = [
+        OperationFailure("history lost", code=286),
+        FakeStream([]),
+    ]
+
+    await run_until(bus, database, lambda: database.watch.call_count >= 2 and events)
+
+    assert database.watch.call_args_list[1].kwargs["resume_after"] is None
+    assert events[0]["operationType"] == "invalidate"
+
+
+@pytest.mark.asyncio
+async def test__unit_test__standalone_server_stops():
+    bus = InvalidationBus()
+    bus.subscribe("faq", lambda change: None)
+    database = MagicMock()
+    database.watch.side_effect = OperationFailure("not supported", code=40573)
+
+    await bus.run(database)
+
+    database.watch.assert_called_once()
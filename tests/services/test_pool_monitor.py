@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+from app.service.pool_monitor import PoolMonitor
+
+
+def test__unit_test__pool_monitor_records_waits():
+    monitor = PoolMonitor()
+    monitor.connection_created(SimpleNamespace())
+    monitor.connection_created(SimpleNamespace())
+    monitor.connection_checked_out(SimpleNamespace(duration=0.0005))
+    monitor.connection_checked_out(SimpleNamespace(duration=0.2))
+    monitor.connection_checked_in(SimpleNamespace())
+    monitor.connection_closed(SimpleNamespace())
+
+    stats = monitor.stats()
+    assert stats["checkouts"] == 2
+    assert stats["checked_out"] == 1
+    assert stats["open_connections"] == 1
+    assert stats["max_wait_ms"] == 200
+    assert stats["avg_wait_ms"] == 100.25
+    assert stats["wait_histogram_ms"]["1"] == 1
+    assert stats["wait_histogram_ms"]["500"] == 1
+    assert stats["wait_histogram_ms"]["+Inf"] == 0
+
+
+def test__unit_test__pool_monitor_records_failures():
+    monitor = PoolMonitor()
+    monitor.connection_check_out_failed(SimpleNamespace(duration=10.0, reason="timeout"))
+    monitor.connection_check_out_failed(SimpleNamespace(duration=None, reason="timeout"))
+    monitor.pool_cleared(SimpleNamespace())
+
+    stats = monitor.stats()
+    assert stats["checkout_failures"] == {"timeout": 2}
+    assert stats["checkouts"] == 0
+    assert stats["pools_cleared"] == 1
+    assert stats["wait_histogram_ms"]["+Inf"] == 1
+
+    monitor.reset()
+    assert monitor.stats()["checkout_failures"] == {}
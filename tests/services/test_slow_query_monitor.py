@@ -0,0 +1,134 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, AsyncMock
+from pymongo.errors import OperationFailure
+
+from app.service.slow_query_monitor import SlowQueryMonitor, redact, query_shape, summarize_explain
+
+
+def started(request_id, command, command_name="find"):
+    return SimpleNamespace(connection_id=("h", 1), request_id=request_id, database_name="supplai", command=command, command_name=command_name)
+
+
+def finished(request_id, duration_ms, command_name="find"):
+    return SimpleNamespace(connection_id=("h", 1), request_id=request_id, command_name=command_name, duration_micros=duration_ms * 1000)
+
+
+def test__unit_test__redact():
+    query = {"user_email": "a@b.it", "$or": [{"date": {"$gte": "2024-01-01"}}, {"tags": {"$in": ["x", "y"]}}], "n": "$count"}
+    assert redact(query) == {
+        "user_email": "?",
+        "$or": [{"date": {"$gte": "?"}}, {"tags": {"$in": ["?"]}}],
+        "n": "$count",
+    }
+
+
+def test__unit_test__query_shape_skips_other_fields():
+    command = {"find": "chats", "filter": {"_id": 1}, "limit": 10, "lsid": {"id": 1}}
+    assert query_shape(command) == {"filter": {"_id": "?"}}
+
+
+def test__unit_test__summarize_explain():
+    explain = {
+        "stages": [{"$cursor": {
+            "queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "user_1", "indexBounds": {"user": ["[\"a\", \"a\"]"]}}}},
+            "executionStats": {"nReturned": 3, "totalKeysExamined": 3, "totalDocsExamined": 3, "executionTimeMillis": 120},
+        }}]
+    }
+    summary = summarize_explain(explain)
+    assert summary["winning_plan"] == {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "user_1"}}
+    assert summary["docs_examined"] == 3
+    assert summary["execution_time_ms"] == 120
+
+
+@pytest.mark.asyncio
+async def test__unit_test__slow_query_monitor_queues_only_slow_commands():
+    monitor = SlowQueryMonitor(threshold_ms=100)
+    # Prima di run() le operazioni vengono ignorate
+    monitor.started(started(0, {"find": "chats"}))
+    monitor.succeeded(finished(0, 250))
+    assert monitor._queue is None
+
+    monitor._queue = asyncio.Queue()
+    monitor._loop = asyncio.get_running_loop()
+
+    monitor.started(started(1, {"find": "chats", "filter": {"user": "a"}}))
+    monitor.succeeded(finished(1, 5))
+    monitor.started(started(2, {"find": "chats", "filter": {"user": "b"}}))
+    monitor.succeeded(finished(2, 250))
+    monitor.started(started(3, {"find": "slow_queries", "filter": {}}))
+    monitor.succeeded(finished(3, 250))
+    monitor.started(started(4, {"find": "chats"}))
+    monitor.failed(finished(4, 250))
+    await asyncio.sleep(0)
+
+    assert monitor._commands == {}
+    assert monitor._queue.qsize() == 1
+    operation = monitor._queue.get_nowait()
+    assert operation["collection"] == "chats"
+    assert operation["duration_ms"] == 250
+
+
+@pytest.mark.asyncio
+async def test__unit_test__slow_query_monitor_build_record_explains_once():
+    monitor = SlowQueryMonitor()
+    client = MagicMock()
+    client.get_database.return_value.command = AsyncMock(return_value={
+        "queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}},
+        "executionStats": {"nReturned": 1, "totalDocsExamined": 5000},
+    })
+    operation = {
+        "database": "supplai",
+        "collection": "chats",
+        "command_name": "find",
+        "command": {"find": "chats", "filter": {"user": "a"}, "lsid": {"id": 1}, "$db": "supplai"},
+        "duration_ms": 250,
+    }
+
+    record = await monitor.build_record(client, operation)
+    assert record["shape"] == {"filter": {"user": "?"}}
+    assert record["explain"]["winning_plan"] == {"stage": "COLLSCAN"}
+    client.get_database.return_value.command.assert_awaited_once_with(
+        {"explain": {"find": "chats", "filter": {"user": "a"}}, "verbosity": "executionStats"}
+    )
+
+    # La stessa forma di query non viene rianalizzata subito
+    record = await monitor.build_record(client, operation)
+    assert record["explain"] is None
+    assert client.get_database.return_value.command.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test__unit_test__slow_query_monitor_build_record_explain_error():
+    monitor = SlowQueryMonitor()
+    client = MagicMock()
+    client.get_database.return_value.command = AsyncMock(side_effect=OperationFailure("explain failed"))
+    operation = {"database": "supplai", "collection": "chats", "command_name": "aggregate", "command": {"aggregate": "chats", "pipeline": []}, "duration_ms": 150}
+
+    record = await monitor.build_record(client, operation)
+    assert record["explain"] is None
+    assert record["explain_error"] == "explain failed"
+
+
+@pytest.mark.asyncio
+async def test__unit_test__slow_query_monitor_run():
+    monitor = SlowQueryMonitor()
+    database = MagicMock()
+    database.create_collection = AsyncMock()
+    database.get_collection.return_value.insert_one = AsyncMock()
+
+    task = asyncio.create_task(monitor.run(database))
+    await asyncio.sleep(0)
+    assert monitor._loop is not None
+    monitor._enqueue({"database": "supplai", "collection": "chats", "command_name": "insert", "command": {"insert": "chats"}, "duration_ms": 300})
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    database.create_collection.assert_awaited_once()
+    record = database.get_collection.return_value.insert_one.await_args.args[0]
+    assert record["command"] == "insert"
+    assert record["explain"] is None
+    assert monitor._loop is None
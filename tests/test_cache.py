@@ -0,0 +1,22 @@
+from app.cache import VersionedCache, caches
+
+
+def test__unit_test__versioned_cache():
+    cache = VersionedCache("test", ttl=60)
+    assert caches["test"] is cache
+    assert cache.get() is None
+
+    cache.set("value", cache.version)
+    assert cache.get() == "value"
+
+    version = cache.version
+    cache.bump()
+    cache.set("stale", version)
+    assert cache.get() is None
+    assert cache.stats() == {"version": 1, "entries": 0, "hits": 1, "misses": 2}
+
+
+def test__unit_test__versioned_cache_ttl():
+    cache = VersionedCache("test_ttl", ttl=0)
+    cache.set("value", cache.version)
+    assert cache.get() is None
@@ -3,7 +3,7 @@ import pytest
 from unittest.mock import MagicMock, AsyncMock, patch
 
 
-from app.database import get_db, init_db
+from app.database import get_db, init_db, get_available_compressors, get_client_options, prewarm_pool
 
 @pytest.mark.asyncio
 async def test__unit_test__get_database_error():
@@ -18,3 +18,28 @@ async def test__unit_test__get_database():
     assert db == mock_db
 
 
+
+
+def test__unit_test__get_available_compressors_skips_missing_libraries():
+    with patch("app.database.importlib.util.find_spec", side_effect=lambda name: None if name == "snappy" else object()):
+        assert get_available_compressors("zstd, snappy,zlib,lz4") == ["zstd", "zlib"]
+
+def test__unit_test__get_client_options():
+    listener = MagicMock()
+    with patch("app.database.get_available_compressors", return_value=["zlib"]):
+        options = get_client_options([listener])
+    assert options["maxPoolSize"] > options["minPoolSize"]
+    assert options["event_listeners"] == [listener]
+    assert options["compressors"] == "zlib"
+
+def test__unit_test__get_client_options_without_compressors():
+    with patch("app.database.get_available_compressors", return_value=[]):
+        assert "compressors" not in get_client_options()
+
+@pytest.mark.asyncio
+async def test__unit_test__prewarm_pool():
+    client = MagicMock()
+    client.admin.command = AsyncMock(return_value={"ok": 1})
+    await prewarm_pool(client, connections=5)
+    assert client.admin.command.await_count == 5
+    client.admin.command.assert_awaited_with("ping")
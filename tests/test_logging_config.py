@@ -0,0 +1,115 @@
+import io
+import json
+import logging
+import sys
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.logging_config import (
+    JsonFormatter,
+    LogQueueHandler,
+    RequestIdFilter,
+    RequestIdMiddleware,
+    parse_log_levels,
+    request_id_var,
+    setup_logging,
+    shutdown_logging,
+)
+
+
+def make_record(message, *args, exc_info=None):
+    return logging.LogRecord("app.test", logging.ERROR, __file__, 1, message, args, exc_info)
+
+
+def test__unit_test__parse_log_levels():
+    assert parse_log_levels("app.routes=debug, pymongo=WARNING,invalid,=INFO") == {
+        "app.routes": "DEBUG",
+        "pymongo": "WARNING",
+    }
+
+
+def test__unit_test__json_formatter_with_request_id():
+    record = make_record("Error deleting FAQ: %s", "boom")
+    token = request_id_var.set("abc123")
+    try:
+        RequestIdFilter().filter(record)
+    finally:
+        request_id_var.reset(token)
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "Error deleting FAQ: boom"
+    assert entry["level"] == "ERROR"
+    assert entry["logger"] == "app.test"
+    assert entry["request_id"] == "abc123"
+
+
+def test__unit_test__log_queue_handler_keeps_exception():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = make_record("failed %s", 1, exc_info=sys.exc_info())
+
+    prepared = LogQueueHandler(None).prepare(record)
+    assert prepared.msg == "failed 1"
+    assert prepared.args is None
+    assert prepared.exc_info is None
+
+    entry = json.loads(JsonFormatter().format(prepared))
+    assert "ValueError: boom" in entry["exception"]
+    assert "request_id" not in entry
+
+
+def test__unit_test__setup_logging():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    stream = io.StringIO()
+    listener = setup_logging(stream)
+    try:
+        logging.getLogger("app.test").warning("hello %s", "world")
+    finally:
+        listener.stop()
+        root.handlers[:] = handlers
+        root.setLevel(level)
+
+    entry = json.loads(stream.getvalue().splitlines()[-1])
+    assert entry["message"] == "hello world"
+    assert entry["level"] == "WARNING"
+
+
+def test__unit_test__shutdown_logging_twice():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    stream = io.StringIO()
+    try:
+        listener = setup_logging(stream)
+        logging.getLogger("app.test").warning("before shutdown")
+        shutdown_logging(listener)
+        # Un secondo spegnimento (es. un altro lifespan nello stesso processo) non fallisce
+        shutdown_logging(listener)
+
+        assert not any(isinstance(handler, LogQueueHandler) for handler in root.handlers)
+        assert json.loads(stream.getvalue().splitlines()[-1])["message"] == "before shutdown"
+    finally:
+        root.handlers[:] = handlers
+        root.setLevel(level)
+
+
+def test__unit_test__request_id_middleware():
+    app = FastAPI()
+    app.add_middleware(RequestIdMiddleware)
+
+    @app.get("/request-id")
+    def get_request_id():
+        return {"request_id": request_id_var.get()}
+
+    client = TestClient(app)
+    response = client.get("/request-id", headers={"X-Request-ID": "client-id-1"})
+    assert response.headers["X-Request-ID"] == "client-id-1"
+    assert response.json() == {"request_id": "client-id-1"}
+
+    # Un id non valido viene sostituito
+    response = client.get("/request-id", headers={"X-Request-ID": "bad id\n"})
+    assert response.headers["X-Request-ID"] != "bad id\n"
+    assert response.json()["request_id"] == response.headers["X-Request-ID"]
+    assert request_id_var.get() is None
@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app.cache import VersionedCache, caches
+from app.metrics import CommandMetrics, MetricsMiddleware, StatsCollector
+from app.routes.monitoring import get_metrics, verify_metrics_access
+
+
+def _sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test__unit_test__metrics_middleware_uses_route_template():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/test-metrics/{item_id}")
+    def get_item(item_id: str):
+        return {"id": item_id}
+
+    labels = {"method": "GET", "route": "/test-metrics/{item_id}", "status": "200"}
+    before = _sample("http_request_duration_seconds_count", labels)
+    unmatched = {"method": "GET", "route": "unmatched", "status": "404"}
+    before_unmatched = _sample("http_request_duration_seconds_count", unmatched)
+
+    client = TestClient(app)
+    assert client.get("/test-metrics/1").status_code == 200
+    assert client.get("/test-metrics/2").status_code == 200
+    assert client.get("/missing-route").status_code == 404
+
+    assert _sample("http_request_duration_seconds_count", labels) == before + 2
+    assert _sample("http_request_duration_seconds_count", unmatched) == before_unmatched + 1
+    assert _sample("http_requests_in_progress", {"method": "GET"}) == 0
+
+
+def test__unit_test__command_metrics():
+    listener = CommandMetrics()
+    labels = {"collection": "test_metrics", "command": "find"}
+    before = _sample("mongo_command_duration_seconds_count", labels)
+
+    listener.started(SimpleNamespace(command={"find": "test_metrics"}, command_name="find", connection_id=("h", 1), request_id=1))
+    listener.started(SimpleNamespace(command={"getMore": 5, "collection": "test_metrics"}, command_name="getMore", connection_id=("h", 2), request_id=2))
+    listener.succeeded(SimpleNamespace(command_name="find", connection_id=("h", 1), request_id=1, duration_micros=1500))
+    listener.failed(SimpleNamespace(command_name="getMore", connection_id=("h", 2), request_id=2, duration_micros=10))
+
+    assert _sample("mongo_command_duration_seconds_count", labels) == before + 1
+    assert _sample("mongo_command_failures_total", {"collection": "test_metrics", "command": "getMore"}) >= 1
+    assert listener._collections == {}
+
+
+def test__unit_test__stats_collector():
+    cache = VersionedCache("test_metrics")
+    cache.set("value", cache.version)
+    cache.get()
+    cache.get("missing")
+
+    try:
+        metrics = {metric.name: metric for metric in StatsCollector().collect()}
+    finally:
+        caches.pop("test_metrics")
+    ratio = {s.labels["cache"]: s.value for s in metrics["cache_hit_ratio"].samples}
+    assert ratio["test_metrics"] == 0.5
+    assert "mongo_pool_wait_seconds" in metrics
+    assert metrics["mongo_pool_wait_seconds"].samples[-1].name == "mongo_pool_wait_seconds_sum"
+
+
+def test__unit_test__get_metrics():
+    response = get_metrics(current_user={"sub": "admin"})
+    assert response.media_type.startswith("text/plain")
+    assert b"cache_hit_ratio" in response.body
+
+
+def test__unit_test__verify_metrics_access_token(monkeypatch):
+    monkeypatch.setattr("app.routes.monitoring.METRICS_TOKEN", "scrape-token")
+
+    def fail_admin(token):
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    monkeypatch.setattr("app.routes.monitoring.verify_admin", fail_admin)
+
+    assert verify_metrics_access("scrape-token") is None
+    with pytest.raises(HTTPException) as exc_info:
+        verify_metrics_access("wrong-token")
+    assert exc_info.value.status_code == 401
+
+
+def test__unit_test__verify_metrics_access_admin(monkeypatch):
+    monkeypatch.setattr("app.routes.monitoring.METRICS_TOKEN", "")
+    monkeypatch.setattr("app.routes.monitoring.verify_admin", lambda token: {"sub": "admin"})
+
+    assert verify_metrics_access("admin-jwt") == {"sub": "admin"}
@@ -0,0 +1,152 @@
+import json
+from datetime import datetime, timezone
+from typing import List
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+import app.schemas as schemas
+from app.responses import FastJSONResponse, TrustedSerializer, dumps
+
+
+def test__unit_test__dumps_native_types():
+    object_id = ObjectId()
+    content = {
+        "_id": object_id,
+        "timestamp": datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc),
+        "tags": {"a"},
+        1: "numeric key",
+    }
+    assert json.loads(dumps(content)) == {
+        "_id": str(object_id),
+        "timestamp": "2024-05-01T12:30:00Z",
+        "tags": ["a"],
+        "1": "numeric key",
+    }
+
+
+def test__unit_test__dumps_unsupported_type():
+    with pytest.raises(TypeError):
+        dumps({"value": object()})
+
+
+def test__unit_test__fast_json_response_render():
+    response = FastJSONResponse({"id": ObjectId("507f1f77bcf86cd799439011")})
+    assert response.body == b'{"id":"507f1f77bcf86cd799439011"}'
+    assert response.media_type == "application/json"
+
+
+def test__unit_test__fast_json_response_as_default_class():
+    app = FastAPI(default_response_class=FastJSONResponse)
+    message_id = ObjectId()
+
+    @app.get("/messages", response_model=schemas.ChatMessages)
+    def get_messages():
+        return {
+            "name": "chat",
+            "messages": [{"_id": message_id, "sender": "USER", "content": "ciao", "timestamp": "2024-05-01T12:30:00", "rating": None}],
+        }
+
+    response = TestClient(app).get("/messages")
+    assert response.status_code == 200
+    assert response.json()["messages"][0]["_id"] == str(message_id)
+
+
+@pytest.fixture
+def fast_path(monkeypatch):
+    monkeypatch.setattr("app.responses.STRICT_RESPONSE_VALIDATION", False)
+
+
+def test__unit_test__trusted_serializer_matches_validated_output(fast_path, monkeypatch):
+    serializer = TrustedSerializer(List[schemas.User])
+    users = [
+        {"_id": "a@b.it", "name": "A", "hashed_password": "h", "internal": 1},
+        {"_id": "c@d.it", "name": "C", "hashed_password": "h", "scopes": ["admin"],
+         "last_active": datetime(2024, 5, 1, tzinfo=timezone.utc)},
+    ]
+
+    fast = json.loads(serializer.dump_json(users))
+    monkeypatch.setattr("app.responses.STRICT_RESPONSE_VALIDATION", True)
+    strict = json.loads(serializer.dump_json(users))
+
+    assert fast == strict
+    assert fast[0]["scopes"] == ["user"]
+    assert "internal" not in fast[0]
+    # I dict del repository non vengono modificati
+    assert "scopes" not in users[0]
+
+
+def test__unit_test__trusted_serializer_nested_models(fast_path):
+    serializer = TrustedSerializer(schemas.ChatMessages)
+    message_id = ObjectId()
+    chat = {
+        "name": "chat",
+        "messages": [{"_id": message_id, "sender": "USER", "content": "ciao", "timestamp": "t", "rating": True, "extra": 1}],
+    }
+
+    result = json.loads(serializer.dump_json(chat))
+
+    assert result["messages"] == [{"_id": str(message_id), "sender": "USER", "content": "ciao", "timestamp": "t", "rating": True}]
+
+
+def test__unit_test__trusted_serializer_strict_mode_validates(monkeypatch):
+    monkeypatch.setattr("app.responses.STRICT_RESPONSE_VALIDATION", True)
+    serializer = TrustedSerializer(List[schemas.FAQResponse])
+    with pytest.raises(ValidationError):
+        serializer.dump_json([{"_id": ObjectId(), "title": "t"}])
+
+
+def test__unit_test__trusted_serializer_response(fast_path):
+    response = TrustedSerializer(List[schemas.FAQResponse]).response([], headers={"ETag": '"1"'})
+    assert response.body == b"[]"
+    assert response.media_type == "application/json"
+    assert response.headers["ETag"] == '"1"'
+
+
+def repository_documents():
+    # Documenti come li restituiscono i repository: ObjectId, datetime (naive come da Motor), campi interni e opzionali mancanti
+    return {
+        List[schemas.DocumentResponse]: [
+            {
+                "_id": ObjectId(), "title": "a", "file_path": "/a.pdf", "owner_email": "a@b.it",
+                "uploaded_at": "2025-05-02T10:00:00+02:00", "file_id": ObjectId(), "sha256": "ab" * 32,
+                "size": 1024, "content_type": "application/pdf", "ingestion_state": "processing",
+                "ingestion_attempts": 1, "lease_owner": "worker-1", "lease_expires_at": datetime(2025, 5, 2, 10, 5),
+                "sync_seq": 12, "created_seq": 3,
+            },
+            {
+                "_id": ObjectId(), "title": "b", "file_path": "/b.pdf", "owner_email": "a@b.it",
+                "uploaded_at": "2025-05-01T10:00:00+02:00", "lease_expires_at": datetime(2025, 5, 1, tzinfo=timezone.utc),
+            },
+        ],
+        List[schemas.User]: [
+            {"_id": "a@b.it", "name": "A", "hashed_password": "h", "name_normalized": "a", "last_login": datetime(2025, 1, 1)},
+            {"_id": "c@d.it", "name": "C", "hashed_password": "h", "is_initialized": True, "scopes": ["admin", "user"]},
+        ],
+        List[schemas.FAQResponse]: [
+            {"_id": ObjectId(), "title": "t", "question": "q", "answer": "a", "created_at": "c", "updated_at": "u",
+             "created_seq": 1, "sync_seq": 2},
+        ],
+        schemas.ChatMessages: {
+            "name": "chat",
+            "messages": [
+                {"_id": ObjectId(), "sender": "USER", "content": "ciao", "timestamp": "t", "rating": None},
+                {"_id": ObjectId(), "sender": "BOT", "content": "ciao!", "timestamp": "t", "rating": False, "sources": []},
+            ],
+        },
+    }
+
+
+@pytest.mark.parametrize("annotation", list(repository_documents()), ids=str)
+def test__unit_test__trusted_serializer_fast_equals_strict(annotation, monkeypatch):
+    data = repository_documents()[annotation]
+    serializer = TrustedSerializer(annotation)
+
+    fast = json.loads(serializer.dump_json(data))
+    monkeypatch.setattr("app.responses.STRICT_RESPONSE_VALIDATION", True)
+    strict = json.loads(serializer.dump_json(data))
+
+    assert fast == strict
@@ -0,0 +1,109 @@
+import time
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from bson import ObjectId
+
+import app.snapshot as snapshot_module
+from app.cache import VersionedCache
+from app.snapshot import ConfigSnapshot, publish_snapshot
+
+
+@pytest.fixture
+def snapshot(tmp_path, monkeypatch):
+    # Ogni lettura controlla il file
+    monkeypatch.setattr(snapshot_module, "CONFIG_SNAPSHOT_CHECK_INTERVAL_SECONDS", 0)
+    cache = VersionedCache("snapshot_test")
+    return ConfigSnapshot(str(tmp_path / "config.snapshot"), caches=(cache,)), cache
+
+
+def test__unit_test__snapshot_disabled():
+    assert ConfigSnapshot("", caches=()).read() is None
+
+
+def test__unit_test__snapshot_roundtrip(snapshot):
+    config, cache = snapshot
+    assert config.read() is None
+
+    faq_id = ObjectId()
+    version = time.time_ns()
+    assert config.write({"faqs": [{"_id": faq_id}]}, version=version)
+
+    assert config.read() == {"faqs": [{"_id": faq_id}]}
+    assert config.version == version
+
+
+def test__unit_test__snapshot_change_invalidates_caches(snapshot):
+    config, cache = snapshot
+    config.write({"settings": {"message_history": 1}}, version=time.time_ns())
+    cache.set("value", cache.version)
+    assert cache.get() is None  # la prima lettura della snapshot invalida la cache
+    cache.set("value", cache.version)
+    assert cache.get() == "value"
+
+    # La ripubblicazione periodica degli stessi dati non invalida le cache
+    ConfigSnapshot(config.path, caches=()).write({"settings": {"message_history": 1}}, version=time.time_ns())
+    assert cache.get() == "value"
+
+    # Un altro worker pubblica dati nuovi
+    ConfigSnapshot(config.path, caches=()).write({"settings": {"message_history": 2}}, version=time.time_ns())
+
+    assert cache.get() is None
+    assert config.read()["settings"]["message_history"] == 2
+
+
+def test__unit_test__snapshot_does_not_overwrite_newer(snapshot):
+    config, _ = snapshot
+    version = time.time_ns()
+    config.write({"v": 2}, version=version)
+
+    assert not config.write({"v": 1}, version=version - 1)
+    assert config.read() == {"v": 2}
+
+
+def test__unit_test__snapshot_max_age(snapshot):
+    config, _ = snapshot
+    config.write({"v": 1}, version=time.time_ns() - int((config.max_age + 1) * 1e9))
+
+    # Troppo vecchia: i dati vanno letti da MongoDB
+    assert config.read() is None
+
+
+def test__unit_test__snapshot_stat_throttled(snapshot, monkeypatch):
+    config, _ = snapshot
+    config.write({"v": 1}, version=time.time_ns())
+    assert config.read() == {"v": 1}
+
+    monkeypatch.setattr(snapshot_module, "CONFIG_SNAPSHOT_CHECK_INTERVAL_SECONDS", 60)
+    config.read()
+    stat = MagicMock(side_effect=AssertionError("stat non atteso"))
+    monkeypatch.setattr(snapshot_module.os, "stat", stat)
+
+    assert config.read() == {"v": 1}
+
+
+@pytest.mark.asyncio
+async def test__unit_test__publish_snapshot(tmp_path, monkeypatch):
+    config = ConfigSnapshot(str(tmp_path / "config.snapshot"), caches=())
+    monkeypatch.setattr(snapshot_module, "config_snapshot", config)
+    database = MagicMock()
+    database.get_collection.return_value.find_one = AsyncMock(return_value={"_id": "main"})
+    database.get_collection.return_value.find.return_value.to_list = AsyncMock(return_value=[])
+
+    await publish_snapshot(database)
+
+    assert config.read() == {"settings": {"_id": "main"}, "faqs": []}
+
+
+@pytest.mark.asyncio
+async def test__unit_test__publish_snapshot_failure_discards_stale(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot_module, "CONFIG_SNAPSHOT_CHECK_INTERVAL_SECONDS", 0)
+    config = ConfigSnapshot(str(tmp_path / "config.snapshot"), caches=())
+    monkeypatch.setattr(snapshot_module, "config_snapshot", config)
+    config.write({"faqs": []}, version=time.time_ns())
+    database = MagicMock()
+    database.get_collection.return_value.find_one = AsyncMock(side_effect=Exception("MongoDB down"))
+
+    await publish_snapshot(database)
+
+    # La snapshot precedente non contiene la modifica appena fatta: i worker tornano a leggere da MongoDB
+    assert config.read() is None
@@ -1,6 +1,6 @@
 import pytest
 
-from app.utils import get_password_hash, verify_password, get_uuid3, get_object_id, get_timezone
+from app.utils import get_password_hash, verify_password, get_uuid3, get_object_id, get_timezone, normalize_name, parse_byte_range, make_etag, etag_matches
 
 def test__unit_test__get_password_hash():
     password = "test_password"
@@ -28,4 +28,30 @@ def test__unit_test__get_object_id():
 
 def test__unit_test__get_timezone():
     expected_timezone = "Europe/Rome"
-    assert get_timezone().zone == expected_timezone
\ No newline at end of file
+    assert get_timezone().zone == expected_timezone
+
+def test__unit_test__normalize_name():
+    assert normalize_name("  Niccolò  De Rossi ") == ["niccolo de rossi", "de rossi", "rossi"]
+    assert normalize_name("") == []
+
+def test__unit_test__parse_byte_range():
+    assert parse_byte_range(None, 1000) is None
+    assert parse_byte_range("bytes=0-499", 1000) == (0, 499)
+    assert parse_byte_range("bytes=500-", 1000) == (500, 999)
+    assert parse_byte_range("bytes=-100", 1000) == (900, 999)
+    assert parse_byte_range("bytes=900-5000", 1000) == (900, 999)
+    assert parse_byte_range("bytes=0-1,5-6", 1000) is None
+    assert parse_byte_range("items=0-1", 1000) is None
+    with pytest.raises(ValueError):
+        parse_byte_range("bytes=1000-", 1000)
+
+
+def test__unit_test__etag():
+    etag = make_etag(b"body")
+    assert etag == make_etag("body")
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('"other"', etag)